@@ -7,7 +7,6 @@ Streamlined UI for product image processing with approval pipeline
 from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for
 import os
 import json
-import asyncio
 import logging
 from pathlib import Path
 from datetime import datetime
@@ -233,25 +232,22 @@ def start_processing():
                     res = {
                         'success': 0, 'failed': 0, 'skipped': 0, 'errors': [], 'validated': 0
                     }
-                    for idx, prod in enumerate(products_list):
-                        try:
-                            if cb:
-                                cb(idx + 1, len(products_list), f"Processing {prod.get('Variant_SKU','Unknown')}")
-                            r = await processor.search_product_image(prod, force_web=force_web)
-                            if r and r.get('success'):
-                                res['success'] += 1
-                            else:
+                    # One keep-alive HTTP session for the whole run
+                    async with processor:
+                        for idx, prod in enumerate(products_list):
+                            try:
+                                if cb:
+                                    cb(idx + 1, len(products_list), f"Processing {prod.get('Variant_SKU','Unknown')}")
+                                r = await processor.search_product_image(prod, force_web=force_web)
+                                if r and r.get('success'):
+                                    res['success'] += 1
+                                else:
+                                    res['failed'] += 1
+                            except Exception as e:
                                 res['failed'] += 1
-                        except Exception as e:
-                            res['failed'] += 1
-                            res['errors'].append(str(e))
+                                res['errors'].append(str(e))
                     return res
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    return loop.run_until_complete(_runner())
-                finally:
-                    loop.close()
+                return processor.run(_runner())
 
             results = _process_with_force(products, progress_callback) if force_web else processor.process_batch(products, progress_callback)
             
@@ -379,25 +375,22 @@ def process_all_images():
                     def _process_with_force(products_list, cb):
                         async def _runner():
                             res = {'success': 0, 'failed': 0, 'skipped': 0, 'errors': [], 'validated': 0}
-                            for idx, prod in enumerate(products_list):
-                                try:
-                                    if cb:
-                                        cb(idx + 1, len(products_list), f"Processing {prod.get('Variant_SKU','Unknown')}")
-                                    r = await processor.search_product_image(prod, force_web=True)
-                                    if r and r.get('success'):
-                                        res['success'] += 1
-                                    else:
+                            # One keep-alive HTTP session for the whole run
+                            async with processor:
+                                for idx, prod in enumerate(products_list):
+                                    try:
+                                        if cb:
+                                            cb(idx + 1, len(products_list), f"Processing {prod.get('Variant_SKU','Unknown')}")
+                                        r = await processor.search_product_image(prod, force_web=True)
+                                        if r and r.get('success'):
+                                            res['success'] += 1
+                                        else:
+                                            res['failed'] += 1
+                                    except Exception as e:
                                         res['failed'] += 1
-                                except Exception as e:
-                                    res['failed'] += 1
-                                    res['errors'].append(str(e))
+                                        res['errors'].append(str(e))
                             return res
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                        try:
-                            return loop.run_until_complete(_runner())
-                        finally:
-                            loop.close()
+                        return processor.run(_runner())
                     results = _process_with_force(products, progress_callback)
                 else:
                     results = processor.process_batch(products, progress_callback)
@@ -498,7 +491,11 @@ def review_page():
     """Review pending images"""
     
     # Get products needing review
-    pending = db.get_products_for_review('pending', 50)
+    pending = db.get_products_for_review('pending', 50, columns=[
+        'Variant_SKU', 'Title', 'Brand', 'Variant_Barcode', 'downloaded_image_path',
+        'image_status', 'confidence', 'scraped_description', 'search_query',
+        'image_source', 'processed_date'
+    ], as_list=True)
     
     # Add image URLs for display
     for product in pending:
@@ -834,6 +831,8 @@ def handle_config():
         
         # Reload
         config = load_config()
+        # The old processor finishes any running batch before releasing its connections
+        threading.Thread(target=processor.close, daemon=True).start()
         processor = IntelligentImageProcessor(config, db)
         
         return jsonify({'success': True, 'message': 'Configuration updated'})
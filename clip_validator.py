@@ -4,14 +4,19 @@ Modular component for validating product images against their descriptions
 Uses OpenAI's CLIP model for semantic matching
 """
 
+import os
+import re
 import torch
+import torch.nn.functional as F
 import clip
 from PIL import Image
 import numpy as np
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 import json
+import orjson
 from datetime import datetime
 import sqlite3
 import easyocr
@@ -19,6 +24,8 @@ import cv2
 
 logger = logging.getLogger(__name__)
 
+_SIZE_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(g|kg|ml|l|L)')
+
 class CLIPValidator:
     """Semantic image validation using CLIP model"""
     
@@ -49,6 +56,7 @@ class CLIPValidator:
         try:
             model_name = (self.config or {}).get('model', 'ViT-B/32')
             self.model, self.preprocess = clip.load(model_name, device=self.device)
+            self.input_resolution = getattr(self.model.visual, 'input_resolution', 224)
             logger.info("CLIP model loaded successfully")
         except Exception as e:
             logger.error(f"Failed to load CLIP model: {str(e)}")
@@ -74,38 +82,92 @@ class CLIPValidator:
         # Cache for processed embeddings
         self.embedding_cache = {}
         self.validation_log = []
+        
+        # Image decode + preprocess runs here in parallel (Pillow releases the GIL while decoding)
+        self._decode_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1),
+                                               thread_name_prefix='clip-decode')
+    
+    def _load_image_tensor(self, image_path: str) -> Optional[torch.Tensor]:
+        """Decode and preprocess one image file into a (3, H, W) CPU tensor; None if unreadable"""
+        try:
+            with Image.open(image_path) as image:
+                # JPEGs decode directly at >= model resolution (DCT scaling) instead of full size
+                image.draft('RGB', (self.input_resolution, self.input_resolution))
+                return self.preprocess(image.convert('RGB'))
+        except Exception:
+            return None
+    
+    def _encode_images(self, tensors: List[torch.Tensor]) -> torch.Tensor:
+        """Normalized image embeddings [N, D] from one pinned host->device copy and forward pass"""
+        image_input = torch.stack(tensors)
+        if self.device.type == 'cuda':
+            image_input = image_input.pin_memory().to(self.device, non_blocking=True)
+        else:
+            image_input = image_input.to(self.device)
+        with torch.inference_mode():
+            return F.normalize(self.model.encode_image(image_input), dim=-1)
+    
+    def _encode_image_files(self, image_paths: List[str]) -> List[Optional[torch.Tensor]]:
+        """Embeddings ([1, D] each) for several image files: parallel decode, one batched encode.
+        Entries that could not be decoded or encoded are None.
+        """
+        tensors = list(self._decode_pool.map(self._load_image_tensor, image_paths))
+        decoded = [i for i, t in enumerate(tensors) if t is not None]
+        features: List[Optional[torch.Tensor]] = [None] * len(image_paths)
+        if not decoded:
+            return features
+        try:
+            encoded = self._encode_images([tensors[i] for i in decoded])
+        except Exception as e:
+            logger.warning(f"Batched CLIP encode failed, falling back to per-image: {str(e)}")
+            return features
+        for row, i in enumerate(decoded):
+            features[i] = encoded[row:row + 1]
+        return features
     
-    def validate_image(self, image_path: str, product: Dict) -> Dict:
+    def _encode_text_lists(self, description_lists: List[List[str]]) -> List[torch.Tensor]:
+        """Normalized text embeddings for several products' prompts from one forward pass,
+        sliced back per product ([N_i, D] each)"""
+        flat = [d for descriptions in description_lists for d in descriptions]
+        text_tokens = clip.tokenize(flat, truncate=True).to(self.device)
+        with torch.inference_mode():
+            text_features = F.normalize(self.model.encode_text(text_tokens), dim=-1)
+        sliced, start = [], 0
+        for descriptions in description_lists:
+            sliced.append(text_features[start:start + len(descriptions)])
+            start += len(descriptions)
+        return sliced
+    
+    def validate_image(self, image_path: str, product: Dict,
+                       image_features: Optional[torch.Tensor] = None,
+                       text_features: Optional[torch.Tensor] = None) -> Dict:
         """
         Validate a single image against product description with OCR and quality checks
         
         Args:
             image_path: Path to image file
             product: Product dictionary with metadata
+            image_features: Precomputed normalized image embedding [1, D] (validate_batch)
+            text_features: Precomputed normalized embeddings of the product's descriptions (validate_batch)
             
         Returns:
             Validation result dictionary
         """
         try:
             # Load and preprocess image
-            image = Image.open(image_path)
-            image_tensor = self.preprocess(image).unsqueeze(0).to(self.device)
+            if image_features is None:
+                image_tensor = self._load_image_tensor(image_path)
+                if image_tensor is None:
+                    raise ValueError("cannot decode image")
+                image_features = self._encode_images([image_tensor])
             
             # Create text descriptions for the product
             text_descriptions = self._create_product_descriptions(product)
             
-            # Tokenize text
-            text_tokens = clip.tokenize(text_descriptions, truncate=True).to(self.device)
-            
             # Calculate features
-            with torch.no_grad():
-                image_features = self.model.encode_image(image_tensor)
-                text_features = self.model.encode_text(text_tokens)
-                
-                # Normalize features
-                image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-                text_features = text_features / text_features.norm(dim=-1, keepdim=True)
-                
+            if text_features is None:
+                text_features = self._encode_text_lists([text_descriptions])[0]
+            with torch.inference_mode():
                 # Calculate cosine similarities in [0..1]
                 logits = image_features @ text_features.T
                 # Map to [0..1] range from cosine [-1..1]
@@ -184,8 +246,7 @@ class CLIPValidator:
             descriptions.append(f"A {tier1} product: {title}")
         
         # Size specific
-        import re
-        size_match = re.search(r'(\d+(?:\.\d+)?)\s*(g|kg|ml|l|L)', title)
+        size_match = _SIZE_RE.search(title)
         if size_match:
             size = size_match.group(0)
             descriptions.append(f"A {size} package of {brand} {variant or title}")
@@ -263,6 +324,11 @@ class CLIPValidator:
             'details': []
         }
         
+        # Images and prompts are encoded a chunk at a time; OCR and quality checks stay per image
+        chunk_size = max(1, int(self.config.get('batch_size', 16)))
+        features: Dict[int, Optional[torch.Tensor]] = {}
+        text_features: Dict[int, torch.Tensor] = {}
+        
         for i, product in enumerate(products):
             if progress_callback:
                 progress_callback(i, len(products), f"Validating {product.get('Variant_SKU')}")
@@ -276,8 +342,21 @@ class CLIPValidator:
                 })
                 continue
             
+            if i not in features:
+                chunk = [j for j in range(i, min(i + chunk_size, len(products)))
+                         if products[j].get('downloaded_image_path')
+                         and Path(products[j]['downloaded_image_path']).exists()]
+                features = dict(zip(chunk, self._encode_image_files(
+                    [products[j]['downloaded_image_path'] for j in chunk])))
+                try:
+                    text_features = dict(zip(chunk, self._encode_text_lists(
+                        [self._create_product_descriptions(products[j]) for j in chunk])))
+                except Exception as e:
+                    logger.warning(f"Batched text encode failed, falling back to per-image: {str(e)}")
+                    text_features = {}
+            
             # Validate image
-            validation = self.validate_image(image_path, product)
+            validation = self.validate_image(image_path, product, features.get(i), text_features.get(i))
             
             # Update counts
             results['validated'] += 1
@@ -523,10 +602,12 @@ class CLIPValidator:
         return summary
     
     def save_validation_log(self, filepath: str = "validation_log.json"):
-        """Save validation log to file"""
+        """Save validation log to file (compact JSON, swapped in atomically so readers never see half a file)"""
         try:
-            with open(filepath, 'w') as f:
-                json.dump(self.validation_log, f, indent=2)
+            path = Path(filepath)
+            tmp = path.with_name(path.name + '.tmp')
+            tmp.write_bytes(orjson.dumps(self.validation_log, option=orjson.OPT_SERIALIZE_NUMPY))
+            os.replace(tmp, path)
             logger.info(f"Validation log saved to {filepath}")
         except Exception as e:
             logger.error(f"Failed to save validation log: {str(e)}")
@@ -3,26 +3,162 @@ Database module for NWK Image Management System
 Handles all data persistence with full Excel column mirroring
 """
 
+import atexit
 import sqlite3
-import json
 import os
 import logging
+import threading
+import weakref
+import time
+from collections import Counter
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+import orjson
 import pandas as pd
 from pathlib import Path
 
 # Initialize logger
 logger = logging.getLogger(__name__)
 
+# Every column of the products table - used to whitelist caller-supplied column lists
+PRODUCT_COLUMNS = (
+    'Handle', 'Title', 'Body', 'Brand', 'Variant_Title', 'Variant_option',
+    'Variant_SKU', 'Weight_in_grams', 'Variant_Barcode', 'Image_link',
+    'Variant_Image', 'Sorting', 'Vendor', 'VendorName', 'Supplier_SKU',
+    'Tier_1', 'Tier_2', 'Tier_3', 'downloaded_image_path', 'image_status',
+    'confidence', 'source_retailer', 'scraped_description', 'search_query',
+    'image_source', 'processed_date', 'approved_date', 'batch_id',
+    'search_count', 'last_search_date'
+)
+
+# Columns most single-product lookups need (status changes, feedback)
+MIN_PRODUCT_COLUMNS = (
+    'Variant_SKU', 'Brand', 'Title', 'Variant_Barcode', 'downloaded_image_path',
+    'image_status', 'confidence', 'source_retailer', 'batch_id', 'Sorting'
+)
+
+# Columns the image search / CLIP ranking reads from a product
+PROCESSING_COLUMNS = MIN_PRODUCT_COLUMNS + ('Variant_Title', 'Variant_option', 'Tier_1')
+
+# Columns written to Excel exports, in output order
+EXPORT_COLUMNS = (
+    'Handle', 'Title', 'Body', 'Brand', 'Variant_Title', 'Variant_option',
+    'Variant_SKU', 'Weight_in_grams', 'Variant_Barcode', 'Image_link',
+    'Variant_Image', 'Sorting', 'Vendor', 'VendorName', 'Supplier_SKU',
+    'Tier_1', 'Tier_2', 'Tier_3', 'downloaded_image_path', 'confidence',
+    'source_retailer', 'image_status'
+)
+
+# How long get_statistics results are reused (seconds) - the dashboard polls it
+STATS_CACHE_TTL = 5.0
+
+# Search cache entries older than this are ignored (epoch milliseconds)
+SEARCH_CACHE_TTL_MS = 7 * 86400 * 1000
+
+# Shaped SerpAPI results (including empty ones) are reused for this long (epoch milliseconds)
+SERP_CACHE_TTL_MS = 7 * 86400 * 1000
+
+# UPDATE ... RETURNING lets a cache hit read and bump used_count in one statement
+SQLITE_SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Without RETURNING, used_count bumps are buffered and written after this many hits
+CACHE_HIT_FLUSH_EVERY = 100
+
+# learning_feedback rows are buffered and written in batches of this size, or at this interval
+FEEDBACK_FLUSH_SIZE = 100
+FEEDBACK_FLUSH_INTERVAL = 5.0
+
+# Seconds a feedback flush waits for the main connection's write transaction before failing
+FEEDBACK_BUSY_TIMEOUT = 30.0
+
+# Columns returned by get_products_for_review when the caller doesn't ask for more
+REVIEW_COLUMNS = (
+    'Variant_SKU', 'Title', 'Brand', 'downloaded_image_path',
+    'confidence', 'image_status', 'processed_date'
+)
+
+# Shared by update_product_image and the batched update_product_images (see product_image_row)
+UPDATE_PRODUCT_IMAGE_SQL = '''
+    UPDATE products SET 
+        downloaded_image_path = ?,
+        confidence = ?,
+        source_retailer = ?,
+        scraped_description = ?,
+        search_query = ?,
+        image_source = ?,
+        image_status = ?,
+        processed_date = ?,
+        search_count = COALESCE(search_count, 0) + 1,
+        last_search_date = ?
+    WHERE Variant_SKU = ?
+'''
+
+
+def normalize_barcode(value) -> Optional[str]:
+    """Canonical barcode text, or None when missing (None/NaN/'nan'/blank).
+    
+    pandas reads numeric barcode columns as floats, so 6001234567890.0 becomes '6001234567890'.
+    """
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return None
+        if value.is_integer():
+            return str(int(value))
+    text = str(value).strip()
+    if not text or text.lower() in ('nan', 'none'):
+        return None
+    if text.endswith('.0') and text[:-2].isdigit():
+        return text[:-2]
+    return text
+
+
+def search_cache_key(barcode: str, brand: str) -> str:
+    """search_cache primary key for a barcode + brand pair"""
+    return f"{barcode}_{brand}".lower()
+
+
+def _now_ms() -> int:
+    """Current time as integer epoch milliseconds (used for indexed timestamp columns)"""
+    return int(time.time() * 1000)
+
+
+def _close_at_exit(ref: weakref.ref) -> None:
+    """atexit hook closing the object if it is still alive (the weak reference lets it be collected earlier)"""
+    obj = ref()
+    if obj is not None:
+        obj.close()
+
+
 class ImageDatabase:
     def __init__(self, db_path: str = "nwk_images.db"):
         """Initialize database with full Excel schema mirroring"""
         self.db_path = db_path
         self.conn = sqlite3.connect(db_path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        # WAL lets readers (e.g. the CLIP validator's connection) run alongside writes and makes
+        # each commit an append rather than a full journal fsync
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
         self.cursor = self.conn.cursor()
+        self._stats_cache: Optional[Tuple[float, Dict]] = None
+        self._pending_cache_hits: Counter = Counter()
+        # SKU -> significant title words, for the fuzzy local-approved match
+        self._title_words_cache: Dict[str, frozenset] = {}
+        # Feedback rows waiting to be written by the background flusher
+        self._feedback_buf: List[tuple] = []
+        self._feedback_lock = threading.Lock()
+        self._feedback_write_lock = threading.Lock()
+        self._feedback_wakeup = threading.Event()
+        self._feedback_closed = False
+        self._feedback_conn: Optional[sqlite3.Connection] = None
+        self._feedback_thread: Optional[threading.Thread] = None
+        # Bumped on every recorded feedback so consumers know when learning insights are stale
+        self.feedback_version = 0
         self.init_database()
+        # The flusher is a daemon thread, so buffered feedback is written on interpreter exit
+        atexit.register(_close_at_exit, weakref.ref(self))
         
     def init_database(self):
         """Create tables with full Excel column preservation"""
@@ -91,11 +227,33 @@ class ImageDatabase:
                 image_url TEXT,
                 confidence REAL,
                 source TEXT,
-                cached_at TIMESTAMP,
+                cached_at INTEGER, -- epoch milliseconds
                 used_count INTEGER DEFAULT 1
             )
         ''')
         
+        # Downloaded image validators - url -> content hash of the bytes kept on disk, for conditional GETs
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS image_cache (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at INTEGER -- epoch milliseconds
+            )
+        ''')
+        
+        # SerpAPI image results per query, so repeated runs don't pay for the same query again
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS serp_cache (
+                query TEXT NOT NULL,
+                num_results INTEGER NOT NULL,
+                results TEXT NOT NULL, -- JSON list of result dicts
+                fetched_at INTEGER NOT NULL, -- epoch milliseconds
+                PRIMARY KEY (query, num_results)
+            )
+        ''')
+        
         # Learning table - track user decisions for improvement
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS learning_feedback (
@@ -104,7 +262,7 @@ class ImageDatabase:
                 confidence REAL,
                 source TEXT,
                 user_action TEXT, -- 'approved' or 'declined'
-                feedback_date TIMESTAMP,
+                feedback_date INTEGER, -- epoch milliseconds
                 brand TEXT,
                 has_barcode_match BOOLEAN,
                 has_brand_match BOOLEAN,
@@ -112,6 +270,35 @@ class ImageDatabase:
             )
         ''')
         
+        # Migrate legacy ISO-8601 timestamps to epoch milliseconds (they were written as naive local time)
+        self.cursor.execute('''
+            UPDATE search_cache SET cached_at = CAST(strftime('%s', cached_at, 'utc') AS INTEGER) * 1000
+            WHERE typeof(cached_at) = 'text'
+        ''')
+        self.cursor.execute('''
+            UPDATE learning_feedback SET feedback_date = CAST(strftime('%s', feedback_date, 'utc') AS INTEGER) * 1000
+            WHERE typeof(feedback_date) = 'text'
+        ''')
+        
+        # Normalized title kept in sync by SQLite (generated columns are hidden from table_info)
+        columns = {row[1] for row in self.cursor.execute("PRAGMA table_xinfo('products')")}
+        if 'title_norm' not in columns:
+            self.cursor.execute('''
+                ALTER TABLE products 
+                ADD COLUMN title_norm TEXT GENERATED ALWAYS AS (lower(trim(Title))) VIRTUAL
+            ''')
+        
+        # Barcodes are stored normalized (see normalize_barcode) - clean up rows imported before that
+        self.cursor.execute('''
+            UPDATE products SET Variant_Barcode = NULL
+            WHERE Variant_Barcode IS NOT NULL AND LOWER(TRIM(Variant_Barcode)) IN ('', 'nan', 'none')
+        ''')
+        self.cursor.execute('''
+            UPDATE products SET Variant_Barcode = SUBSTR(Variant_Barcode, 1, LENGTH(Variant_Barcode) - 2)
+            WHERE Variant_Barcode LIKE '%.0' AND LENGTH(Variant_Barcode) > 2
+            AND SUBSTR(Variant_Barcode, 1, LENGTH(Variant_Barcode) - 2) NOT GLOB '*[^0-9]*'
+        ''')
+        
         # Create indexes for performance
         self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_barcode ON products(Variant_Barcode)')
         self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_brand ON products(Brand)')
@@ -119,8 +306,55 @@ class ImageDatabase:
         self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch ON products(batch_id)')
         self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_image_path ON products(downloaded_image_path)')
         self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_sorting ON products(Sorting)')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_title_norm ON products(Brand, title_norm)')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_cache_expiry ON search_cache(cached_at)')
         # Composite index for the optimized unprocessed query
         self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_unprocessed ON products(image_status, downloaded_image_path)')
+        # Covers the review query: filter on status, ordered by confidence then recency
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_review ON products(image_status, confidence DESC, processed_date DESC)')
+        # Keep batch counters current incrementally (O(1) per status change) instead of
+        # re-aggregating the whole batch on every approve/decline
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_batch_status_counts
+            AFTER UPDATE OF image_status ON products
+            WHEN OLD.image_status IS NOT NEW.image_status AND NEW.batch_id IS NOT NULL
+            BEGIN
+                UPDATE batches SET 
+                    processed = processed
+                        + (COALESCE(NEW.image_status, 'not_processed') != 'not_processed')
+                        - (COALESCE(OLD.image_status, 'not_processed') != 'not_processed'),
+                    approved = approved + (NEW.image_status IS 'approved') - (OLD.image_status IS 'approved'),
+                    pending = pending + (NEW.image_status IS 'pending') - (OLD.image_status IS 'pending'),
+                    declined = declined + (NEW.image_status IS 'declined') - (OLD.image_status IS 'declined')
+                WHERE id = NEW.batch_id;
+            END
+        ''')
+        # A product moving to another batch (re-import) takes its counts along
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_batch_move_counts
+            AFTER UPDATE OF batch_id ON products
+            WHEN OLD.batch_id IS NOT NEW.batch_id
+            BEGIN
+                UPDATE batches SET 
+                    processed = processed - (COALESCE(OLD.image_status, 'not_processed') != 'not_processed'),
+                    approved = approved - (OLD.image_status IS 'approved'),
+                    pending = pending - (OLD.image_status IS 'pending'),
+                    declined = declined - (OLD.image_status IS 'declined')
+                WHERE id = OLD.batch_id;
+                UPDATE batches SET 
+                    processed = processed + (COALESCE(OLD.image_status, 'not_processed') != 'not_processed'),
+                    approved = approved + (OLD.image_status IS 'approved'),
+                    pending = pending + (OLD.image_status IS 'pending'),
+                    declined = declined + (OLD.image_status IS 'declined')
+                WHERE id = NEW.batch_id;
+            END
+        ''')
+        # Export view: Excel columns in output order, Body prefers the scraped description
+        export_select = ', '.join(
+            "COALESCE(NULLIF(TRIM(scraped_description), ''), Body, '') AS Body" if col == 'Body' else col
+            for col in EXPORT_COLUMNS
+        )
+        self.cursor.execute(f'CREATE VIEW IF NOT EXISTS products_export AS SELECT {export_select} FROM products')
         
         self.conn.commit()
     
@@ -160,7 +394,7 @@ class ImageDatabase:
                         row.get('Handle'), row.get('Title'), row.get('Body'),
                         row.get('Brand'), row.get('Variant Title'), row.get('Variant option'),
                         row.get('Variant SKU / Article Code'), row.get('Weight in grams'),
-                        row.get('Variant Barcode'), row.get('Image link'),
+                        normalize_barcode(row.get('Variant Barcode')), row.get('Image link'),
                         row.get('Variant Image (if required)'), row.get('Sorting'),
                         row.get('Vendor'), row.get('VendorName'), row.get('Supplier SKU'),
                         row.get('Tier 1'), row.get('Tier 2'), row.get('Tier 3'),
@@ -173,6 +407,10 @@ class ImageDatabase:
                         UPDATE products SET batch_id = ? WHERE Variant_SKU = ?
                     ''', (batch_id, row.get('Variant SKU / Article Code')))
             
+            # New titles may have arrived; drop memoized title words
+            self._title_words_cache.clear()
+            
+            # Products moved into this batch brought their counts along (trg_batch_move_counts)
             self.conn.commit()
             return True, batch_id, imported_count
             
@@ -180,14 +418,14 @@ class ImageDatabase:
             self.conn.rollback()
             return False, str(e), 0
     
-    def get_product_by_sku(self, sku: str) -> Optional[Dict]:
-        """Get product by SKU with thread-safe cursor"""
+    def get_product_by_sku(self, sku: str, columns: Tuple[str, ...] = PRODUCT_COLUMNS) -> Optional[Dict]:
+        """Get product by SKU with thread-safe cursor (all stored columns unless narrowed)"""
         # Use a fresh cursor to avoid recursive cursor issues
         cursor = self.conn.cursor()
         cursor.row_factory = sqlite3.Row  # Ensure row factory is set
         try:
             result = cursor.execute(
-                'SELECT * FROM products WHERE Variant_SKU = ?', (sku,)
+                f'SELECT {", ".join(columns)} FROM products WHERE Variant_SKU = ?', (sku,)
             ).fetchone()
             return dict(result) if result else None
         finally:
@@ -196,105 +434,229 @@ class ImageDatabase:
     def check_local_approved(self, brand: str, title: str, barcode: str) -> Optional[str]:
         """Check if we already have an approved image locally"""
         
-        # First check by exact barcode match
-        if barcode:
-            result = self.cursor.execute('''
-                SELECT downloaded_image_path FROM products 
-                WHERE Variant_Barcode = ? AND image_status = 'approved'
-            ''', (barcode,)).fetchone()
-            
-            if result and result['downloaded_image_path']:
-                # Verify file still exists
-                if os.path.exists(result['downloaded_image_path']):
-                    return result['downloaded_image_path']
-        
-        # Check by brand + title match
-        result = self.cursor.execute('''
-            SELECT downloaded_image_path FROM products 
-            WHERE Brand = ? AND Title = ? AND image_status = 'approved'
-        ''', (brand, title)).fetchone()
-        
-        if result and result['downloaded_image_path']:
-            if os.path.exists(result['downloaded_image_path']):
-                return result['downloaded_image_path']
-        
-        # Check fuzzy match on title (same brand, similar title)
-        # This helps with slight variations
-        result = self.cursor.execute('''
-            SELECT downloaded_image_path, Title FROM products 
-            WHERE Brand = ? AND image_status = 'approved'
-        ''', (brand,)).fetchall()
+        title_norm = (title or '').strip().lower()
         
-        for row in result:
-            if row['downloaded_image_path'] and os.path.exists(row['downloaded_image_path']):
-                # Simple similarity check
-                if self._similar_titles(title, row['Title']):
-                    return row['downloaded_image_path']
+        # One round-trip: barcode match (1), normalized brand + title (2), rest of the brand for the fuzzy
+        # match (3, only with a title to compare). Rows are read as the loop goes, so an early match stops
+        # the scan, and every brand candidate is still considered when none matches sooner
+        cursor = self.conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        try:
+            cursor.execute('''
+                SELECT downloaded_image_path, Title, Variant_SKU, 1 AS prio FROM products
+                WHERE Variant_Barcode = ? AND image_status = 'approved' AND downloaded_image_path IS NOT NULL
+                UNION ALL
+                SELECT downloaded_image_path, Title, Variant_SKU, 2 FROM products
+                WHERE Brand = ? AND title_norm = ? AND image_status = 'approved' AND downloaded_image_path IS NOT NULL
+                UNION ALL
+                SELECT downloaded_image_path, Title, Variant_SKU, 3 FROM products
+                WHERE Brand = ? AND title_norm != ? AND ? != ''
+                  AND image_status = 'approved' AND downloaded_image_path IS NOT NULL
+                ORDER BY prio
+            ''', (barcode or None, brand, title_norm, brand, title_norm, title_norm))
+            words = None
+            for row in cursor:
+                path = row['downloaded_image_path']
+                if not path:
+                    continue
+                # Barcode and exact matches win outright; brand-only rows need a similar title.
+                # The title test runs first, so only likely matches cost a stat
+                if row['prio'] == 3:
+                    if not row['Title']:
+                        continue
+                    if words is None:
+                        words = self._title_words(title)
+                    sku = row['Variant_SKU']
+                    other = self._title_words_cache.get(sku)
+                    if other is None:
+                        other = self._title_words_cache[sku] = self._title_words(row['Title'])
+                    if not self._words_overlap(words, other):
+                        continue
+                if os.path.isfile(path):
+                    return path
+        finally:
+            cursor.close()
         
         return None
     
+    @staticmethod
+    def _existing_files(root: str, listings: Dict[str, frozenset]) -> frozenset:
+        """Paths of regular files in root, from one scandir per root (memoized in listings).
+
+        Lets callers checking many paths in the same folders replace a stat per path
+        with a set lookup. Paths are joined the same way they are stored in the DB.
+        """
+        if root not in listings:
+            try:
+                with os.scandir(root or '.') as entries:
+                    listings[root] = frozenset(
+                        os.path.join(root, entry.name) for entry in entries if entry.is_file()
+                    )
+            except OSError:
+                listings[root] = frozenset()
+        return listings[root]
+    
+    @staticmethod
+    def _title_words(title: str) -> frozenset:
+        """Significant (3+ character) lowercase words of a title"""
+        return frozenset(w for w in title.lower().strip().split() if len(w) > 2)
+    
+    @staticmethod
+    def _words_overlap(words1: frozenset, words2: frozenset) -> bool:
+        """True when at least 80% of the shorter word set is shared"""
+        if words1 and words2:
+            overlap = len(words1 & words2)
+            min_len = min(len(words1), len(words2))
+            return overlap / min_len >= 0.8
+        return False
+    
     def _similar_titles(self, title1: str, title2: str) -> bool:
         """Check if two titles are similar enough to be the same product"""
         if not title1 or not title2:
             return False
         
-        # Normalize for comparison
-        t1 = title1.lower().strip()
-        t2 = title2.lower().strip()
-        
         # Exact match
-        if t1 == t2:
+        if title1.lower().strip() == title2.lower().strip():
             return True
         
         # Check if all important words match
-        words1 = set(w for w in t1.split() if len(w) > 2)
-        words2 = set(w for w in t2.split() if len(w) > 2)
-        
-        if words1 and words2:
-            overlap = len(words1 & words2)
-            min_len = min(len(words1), len(words2))
-            if overlap / min_len >= 0.8:  # 80% word overlap
-                return True
-        
-        return False
+        return self._words_overlap(self._title_words(title1), self._title_words(title2))
     
     def check_search_cache(self, barcode: str, brand: str) -> Optional[Dict]:
         """Check if we've searched for this product recently"""
         
-        search_key = f"{barcode}_{brand}".lower()
+        search_key = search_cache_key(barcode, brand)
+        cutoff = _now_ms() - SEARCH_CACHE_TTL_MS
+        
+        if SQLITE_SUPPORTS_RETURNING:
+            # Read and increment usage counter in a single statement
+            result = self.cursor.execute('''
+                UPDATE search_cache SET used_count = used_count + 1 
+                WHERE search_key = ? AND cached_at > ?
+                RETURNING *
+            ''', (search_key, cutoff)).fetchone()
+            self.conn.commit()
+            return dict(result) if result else None
         
         result = self.cursor.execute('''
             SELECT * FROM search_cache 
             WHERE search_key = ? 
-            AND datetime(cached_at) > datetime('now', '-7 days')
-        ''', (search_key,)).fetchone()
+            AND cached_at > ?
+        ''', (search_key, cutoff)).fetchone()
         
         if result:
-            # Increment usage counter
-            self.cursor.execute('''
-                UPDATE search_cache SET used_count = used_count + 1 
-                WHERE search_key = ?
-            ''', (search_key,))
-            self.conn.commit()
+            # Defer the usage counter bump so cache reads don't commit
+            self._pending_cache_hits[search_key] += 1
+            if sum(self._pending_cache_hits.values()) >= CACHE_HIT_FLUSH_EVERY:
+                self._flush_cache_hits()
             
             return dict(result)
         
         return None
     
+    def _flush_cache_hits(self):
+        """Write buffered search cache usage counts"""
+        if not self._pending_cache_hits:
+            return
+        
+        hits, self._pending_cache_hits = self._pending_cache_hits, Counter()
+        self.cursor.executemany('''
+            UPDATE search_cache SET used_count = used_count + ? 
+            WHERE search_key = ?
+        ''', [(count, key) for key, count in hits.items()])
+        self.conn.commit()
+    
+    def search_cache_keys(self) -> Set[str]:
+        """Keys of all unexpired search cache entries, for ruling out misses without a query"""
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute('SELECT search_key FROM search_cache WHERE cached_at > ?',
+                           (_now_ms() - SEARCH_CACHE_TTL_MS,))
+            return {key for (key,) in cursor}
+        finally:
+            cursor.close()
+    
     def save_search_cache(self, barcode: str, brand: str, title: str, 
                          image_url: str, confidence: float, source: str):
         """Cache search results to avoid repeated API calls"""
         
-        search_key = f"{barcode}_{brand}".lower()
-        
-        self.cursor.execute('''
+        self.save_search_caches([(barcode, brand, title, image_url, confidence, source)])
+    
+    def save_search_caches(self, entries: List[tuple]):
+        """Cache several (barcode, brand, title, image_url, confidence, source) results in one commit"""
+        if not entries:
+            return
+        now = _now_ms()
+        self.cursor.executemany('''
             INSERT OR REPLACE INTO search_cache 
             (search_key, barcode, brand, title, image_url, confidence, source, cached_at)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (search_key, barcode, brand, title, image_url, confidence, source, datetime.now()))
+        ''', [(search_cache_key(barcode, brand), barcode, brand, title, image_url, confidence, source, now)
+              for barcode, brand, title, image_url, confidence, source in entries])
         
         self.conn.commit()
     
+    def get_image_cache(self, url: str) -> Optional[Dict]:
+        """Cached validators (sha256, etag, last_modified) for a previously downloaded image URL"""
+        cursor = self.conn.cursor()
+        try:
+            row = cursor.execute(
+                'SELECT sha256, etag, last_modified FROM image_cache WHERE url = ?', (url,)
+            ).fetchone()
+            return dict(row) if row else None
+        finally:
+            cursor.close()
+    
+    def save_image_cache(self, url: str, sha256: str, etag: Optional[str], last_modified: Optional[str]):
+        """Remember the content hash and HTTP validators of a downloaded image"""
+        self.save_image_caches([(url, sha256, etag, last_modified)])
+    
+    def save_image_caches(self, entries: List[tuple]):
+        """save_image_cache for several (url, sha256, etag, last_modified) entries in one commit"""
+        if not entries:
+            return
+        now = _now_ms()
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany('''
+                INSERT OR REPLACE INTO image_cache (url, sha256, etag, last_modified, fetched_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(*entry, now) for entry in entries])
+            self.conn.commit()
+        finally:
+            cursor.close()
+    
+    def get_serp_cache(self, query: str, num_results: int) -> Optional[List[Dict]]:
+        """Unexpired cached SerpAPI results for a query, or None if it must be fetched"""
+        cursor = self.conn.cursor()
+        try:
+            row = cursor.execute('''
+                SELECT results FROM serp_cache WHERE query = ? AND num_results = ? AND fetched_at > ?
+            ''', (query, num_results, _now_ms() - SERP_CACHE_TTL_MS)).fetchone()
+            return orjson.loads(row[0]) if row else None
+        finally:
+            cursor.close()
+    
+    def save_serp_cache(self, query: str, num_results: int, results: List[Dict]):
+        """Remember the SerpAPI results for a query"""
+        self.save_serp_caches({(query, num_results): results})
+    
+    def save_serp_caches(self, entries: Dict[Tuple[str, int], List[Dict]]):
+        """save_serp_cache for several {(query, num_results): results} entries in one commit"""
+        if not entries:
+            return
+        now = _now_ms()
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany('''
+                INSERT OR REPLACE INTO serp_cache (query, num_results, results, fetched_at)
+                VALUES (?, ?, ?, ?)
+            ''', [(query, num_results, orjson.dumps(results).decode(), now)
+                  for (query, num_results), results in entries.items()])
+            self.conn.commit()
+        finally:
+            cursor.close()
+    
     def update_product_image(self, sku: str, image_path: str, confidence: float, 
                             source: str, status: str = 'pending', description: str = None, 
                             search_query: str = None, image_source: str = None):
@@ -303,21 +665,9 @@ class ImageDatabase:
         # Use a fresh cursor for thread safety
         cursor = self.conn.cursor()
         try:
-            cursor.execute('''
-                UPDATE products SET 
-                    downloaded_image_path = ?,
-                    confidence = ?,
-                    source_retailer = ?,
-                    scraped_description = ?,
-                    search_query = ?,
-                    image_source = ?,
-                    image_status = ?,
-                    processed_date = ?,
-                    search_count = COALESCE(search_count, 0) + 1,
-                    last_search_date = ?
-                WHERE Variant_SKU = ?
-            ''', (image_path, confidence, source, description, search_query, image_source, 
-                  status, datetime.now(), datetime.now(), sku))
+            cursor.execute(UPDATE_PRODUCT_IMAGE_SQL, self.product_image_row(
+                sku, image_path, confidence, source, status, description, search_query, image_source
+            ))
             
             self.conn.commit()
             
@@ -328,11 +678,35 @@ class ImageDatabase:
         finally:
             cursor.close()
     
+    @staticmethod
+    def product_image_row(sku: str, image_path: str, confidence: float, 
+                          source: str, status: str = 'pending', description: str = None, 
+                          search_query: str = None, image_source: str = None) -> tuple:
+        """Parameters for UPDATE_PRODUCT_IMAGE_SQL, for callers that buffer updates"""
+        now = datetime.now()
+        return (image_path, confidence, source, description, search_query, image_source,
+                status, now, now, sku)
+    
+    def update_product_images(self, rows: List[tuple]):
+        """Apply buffered product_image_row() updates with one executemany and a single commit"""
+        if not rows:
+            return
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany(UPDATE_PRODUCT_IMAGE_SQL, rows)
+            self.conn.commit()
+            logger.info(f"Updated {len(rows)} product image row(s) in one batch")
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    
     def approve_image(self, sku: str):
         """Approve an image and track for learning"""
         
         # Get current product info
-        product = self.get_product_by_sku(sku)
+        product = self.get_product_by_sku(sku, MIN_PRODUCT_COLUMNS)
         if not product:
             return False
         
@@ -347,16 +721,14 @@ class ImageDatabase:
         # Record for learning
         self.record_feedback(sku, 'approved')
         
-        # Update batch stats
-        self._update_batch_stats(product['batch_id'])
-        
         self.conn.commit()
+        self._stats_cache = None  # counts changed; don't serve the memoized statistics
         return True
     
     def decline_image(self, sku: str):
         """Decline an image and track for learning"""
         
-        product = self.get_product_by_sku(sku)
+        product = self.get_product_by_sku(sku, MIN_PRODUCT_COLUMNS)
         if not product:
             return False
         
@@ -370,27 +742,31 @@ class ImageDatabase:
         # Record for learning
         self.record_feedback(sku, 'declined')
         
-        # Update batch stats
-        self._update_batch_stats(product['batch_id'])
-        
         self.conn.commit()
+        self._stats_cache = None  # counts changed; don't serve the memoized statistics
         return True
 
     def mark_not_found(self, sku: str) -> None:
         """Mark product as not_found to prevent repeated API usage in this session."""
+        self.mark_not_found_many([sku])
+    
+    def mark_not_found_many(self, skus: List[str]) -> None:
+        """mark_not_found for several products with one executemany and a single commit"""
+        if not skus:
+            return
         try:
-            self.cursor.execute('''
+            self.cursor.executemany('''
                 UPDATE products SET image_status = 'not_found' WHERE Variant_SKU = ?
-            ''', (sku,))
+            ''', [(sku,) for sku in skus])
             self.conn.commit()
         except Exception:
             self.conn.rollback()
             # best-effort; don't raise
     
     def record_feedback(self, sku: str, action: str):
-        """Record user feedback for continuous learning"""
+        """Record user feedback for continuous learning (buffered, written in batches)"""
         
-        product = self.get_product_by_sku(sku)
+        product = self.get_product_by_sku(sku, MIN_PRODUCT_COLUMNS)
         if not product:
             return
         
@@ -398,21 +774,64 @@ class ImageDatabase:
         has_barcode = bool(product.get('Variant_Barcode'))
         has_brand = bool(product.get('Brand'))
         
-        self.cursor.execute('''
-            INSERT INTO learning_feedback 
-            (product_sku, confidence, source, user_action, feedback_date, 
-             brand, has_barcode_match, has_brand_match)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        row = (
             sku, product.get('confidence'), product.get('source_retailer'),
-            action, datetime.now(), product.get('Brand'),
+            action, _now_ms(), product.get('Brand'),
             has_barcode, has_brand
-        ))
+        )
+        with self._feedback_lock:
+            self._feedback_buf.append(row)
+            self.feedback_version += 1
+            pending = len(self._feedback_buf)
+            if self._feedback_thread is None:
+                self._feedback_thread = threading.Thread(
+                    target=self._feedback_flusher, name='feedback-flusher', daemon=True
+                )
+                self._feedback_thread.start()
         
-        self.conn.commit()
+        if pending >= FEEDBACK_FLUSH_SIZE:
+            self._feedback_wakeup.set()
+    
+    def _feedback_flusher(self):
+        """Background loop writing buffered feedback every FEEDBACK_FLUSH_INTERVAL seconds"""
+        while not self._feedback_closed:
+            self._feedback_wakeup.wait(FEEDBACK_FLUSH_INTERVAL)
+            self._feedback_wakeup.clear()
+            try:
+                self.flush_feedback()
+            except Exception as e:
+                logger.error(f"Feedback flush failed: {e}")
     
-    def _update_batch_stats(self, batch_id: str):
-        """Update batch statistics"""
+    def flush_feedback(self):
+        """Write all buffered feedback rows with one executemany and a single commit"""
+        with self._feedback_lock:
+            batch, self._feedback_buf = self._feedback_buf, []
+        if not batch:
+            return
+        
+        # Separate connection so the flush never commits the main connection's transaction
+        with self._feedback_write_lock:
+            try:
+                if self._feedback_conn is None:
+                    self._feedback_conn = sqlite3.connect(self.db_path, timeout=FEEDBACK_BUSY_TIMEOUT,
+                                                          check_same_thread=False)
+                self._feedback_conn.executemany('''
+                    INSERT INTO learning_feedback 
+                    (product_sku, confidence, source, user_action, feedback_date, 
+                     brand, has_barcode_match, has_brand_match)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', batch)
+                self._feedback_conn.commit()
+            except Exception:
+                # Keep the rows (ahead of any recorded since) for the next flush
+                if self._feedback_conn is not None:
+                    self._feedback_conn.rollback()
+                with self._feedback_lock:
+                    self._feedback_buf[:0] = batch
+                raise
+    
+    def recompute_batch_stats(self, batch_id: str):
+        """Rebuild batch counters with a full scan (repair path for drifted counters)"""
         if not batch_id:
             return
         
@@ -430,13 +849,17 @@ class ImageDatabase:
             UPDATE batches SET 
                 processed = ?, approved = ?, pending = ?, declined = ?
             WHERE id = ?
-        ''', (stats['processed'], stats['approved'], stats['pending'], stats['declined'], batch_id))
+        ''', (stats['processed'] or 0, stats['approved'] or 0, stats['pending'] or 0,
+              stats['declined'] or 0, batch_id))
         
         self.conn.commit()
     
     def get_learning_insights(self) -> Dict:
         """Analyze user feedback to improve confidence scoring"""
         
+        # Include feedback still sitting in the write buffer
+        self.flush_feedback()
+        
         # What sources get approved most?
         source_stats = self.cursor.execute('''
             SELECT 
@@ -469,14 +892,16 @@ class ImageDatabase:
         }
     
     def get_statistics(self) -> Dict:
-        """Get overall system statistics with thread-safe cursor"""
+        """Get overall system statistics (single grouped scan, memoized for STATS_CACHE_TTL)"""
+        
+        cached = self._stats_cache
+        if cached and time.monotonic() - cached[0] < STATS_CACHE_TTL:
+            return dict(cached[1])
         
         # Use a fresh cursor to avoid recursive cursor issues
         cursor = self.conn.cursor()
         cursor.row_factory = sqlite3.Row  # Ensure row factory is set
         try:
-            total = cursor.execute('SELECT COUNT(*) as cnt FROM products').fetchone()['cnt']
-            
             status_counts = cursor.execute('''
                 SELECT 
                     image_status,
@@ -486,8 +911,9 @@ class ImageDatabase:
             ''').fetchall()
             
             status_dict = {row['image_status']: row['count'] for row in status_counts}
+            total = sum(status_dict.values())
             
-            return {
+            stats = {
                 'total_products': total,
                 'approved': status_dict.get('approved', 0),
                 'pending': status_dict.get('pending', 0),
@@ -496,46 +922,66 @@ class ImageDatabase:
                 'not_processed': status_dict.get('not_processed', 0),
                 'completion_percentage': (status_dict.get('approved', 0) / total * 100) if total > 0 else 0
             }
+            self._stats_cache = (time.monotonic(), stats)
+            return dict(stats)
         finally:
             cursor.close()
     
-    def get_products_for_review(self, status: str = 'pending', limit: int = 50) -> List[Dict]:
-        """Get products that need review with enhanced debugging and thread-safe cursor"""
+    def get_products_for_review(self, status: str = 'pending', limit: int = 50,
+                                columns: Optional[List[str]] = None,
+                                as_list: bool = False) -> Union[Iterator[Dict], List[Dict]]:
+        """Get products that need review, streamed lazily as dicts.
+
+        Only the requested columns are selected (defaults to REVIEW_COLUMNS);
+        unknown column names are rejected. Pass as_list=True to materialize.
+        """
+        cols = list(columns) if columns else list(REVIEW_COLUMNS)
+        unknown = [c for c in cols if c not in PRODUCT_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown product columns: {unknown}")
         
         # Use a fresh cursor to avoid recursive cursor issues
         cursor = self.conn.cursor()
         cursor.row_factory = sqlite3.Row  # Ensure row factory is set
         try:
-            results = cursor.execute('''
-                SELECT *, 
-                       CASE WHEN downloaded_image_path IS NOT NULL THEN 1 ELSE 0 END as has_image_path,
-                       processed_date,
-                       approved_date
+            cursor.execute(f'''
+                SELECT {', '.join(cols)}
                 FROM products 
                 WHERE image_status = ? 
                 ORDER BY confidence DESC, processed_date DESC
                 LIMIT ?
-            ''', (status, limit)).fetchall()
-            
-            products = [dict(row) for row in results]
-            
-            # Log debugging info
+            ''', (status, limit))
+        except Exception:
+            cursor.close()
+            raise
+        
+        if as_list:
+            try:
+                products = [dict(row) for row in cursor]
+            finally:
+                cursor.close()
             logger.info(f"Found {len(products)} products with status '{status}' for review")
-            for product in products[:3]:  # Log first 3 for debugging
-                logger.debug(f"Review product - SKU: {product['Variant_SKU']}, "
-                            f"Path: {product.get('downloaded_image_path', 'None')}, "
-                            f"Status: {product.get('image_status', 'None')}, "
-                            f"Confidence: {product.get('confidence', 0)}")
-            
             return products
+        return self._stream_review_rows(cursor, status)
+    
+    @staticmethod
+    def _stream_review_rows(cursor: sqlite3.Cursor, status: str) -> Iterator[Dict]:
+        """Rows of a review query as dicts; the cursor is closed when iteration ends, fails,
+        or the generator is dropped early"""
+        count = 0
+        try:
+            for row in cursor:
+                count += 1
+                yield dict(row)
+            logger.info(f"Found {count} products with status '{status}' for review")
         finally:
             cursor.close()
     
     def get_unprocessed_products(self, limit: int = 10) -> List[Dict]:
         """Get products that haven't been processed yet - includes 'not_found' for reprocessing"""
         
-        results = self.cursor.execute('''
-            SELECT * FROM products 
+        results = self.cursor.execute(f'''
+            SELECT {', '.join(PROCESSING_COLUMNS)} FROM products 
             WHERE (image_status = 'not_processed' OR image_status IS NULL OR image_status = 'not_found')
                AND (downloaded_image_path IS NULL OR downloaded_image_path = '')
             ORDER BY Sorting 
@@ -546,8 +992,8 @@ class ImageDatabase:
 
     def get_unprocessed_products_from_bottom(self, limit: int = 10) -> List[Dict]:
         """Get unprocessed products starting from the bottom (reverse sorting) - includes 'not_found' for reprocessing"""
-        results = self.cursor.execute('''
-            SELECT * FROM products 
+        results = self.cursor.execute(f'''
+            SELECT {', '.join(PROCESSING_COLUMNS)} FROM products 
             WHERE (image_status = 'not_processed' OR image_status IS NULL OR image_status = 'not_found')
                AND (downloaded_image_path IS NULL OR downloaded_image_path = '')
             ORDER BY Sorting DESC 
@@ -571,6 +1017,20 @@ class ImageDatabase:
         results = self.cursor.execute(query).fetchall()
         return [dict(row) for row in results]
     
+    def _remove_image_files(self, paths) -> int:
+        """Delete the given image files that exist; returns how many were removed"""
+        count = 0
+        for path in paths:
+            # One unlink per path; a missing file is simply skipped
+            if not path:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            count += 1
+        return count
+    
     def clear_images(self, clear_type: str) -> int:
         """Clear images based on type"""
         
@@ -583,10 +1043,7 @@ class ImageDatabase:
                 WHERE image_status = 'declined'
             ''').fetchall()
             
-            for row in results:
-                if row['downloaded_image_path'] and os.path.exists(row['downloaded_image_path']):
-                    os.remove(row['downloaded_image_path'])
-                    count += 1
+            count = self._remove_image_files(row['downloaded_image_path'] for row in results)
             
             self.cursor.execute('''
                 UPDATE products SET downloaded_image_path = NULL 
@@ -600,10 +1057,7 @@ class ImageDatabase:
                 WHERE image_status = 'pending'
             ''').fetchall()
             
-            for row in results:
-                if row['downloaded_image_path'] and os.path.exists(row['downloaded_image_path']):
-                    os.remove(row['downloaded_image_path'])
-                    count += 1
+            count = self._remove_image_files(row['downloaded_image_path'] for row in results)
             
             self.cursor.execute('''
                 UPDATE products SET downloaded_image_path = NULL, image_status = 'not_processed'
@@ -617,10 +1071,7 @@ class ImageDatabase:
                 WHERE image_status IN ('declined', 'pending')
             ''').fetchall()
             
-            for row in results:
-                if row['downloaded_image_path'] and os.path.exists(row['downloaded_image_path']):
-                    os.remove(row['downloaded_image_path'])
-                    count += 1
+            count = self._remove_image_files(row['downloaded_image_path'] for row in results)
             
             self.cursor.execute('''
                 UPDATE products SET downloaded_image_path = NULL, image_status = 'not_processed'
@@ -628,13 +1079,14 @@ class ImageDatabase:
             ''')
         
         self.conn.commit()
+        self._stats_cache = None  # counts changed; don't serve the memoized statistics
         return count
     
     def export_to_excel(self, output_path: str, batch_ids: List[str] = None, status_filter: str = 'all') -> bool:
         """Export database back to Excel with all columns - FIXED v3"""
         try:
             # Build query based on filters
-            base_query = "SELECT * FROM products"
+            base_query = "SELECT * FROM products_export"
             conditions = []
             params = []
             
@@ -663,43 +1115,8 @@ class ImageDatabase:
             # Execute query with proper error handling
             df = pd.read_sql_query(query, self.conn, params=params if params else None)
             
-            # Check if we have data
             if df.empty:
                 logger.warning("No data to export with current filters")
-                # Create empty dataframe with headers
-                excel_columns = [
-                    'Handle', 'Title', 'Body', 'Brand', 'Variant_Title', 'Variant_option',
-                    'Variant_SKU', 'Weight_in_grams', 'Variant_Barcode', 'Image_link',
-                    'Variant_Image', 'Sorting', 'Vendor', 'VendorName', 'Supplier_SKU',
-                    'Tier_1', 'Tier_2', 'Tier_3', 'downloaded_image_path', 'confidence',
-                    'source_retailer', 'image_status'
-                ]
-                df = pd.DataFrame(columns=excel_columns)
-            else:
-                # Process Body column safely
-                df['Body'] = df.apply(lambda row: 
-                    str(row.get('scraped_description', '')) if pd.notna(row.get('scraped_description')) and str(row.get('scraped_description')).strip()
-                    else str(row.get('Body', '')) if pd.notna(row.get('Body')) else '', axis=1)
-                
-                # Define expected columns (removed problematic columns that might not exist)
-                excel_columns = [
-                    'Handle', 'Title', 'Body', 'Brand', 'Variant_Title', 'Variant_option',
-                    'Variant_SKU', 'Weight_in_grams', 'Variant_Barcode', 'Image_link',
-                    'Variant_Image', 'Sorting', 'Vendor', 'VendorName', 'Supplier_SKU',
-                    'Tier_1', 'Tier_2', 'Tier_3', 'downloaded_image_path', 'confidence',
-                    'source_retailer', 'image_status'
-                ]
-                
-                # Add missing columns with empty values
-                for col in excel_columns:
-                    if col not in df.columns:
-                        df[col] = ''
-                
-                # Reorder columns
-                df = df[excel_columns]
-                
-                # Fill NaN values with empty strings to prevent export issues
-                df = df.fillna('')
             
             # Save to Excel with error handling
             logger.info(f"Exporting {len(df)} rows to {output_path}")
@@ -721,5 +1138,13 @@ class ImageDatabase:
             return False
     
     def close(self):
-        """Close database connection"""
+        """Close database connection (safe to call more than once)"""
+        if self._feedback_closed:
+            return
+        self._feedback_closed = True
+        self._feedback_wakeup.set()
+        self.flush_feedback()
+        if self._feedback_conn is not None:
+            self._feedback_conn.close()
+        self._flush_cache_hits()
         self.conn.close()
\ No newline at end of file
@@ -4,40 +4,256 @@ Continuously improves through learning from user feedback
 """
 
 import os
+import stat
+import sys
+from collections import namedtuple
+from functools import lru_cache
 import re
-import json
+import hashlib
+import time
+import queue
+import threading
 import asyncio
 import aiohttp
+import httpx
+from aiolimiter import AsyncLimiter
+from cachetools import TTLCache, LFUCache
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
+import concurrent.futures
+import numpy as np
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
-from urllib.parse import urlencode
 from datetime import datetime
 
-from database import ImageDatabase
+try:  # libuv event loop (optional, not on Windows)
+    import uvloop
+except ImportError:
+    uvloop = None
+
+from database import ImageDatabase, normalize_barcode, search_cache_key
 from learning_system import LearningSystem
 from src import img_utils, downloader
 from src.clip_service import get_clip_service
 
 logger = logging.getLogger(__name__)
 
+# Filename sanitising: drop characters invalid on Windows/macOS (and NUL), spaces become underscores
+_FILENAME_TABLE = str.maketrans({**{c: None for c in '<>:"/\\|?*\0'}, ' ': '_'})
+
+TRUSTED_RETAILERS = ('checkers', 'shoprite', 'pnp', 'makro', 'woolworths')
+
+# Sources earning the reliability bonus in the fallback evaluation (evaluate_search_results)
+FALLBACK_TRUSTED_SOURCES = ('shoprite', 'checkers', 'pnp', 'makro', 'takealot', 'game')
+_FALLBACK_TRUSTED_RE = re.compile('|'.join(FALLBACK_TRUSTED_SOURCES))
+
+# SerpAPI retry policy: throttling and gateway errors are retried with exponential backoff
+SERP_RETRIES = 3
+SERP_BACKOFF = 0.3
+SERP_RETRY_STATUSES = (429, 502, 503, 504)
+
+# Variants that are easily confused with each other in search results
+CRITICAL_VARIANTS = ('vetkoek', 'flapjack', 'pancake', 'waffle', 'scone', 'muffin')
+# One scan of a title finds every critical variant it mentions
+_CRITICAL_VARIANTS_RE = re.compile('|'.join(CRITICAL_VARIANTS))
+
+TIER_BONUSES = {'tier1': 15, 'tier2': 10, 'tier3': 5}
+
+# Pack size in a title (e.g. "500g", "2 L"); units normalise to grams / millilitres
+_SIZE_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(kg|g|l|ml)", re.IGNORECASE)
+_UNIT_MULT = {'kg': 1000.0, 'l': 1000.0, 'ml': 1.0, 'g': 1.0}
+
+# A SKU missing from the whole-tree image index triggers a rescan at most this often
+SKU_INDEX_RESCAN_SECONDS = 30
+
+# A retailer result at or above this confidence is taken without waiting for the rest of its tier
+EARLY_ACCEPT_CONFIDENCE = 60
+
+# Further candidates from the winning tier tried when the best one fails to download or validate
+DOWNLOAD_FALLBACK_CANDIDATES = 2
+
+# Size cap of the content-addressed image blob store (cache.blob_max_mb); least recently used blobs
+# are pruned at the end of a batch, down to BLOB_PRUNE_TARGET of the cap, at most every BLOB_PRUNE_SECONDS
+BLOB_CACHE_MAX_MB = 2048
+BLOB_PRUNE_TARGET = 0.8
+BLOB_PRUNE_SECONDS = 600
+
+# Lowercased product-side inputs for confidence scoring, built once per product by _scoring_context
+# (patterns: every distinct brand variant, title token and barcode, looked up together per result)
+ScoringContext = namedtuple('ScoringContext', 'brand brand_variants title_tokens barcode patterns')
+
+# Lowercased product-side inputs for variant matching, built once per product by _variant_context
+# and shared by every retailer x query variant search of that product
+VariantContext = namedtuple(
+    'VariantContext', 'title brand sku variant variant_option barcode wanted_variants product_size'
+)
+
+
+@lru_cache(maxsize=4096)
+def _brand_variants(brand: str) -> frozenset:
+    """Spellings of a lowercased brand as it may appear in result text (e.g. Good 'n Gold).
+    Cached per brand - a catalogue has far fewer brands than products.
+    """
+    if not brand:
+        return frozenset()
+    return frozenset((
+        brand,
+        brand.replace(' ', ''),
+        brand.replace(' ', '-'),
+        brand.replace("'", ""),
+        brand.replace("'n", "n")
+    ))
+
+
+@lru_cache(maxsize=50000)
+def _extract_size(text: str) -> Optional[float]:
+    """Extract normalized size value in grams or milliliters from text.
+    g/kg -> grams, ml/l -> milliliters (treat ml and g similarly for scoring).
+    Memoized - product and result titles repeat heavily across SKUs.
+    """
+    match = _SIZE_RE.search(text)
+    return float(match.group(1)) * _UNIT_MULT[match.group(2).lower()] if match else None
+
+
+def _write_file(path: Path, data: bytes) -> None:
+    """Write bytes straight to a raw fd - no Python file object or buffer layer in between"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def _write_pair(path: Path, img_bytes: bytes, meta: Optional[dict], link_from: Optional[Path] = None) -> None:
+    """Write an image and its compact JSON sidecar (sidecar removed when there is no metadata).
+    With link_from (a blob holding the same bytes) the image is hardlinked instead of written.
+    """
+    # Replace rather than overwrite in place - the old file may share its inode with a blob
+    path.unlink(missing_ok=True)
+    try:
+        if link_from is None:
+            raise FileNotFoundError
+        os.link(link_from, path)
+    except OSError:
+        # No blob, or blob store on another filesystem / without hardlink support
+        _write_file(path, img_bytes)
+    meta_path = path.with_suffix('.json')
+    if meta is None:
+        meta_path.unlink(missing_ok=True)
+        return
+    _write_file(meta_path, orjson.dumps(meta, option=orjson.OPT_SERIALIZE_NUMPY))
+
+
+def _write_blob(path: Path, data: bytes) -> None:
+    """Atomically write a content-addressed blob (concurrent writers of the same hash are harmless)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    _write_file(tmp, data)
+    os.replace(tmp, path)
+
+
+def _read_blob(path: Path) -> bytes:
+    """Read a blob and mark it recently used (its mtime orders pruning)"""
+    data = path.read_bytes()
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return data
+
+
+def _prune_blobs(root: Path, max_bytes: int) -> int:
+    """Delete the least recently used blobs under root once they exceed max_bytes, down to
+    BLOB_PRUNE_TARGET of it. Returns how many were deleted."""
+    blobs = []
+    total = 0
+    try:
+        with os.scandir(root) as shards:
+            for shard in shards:
+                if not shard.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(shard.path) as entries:
+                    for entry in entries:
+                        if entry.is_file(follow_symlinks=False):
+                            st = entry.stat()
+                            blobs.append((st.st_mtime, st.st_size, entry.path))
+                            total += st.st_size
+    except FileNotFoundError:
+        return 0
+    if total <= max_bytes:
+        return 0
+    
+    target = max_bytes * BLOB_PRUNE_TARGET
+    removed = 0
+    for _, size, path in sorted(blobs):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def _validate_and_optimise(image_bytes: bytes, size: int, max_kb: int) -> Tuple[bool, Optional[bytes]]:
+    """Process-pool worker: validate then optimise in one hop, returning (is_valid, optimized_bytes)"""
+    return img_utils.validate_and_optimise(image_bytes, size=size, fmt='JPEG', max_kb=max_kb, min_size=150)
+
+
 class ImageSearcher:
     """Simple wrapper for search functionality"""
     def __init__(self, config):
         self.config = config
         self.api_key = config.get('search', {}).get('serp_api_key')
-        # Persistent HTTP session for lower latency and connection reuse
+        # Persistent HTTP session for lower latency and connection reuse, retrying throttled/failed gateways
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=32, max_retries=Retry(
+            total=SERP_RETRIES, backoff_factor=SERP_BACKOFF, status_forcelist=SERP_RETRY_STATUSES,
+            allowed_methods=frozenset(['GET'])
+        ))
+        self.session.mount('https://', adapter)
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0 Safari/537.36'
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0 Safari/537.36',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive'
         })
+        # Optional SerpAPI json_restrictor so responses carry only the fields _shape_results reads
+        self.json_restrictor = config.get('search', {}).get('json_restrictor', '')
+        # Async client for searches made without a caller-supplied one, rebuilt per event loop
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
     
-    def search_google_images(self, query: str, num_results: int = 3) -> List[dict]:
-        """Search Google Images via SerpAPI"""
-        if not self.api_key:
-            return []
-        
+    async def _get_client(self) -> httpx.AsyncClient:
+        # Clients are bound to the loop they were created on (process_batch runs a loop per batch)
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            # Pool limits live on the transport, which also retries failed connects
+            transport = httpx.AsyncHTTPTransport(
+                http2=True,
+                limits=httpx.Limits(max_connections=128, max_keepalive_connections=64),
+                retries=SERP_RETRIES
+            )
+            self._client = httpx.AsyncClient(
+                transport=transport, timeout=self.config.get('network', {}).get('timeout', 30)
+            )
+            self._client_loop = loop
+        return self._client
+    
+    async def aclose(self) -> None:
+        """Close the searcher's own async client (call before its event loop shuts down)"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
+    
+    def _params(self, query: str, num_results: int) -> dict:
         params = {
             'engine': 'google_images',
             'q': query,
@@ -46,46 +262,160 @@ class ImageSearcher:
             'gl': 'za',
             'hl': 'en'
         }
+        if self.json_restrictor:
+            params['json_restrictor'] = self.json_restrictor
+        return params
+    
+    @staticmethod
+    def _shape_results(data: dict, num_results: int) -> List[dict]:
+        results = []
+        for img in data.get('images_results', [])[:num_results]:
+            results.append({
+                'url': img.get('original'),
+                'original': img.get('original'),  # Add for compatibility
+                'link': img.get('link'),  # Add alternate URL
+                'thumbnail': img.get('thumbnail'),  # Add thumbnail as fallback
+                'title': img.get('title', ''),
+                'source': sys.intern(img.get('source') or ''),  # few distinct retailers, shared by every cached result
+                'snippet': img.get('snippet', '')
+            })
+        return results
+    
+    def search_google_images(self, query: str, num_results: int = 3) -> List[dict]:
+        """Search Google Images via SerpAPI"""
+        if not self.api_key:
+            return []
         
         try:
-            response = self.session.get('https://serpapi.com/search', params=params, timeout=10)
+            response = self.session.get('https://serpapi.com/search', params=self._params(query, num_results), timeout=10)
             if response.status_code == 200:
-                data = response.json()
-                results = []
-                for img in data.get('images_results', [])[:num_results]:
-                    results.append({
-                        'url': img.get('original'),
-                        'original': img.get('original'),  # Add for compatibility
-                        'link': img.get('link'),  # Add alternate URL
-                        'thumbnail': img.get('thumbnail'),  # Add thumbnail as fallback
-                        'title': img.get('title', ''),
-                        'source': img.get('source', ''),
-                        'snippet': img.get('snippet', '')
-                    })
-                return results
+                return self._shape_results(orjson.loads(response.content), num_results)
         except Exception as e:
             logger.error(f"Search error: {str(e)}")
         return []
+    
+    async def search_google_images_async(self, client: Optional[httpx.AsyncClient], query: str,
+                                         num_results: int = 3) -> Optional[List[dict]]:
+        """Search Google Images via SerpAPI over a shared (HTTP/2) client, or the searcher's own
+        when client is None; None if the request failed"""
+        if not self.api_key:
+            return None
+        
+        params = self._params(query, num_results)
+        try:
+            if client is None:
+                client = await self._get_client()
+            for attempt in range(SERP_RETRIES + 1):
+                response = await client.get('https://serpapi.com/search', params=params)
+                if response.status_code == 200:
+                    return self._shape_results(orjson.loads(response.content), num_results)
+                if response.status_code not in SERP_RETRY_STATUSES or attempt == SERP_RETRIES:
+                    break
+                await asyncio.sleep(SERP_BACKOFF * (2 ** attempt))
+        except Exception as e:
+            logger.error(f"Search error: {str(e)}")
+        return None
+
 
 class ImageDownloader:
     """Simple wrapper for download functionality"""
     def __init__(self, config):
         self.config = config
-        # No persistent session to avoid cross-event-loop issues
+        # Bodies larger than this are abandoned mid-stream (network.max_download_bytes)
+        self.max_bytes = config.get('network', {}).get('max_download_bytes', downloader.MAX_IMAGE_BYTES)
+        # Persistent session, rebuilt only when used from a different event loop
         self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
     
     async def _get_session(self) -> aiohttp.ClientSession:
-        # Build a short-lived session tied to the current loop/task
-        connector = aiohttp.TCPConnector(limit=self.config.get('network', {}).get('concurrency', 10))
-        timeout = aiohttp.ClientTimeout(total=self.config.get('network', {}).get('timeout', 15))
-        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+        # Sessions are bound to the loop they were created on (process_batch runs a loop per batch)
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            await self._discard_session()
+            connector = aiohttp.TCPConnector(
+                limit=self.config.get('network', {}).get('concurrency', 10),
+                limit_per_host=8, resolver=downloader.dns_resolver(self.config),
+                ttl_dns_cache=300, keepalive_timeout=60
+            )
+            timeout = aiohttp.ClientTimeout(total=self.config.get('network', {}).get('timeout', 15))
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._session_loop = loop
+        return self._session
+    
+    async def _discard_session(self) -> None:
+        """Close a still-open session left over from another event loop, so its sockets aren't leaked"""
+        session, session_loop = self._session, self._session_loop
+        self._session = None
+        self._session_loop = None
+        if session is None or session.closed:
+            return
+        if session_loop is not None and session_loop.is_running():
+            # Its loop is alive on another thread: close it there
+            asyncio.run_coroutine_threadsafe(session.close(), session_loop)
+            return
+        # Its loop has stopped, so close the connector's transports from here
+        logger.debug("Closing download session from a finished event loop")
+        try:
+            await session.connector.close()
+        except Exception as e:
+            logger.debug(f"Download session connector did not close cleanly: {str(e)}")
     
-    async def download_image(self, url: str) -> Optional[bytes]:
-        """Download image from URL with proper headers"""
+    async def aclose(self) -> None:
+        """Close the persistent session (call before its event loop shuts down)"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+    
+    async def download_image(self, url: str, session: Optional[aiohttp.ClientSession] = None) -> Optional[bytes]:
+        """Download image from URL with proper headers (reuses session when given)"""
         if not url or not isinstance(url, str):
             logger.error(f"Invalid URL: {url}")
             return None
             
+        headers = self._headers(url)
+        try:
+            if session is not None and not session.closed:
+                return await self._fetch(session, url, headers)
+            return await self._fetch(await self._get_session(), url, headers)
+        except Exception as e:
+            logger.error(f"Download error for URL {url}: {str(e)}")
+        return None
+    
+    async def download_image_conditional(self, url: str, session: Optional[aiohttp.ClientSession] = None,
+                                         etag: Optional[str] = None,
+                                         last_modified: Optional[str] = None) -> Tuple[int, Optional[bytes], Optional[str], Optional[str]]:
+        """Conditional GET: returns (status, body, etag, last_modified); body is None on 304 or failure"""
+        if not url or not isinstance(url, str):
+            logger.error(f"Invalid URL: {url}")
+            return 0, None, None, None
+        
+        headers = self._headers(url)
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        
+        async def _get(s: aiohttp.ClientSession):
+            async with s.get(url, headers=headers, ssl=False) as response:
+                body = await downloader.read_capped(
+                    response.content.iter_chunked(downloader.READ_CHUNK_BYTES), url, self.max_bytes, response.content_length
+                ) if response.status == 200 else None
+                if response.status not in (200, 304):
+                    logger.warning(f"Download failed with status {response.status} for URL: {url}")
+                return (response.status, body,
+                        response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        
+        try:
+            if session is not None and not session.closed:
+                return await _get(session)
+            return await _get(await self._get_session())
+        except Exception as e:
+            logger.error(f"Download error for URL {url}: {str(e)}")
+        return 0, None, None, None
+    
+    @staticmethod
+    def _headers(url: str) -> Dict[str, str]:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
@@ -94,26 +424,23 @@ class ImageDownloader:
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1'
         }
-            
+        # Add referer when available to improve retailer CDN acceptance
         try:
-            # Add referer when available to improve retailer CDN acceptance
-            try:
-                from urllib.parse import urlparse as _urlparse
-                netloc = _urlparse(url).netloc
-                if netloc and 'Referer' not in headers:
-                    headers['Referer'] = f"https://{netloc}"
-            except Exception:
-                pass
-
-            session = await self._get_session()
-            async with session as s:
-                async with s.get(url, headers=headers, ssl=False) as response:
-                    if response.status == 200:
-                        return await response.read()
-                    else:
-                        logger.warning(f"Download failed with status {response.status} for URL: {url}")
-        except Exception as e:
-            logger.error(f"Download error for URL {url}: {str(e)}")
+            from urllib.parse import urlparse as _urlparse
+            netloc = _urlparse(url).netloc
+            if netloc:
+                headers['Referer'] = f"https://{netloc}"
+        except Exception:
+            pass
+        return headers
+    
+    async def _fetch(self, session: aiohttp.ClientSession, url: str, headers: dict) -> Optional[bytes]:
+        async with session.get(url, headers=headers, ssl=False) as response:
+            if response.status == 200:
+                return await downloader.read_capped(
+                    response.content.iter_chunked(downloader.READ_CHUNK_BYTES), url, self.max_bytes, response.content_length
+                )
+            logger.warning(f"Download failed with status {response.status} for URL: {url}")
         return None
 
 class IntelligentImageProcessor:
@@ -131,11 +458,21 @@ class IntelligentImageProcessor:
         self.approved_dir = self.output_dir / 'approved'
         self.pending_dir = self.output_dir / 'pending'
         self.declined_dir = self.output_dir / 'declined'
-        
+        # Content-addressed raw/optimised image bytes, see _download_with_cache and _validate_and_optimise.
+        # Kept next to the database (or cache.blobs_dir), outside output/ so QA and storage scans never
+        # see them, and bounded by cache.blob_max_mb (see _prune_blob_cache)
+        cache_config = config.get('cache', {})
+        self.blobs_dir = Path(cache_config.get('blobs_dir') or Path(db.db_path).parent / 'image_cache')
+        self._blob_max_bytes = int(cache_config.get('blob_max_mb', BLOB_CACHE_MAX_MB) * 1024 * 1024)
+        self._blobs_pruned_at: Optional[float] = None
+        
+        # Directories known to exist, so per-image saves/moves skip the mkdir syscall
+        self._ensured_dirs: set = set()
         for dir in [self.approved_dir, self.pending_dir, self.declined_dir]:
-            dir.mkdir(parents=True, exist_ok=True)
+            self._ensure_dir(dir)
         
-        # Load confidence adjustments from learning
+        # Load confidence adjustments from learning (rebuilt only when new feedback arrives)
+        self._insights_version = self.db.feedback_version
         self.confidence_adjustments = self._load_confidence_adjustments()
         
         # IMPROVED: Retailer prioritization system
@@ -144,11 +481,154 @@ class IntelligentImageProcessor:
             'tier2': ['takealot.com', 'game.co.za', 'woolworths.co.za', 'clicks.co.za'],
             'tier3': []  # All others
         }
-        
-        # Search result cache to reduce API calls
-        self.search_cache = {}
+        # Retailer -> tier name, for O(1) trust bonus lookups while scoring
+        self._retailer_tier = {r: tier for tier, retailers in self.TRUSTED_RETAILERS.items() for r in retailers}
+        
+        # Search result cache to reduce API calls - bounded and expiring (cache.search_maxsize /
+        # cache.search_ttl), with frequently hit entries promoted to an LFU layer that outlives the TTL
+        cache_config = self.config.get('cache', {})
+        self.search_cache = TTLCache(maxsize=cache_config.get('search_maxsize', 10000),
+                                     ttl=cache_config.get('search_ttl', 86400))
+        self._hot_search_cache = LFUCache(maxsize=cache_config.get('hot_maxsize', 512))
+        # (barcode, brand) -> DB search_cache row, to skip SQLite on repeat lookups
+        self._db_cache_memo = LFUCache(maxsize=cache_config.get('db_memo_maxsize', 2048))
+        # Keys present in the DB search cache - a miss here skips the SQLite lookup entirely
+        self._db_cache_keys = self.db.search_cache_keys()
         self.cache_hits = 0
+        self.db_cache_hits = 0
         self.total_searches = 0
+        
+        # Brand folder -> {'stems': {stem: path}, 'skus': {sku suffix: path}}, built lazily by _index_brand
+        self._brand_index: Dict[str, Dict[str, Dict[str, str]]] = {}
+        # The same shape for every .jpg under approved/pending/declined, built by one walk in _build_sku_index
+        self._sku_index: Optional[Dict[str, Dict[str, str]]] = None
+        self._sku_index_built = 0.0
+        
+        # Folder -> files listing for the current batch, so local-cache checks are set lookups (see _prefetch_local_files)
+        self._stat_cache: Optional[Dict[str, frozenset]] = None
+        
+        # Outstanding SERP queries, so concurrent products with the same query share one API call
+        self._inflight: Dict[Tuple[str, int], asyncio.Future] = {}
+        # Similar-product cache keys currently being searched; resolved when the search finishes
+        self._searching: Dict[str, asyncio.Future] = {}
+        
+        # Product/search-cache writes buffered while a batch runs, flushed once at the end (None outside a batch)
+        self._pending_updates: Optional[List[tuple]] = None
+        self._pending_search_cache: Optional[List[tuple]] = None
+        self._pending_not_found: Optional[List[str]] = None
+        # SERP answers and image validators, keyed like their tables so the batch can read its own writes
+        self._pending_serp_cache: Optional[Dict[Tuple[str, int], List[dict]]] = None
+        self._pending_image_cache: Optional[Dict[str, Dict]] = None
+        
+        # Worker processes for CPU-bound decode/resize/encode, created on first use
+        self._img_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        # Threads for CLIP thumbnail decode/preprocess and ranking (PIL and torch release the GIL)
+        self._decode_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        # One thread for SQLite writes made from async code, so commits stay ordered and off the event loop
+        self._db_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        
+        # Shared HTTP session (image downloads) and HTTP/2 client (SERP queries, plus image downloads
+        # when network.http2_downloads is set) for the duration of a batch (see __aenter__)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._serp: Optional[httpx.AsyncClient] = None
+        # Token bucket for SERP queries (search.serp_qps per second), created with the client
+        self._serp_limiter: Optional[AsyncLimiter] = None
+        # Cap on SERP requests in flight at once (search.max_parallel), created with the client
+        self._serp_slots: Optional[asyncio.Semaphore] = None
+        # Loop the objects above were created on (they can't be used from another one)
+        self._conn_loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        # Event loop kept for the processor's lifetime (see run), so the HTTP session, DNS cache
+        # and open TLS connections carry over from one batch to the next
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+        
+        # CLIP validator, loaded on first use and kept (model + OCR load is expensive); False if unavailable
+        self._clip_validator = None
+    
+    def run(self, coro):
+        """Run a coroutine to completion on the processor's persistent event loop.
+        Callers are serialized - batches share the processor's connections and write buffers.
+        """
+        with self._loop_lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            return self._loop.run_until_complete(coro)
+    
+    def close(self) -> None:
+        """Close the HTTP connections, the persistent event loop and the worker pools
+        (waits for a running batch)"""
+        with self._loop_lock:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.run_until_complete(self._close_connections())
+                self._loop.close()
+            self._loop = None
+            # Pending DB writes still run; queued image/decode work is dropped
+            if self._db_pool is not None:
+                self._db_pool.shutdown()
+                self._db_pool = None
+            if self._img_pool is not None:
+                self._img_pool.shutdown(cancel_futures=True)
+                self._img_pool = None
+            if self._decode_pool is not None:
+                self._decode_pool.shutdown(cancel_futures=True)
+                self._decode_pool = None
+    
+    async def __aenter__(self) -> 'IntelligentImageProcessor':
+        """Open one keep-alive HTTP session reused by every download in the batch, plus an
+        HTTP/2 client that multiplexes all SERP queries over a single connection"""
+        loop = asyncio.get_running_loop()
+        if self._conn_loop is not None and self._conn_loop is not loop:
+            logger.warning("Discarding batch connections from another event loop")
+            self._session = self._serp = self._serp_limiter = self._serp_slots = None
+        self._conn_loop = loop
+        if self._session is None or self._session.closed:
+            # Downloads concentrate on a few retailer CDNs - allow more parallelism per host
+            connector = aiohttp.TCPConnector(
+                limit=128, limit_per_host=16, resolver=downloader.dns_resolver(self.config),
+                ttl_dns_cache=600, keepalive_timeout=75, enable_cleanup_closed=True
+            )
+            timeout = aiohttp.ClientTimeout(total=self.config.get('network', {}).get('timeout', 30))
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        if self._serp_limiter is None:
+            self._serp_limiter = AsyncLimiter(self.config.get('search', {}).get('serp_qps', 5), time_period=1)
+        if self._serp_slots is None:
+            self._serp_slots = asyncio.Semaphore(max(1, self.config.get('search', {}).get('max_parallel', 10)))
+        if self._serp is None:
+            # The searcher's per-loop client, so batch and one-off searches share one HTTP/2 connection
+            self._serp = await self.searcher._get_client()
+        return self
+    
+    def _http2_client(self) -> Optional[httpx.AsyncClient]:
+        """The HTTP/2 client for image downloads, when enabled by network.http2_downloads"""
+        if self.config.get('network', {}).get('http2_downloads', False):
+            return self._serp
+        return None
+    
+    async def _db_write(self, fn, *args):
+        """Run a blocking database write on the DB writer thread"""
+        if self._db_pool is None:
+            self._db_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-write')
+        return await asyncio.get_running_loop().run_in_executor(self._db_pool, fn, *args)
+    
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if asyncio.get_running_loop() is self._loop:
+            # Kept open for the next batch on the persistent loop (see close)
+            return
+        await self._close_connections()
+    
+    async def _close_connections(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        # The SERP client belongs to the searcher, closed below
+        self._serp = None
+        self._serp_limiter = None
+        self._serp_slots = None
+        self._conn_loop = None
+        await self.downloader.aclose()
+        await self.searcher.aclose()
     
     def check_local_cache(self, product: dict) -> Optional[dict]:
         """Check if product image already exists locally"""
@@ -161,7 +641,11 @@ class IntelligentImageProcessor:
             # Check if it's a local file path that exists
             if image_link.startswith('/') or image_link.startswith('./'):
                 image_path = Path(image_link)
-                if image_path.exists():
+                if self._stat_cache is not None:
+                    exists = str(image_path) in ImageDatabase._existing_files(str(image_path.parent), self._stat_cache)
+                else:
+                    exists = image_path.exists()
+                if exists:
                     return {
                         'success': True,
                         'image_path': str(image_path),
@@ -171,6 +655,25 @@ class IntelligentImageProcessor:
         
         return None
     
+    def _prefetch_local_files(self, products: List[dict]) -> Dict[str, frozenset]:
+        """List every folder holding a local Image_link for the batch up front (one scandir per folder)"""
+        listings: Dict[str, frozenset] = {}
+        skus = [p.get('Variant_SKU') for p in products if p.get('Variant_SKU')]
+        cursor = self.db.conn.cursor()
+        try:
+            for i in range(0, len(skus), 500):
+                chunk = skus[i:i + 500]
+                cursor.execute(
+                    f"SELECT Image_link FROM products WHERE Variant_SKU IN ({','.join('?' * len(chunk))}) "
+                    "AND (Image_link LIKE '/%' OR Image_link LIKE './%')",
+                    chunk
+                )
+                for (image_link,) in cursor:
+                    ImageDatabase._existing_files(str(Path(image_link).parent), listings)
+        finally:
+            cursor.close()
+        return listings
+    
     def cache_search_result(self, product: dict, result: dict):
         """Cache search result for future use"""
         if result and result.get('success'):
@@ -180,6 +683,8 @@ class IntelligentImageProcessor:
                 product.get('Variant_Title', '')
             )
             self.search_cache[cache_key] = result.copy()
+            # A fresh result supersedes any promoted copy
+            self._hot_search_cache.pop(cache_key, None)
     
     def _load_confidence_adjustments(self) -> Dict:
         """Load confidence adjustments based on learning"""
@@ -193,27 +698,31 @@ class IntelligentImageProcessor:
             }
         }
         
-        # Adjust source confidence based on approval rates
+        # Adjust source confidence based on approval rates (keyed lowercase for a single dict lookup)
         for source_stat in insights.get('source_performance', []):
-            if source_stat['total'] > 5:  # Need enough data
+            if source_stat['total'] > 5 and source_stat['source']:  # Need enough data
                 approval_rate = source_stat['approved'] / source_stat['total']
                 if approval_rate > 0.8:
-                    adjustments['source_multipliers'][source_stat['source']] = 1.2
+                    multiplier = 1.2
                 elif approval_rate < 0.3:
-                    adjustments['source_multipliers'][source_stat['source']] = 0.8
+                    multiplier = 0.8
                 else:
-                    adjustments['source_multipliers'][source_stat['source']] = 1.0
+                    multiplier = 1.0
+                adjustments['source_multipliers'][source_stat['source'].lower()] = multiplier
         
         return adjustments
     
+    def _refresh_confidence_adjustments(self):
+        """Rebuild confidence adjustments if feedback has been recorded since the last build"""
+        version = self.db.feedback_version
+        if version != self._insights_version:
+            self.confidence_adjustments = self._load_confidence_adjustments()
+            self._insights_version = version
+    
     def sanitize_filename(self, text: str) -> str:
         """Sanitize text for use as filename"""
-        # Remove invalid characters
-        text = re.sub(r'[<>:"/\\|?*]', '', text)
-        # Replace spaces with underscores
-        text = text.replace(' ', '_')
-        # Limit length
-        return text[:100]
+        # Remove invalid characters and replace spaces with underscores, then limit length
+        return text.translate(_FILENAME_TABLE)[:100]
     
     def _get_search_cache_key(self, brand: str, category: str, variant: str) -> str:
         """Generate cache key for similar products - more specific to avoid over-caching"""
@@ -222,6 +731,15 @@ class IntelligentImageProcessor:
         variant_full = (variant or 'none').lower()[:30]  # Use full variant, not just first word
         return f"{brand}_{category}_{variant_full}"
     
+    def _cached_search(self, cache_key: str) -> Optional[dict]:
+        """Look up a similar-product result, promoting TTL cache hits into the hot LFU layer"""
+        cached = self._hot_search_cache.get(cache_key)
+        if cached is None:
+            cached = self.search_cache.get(cache_key)
+            if cached is not None:
+                self._hot_search_cache[cache_key] = cached
+        return cached
+    
     def _adjust_cached_result_for_variant(self, cached_result: dict, product: dict) -> dict:
         """Adjust cached result for specific variant"""
         # Keep the same source but adjust confidence based on variant match
@@ -241,7 +759,7 @@ class IntelligentImageProcessor:
         sku = product.get('Variant_SKU', 'Unknown')
         title = product.get('Title', '')
         brand = product.get('Brand', '')
-        barcode = product.get('Variant_Barcode', '')
+        barcode = normalize_barcode(product.get('Variant_Barcode'))
         variant = product.get('Variant_Title', '')
         
         # Try local cache first
@@ -253,7 +771,14 @@ class IntelligentImageProcessor:
         # Try DB search cache to avoid API calls (unless forcing web search)
         try_db_cache = False if force_web else self.config.get('search', {}).get('use_db_cache', True)
         if try_db_cache and (barcode or brand):
-            cached_entry = self.db.check_search_cache(str(barcode or ''), str(brand or ''))
+            memo_key = (str(barcode or ''), str(brand or ''))
+            cached_entry = self._db_cache_memo.get(memo_key)
+            if cached_entry is not None:
+                self.db_cache_hits += 1
+            elif search_cache_key(*memo_key) in self._db_cache_keys:
+                cached_entry = self.db.check_search_cache(*memo_key)
+                if cached_entry:
+                    self._db_cache_memo[memo_key] = cached_entry
             if cached_entry and cached_entry.get('image_url'):
                 logger.info(f"✓ DB search cache hit for {sku} → {cached_entry.get('image_url')}")
                 dl = await self._download_and_save_image(
@@ -275,14 +800,22 @@ class IntelligentImageProcessor:
                         'image_source': cached_entry.get('source', '')
                     }
                 else:
+                    self._db_cache_memo.pop(memo_key, None)
                     logger.warning(f"DB cache URL failed to download for {sku}, will fall back to search")
 
         # Check search result cache for similar products (unless forcing web search)
         cache_key = self._get_search_cache_key(brand, product.get('Tier_1', ''), variant)
-        if (not force_web) and (cache_key in self.search_cache):
+        if not force_web:
+            # A similar product is mid-search - wait for it and reuse what it caches. If it found
+            # nothing, one waiter takes over the search and the rest wait on that one in turn
+            while cache_key in self._searching:
+                logger.debug(f"Waiting on in-flight search for similar product: {sku}")
+                await asyncio.wait([self._searching[cache_key]])
+        cached_result = None if force_web else self._cached_search(cache_key)
+        if cached_result is not None:
             self.cache_hits += 1
             logger.info(f"✓ Search cache hit for similar product: {sku}")
-            cached_result = self.search_cache[cache_key].copy()
+            cached_result = cached_result.copy()
             # Adjust for this specific variant
             cached_result['sku'] = sku
             return self._adjust_cached_result_for_variant(cached_result, product)
@@ -291,18 +824,40 @@ class IntelligentImageProcessor:
         self.total_searches += 1
         if force_web:
             logger.info(f"Force web search enabled for SKU {sku}; bypassing caches")
-        result = await self.search_online_improved_async(product)
-        if result:
-            # Download and save the image
-            download_result = await self._download_and_save_image(
-                result.get('url', ''),
-                product,
-                result.get('confidence', 50),
-                result.get('source', ''),
-                result.get('description', ''),
-                result.get('search_query', ''),
-                result.get('image_source', '')
-            )
+            return await self._search_and_save(product, cache_key, force_web)
+        
+        # No await since the wait above, so no other search for this key has started
+        done = asyncio.get_running_loop().create_future()
+        self._searching[cache_key] = done
+        try:
+            return await self._search_and_save(product, cache_key, force_web)
+        finally:
+            del self._searching[cache_key]
+            done.set_result(None)
+    
+    async def _search_and_save(self, product: dict, cache_key: str, force_web: bool) -> dict:
+        """Search online, download the best match and record it in the search caches"""
+        sku = product.get('Variant_SKU', 'Unknown')
+        title = product.get('Title', '')
+        brand = product.get('Brand', '')
+        barcode = normalize_barcode(product.get('Variant_Barcode'))
+        
+        candidates = await self._search_candidates(product, fresh=force_web)
+        if candidates:
+            # Download and save the image, falling back to the tier's next candidates (already resolved, no API cost)
+            for result in candidates[:1 + DOWNLOAD_FALLBACK_CANDIDATES]:
+                download_result = await self._download_and_save_image(
+                    result.get('url', ''),
+                    product,
+                    result.get('confidence', 50),
+                    result.get('source', ''),
+                    result.get('description', ''),
+                    result.get('search_query', ''),
+                    result.get('image_source', '')
+                )
+                if download_result.get('success'):
+                    break
+                logger.info(f"Candidate {result.get('url', '')} failed for {sku}, trying next")
             
             if download_result.get('success'):
                 # Cache the result for similar products only if download succeeded
@@ -312,11 +867,19 @@ class IntelligentImageProcessor:
                 # Save to DB search cache for barcode+brand combo
                 if self.config.get('search', {}).get('use_db_cache', True):
                     try:
-                        self.db.save_search_cache(
+                        entry = (
                             str(barcode or ''), str(brand or ''), str(title or ''),
                             result.get('url', ''), float(result.get('confidence', 0) or 0),
                             result.get('source', '') or ''
                         )
+                        self._db_cache_memo[entry[:2]] = {
+                            'image_url': entry[3], 'confidence': entry[4], 'source': entry[5], 'title': entry[2]
+                        }
+                        self._db_cache_keys.add(search_cache_key(*entry[:2]))
+                        if self._pending_search_cache is not None:
+                            self._pending_search_cache.append(entry)
+                        else:
+                            self.db.save_search_cache(*entry)
                         logger.info(f"✓ Saved to DB search cache: {barcode} / {brand} → {result.get('url','')}")
                     except Exception as e:
                         logger.warning(f"Failed to save search cache: {e}")
@@ -329,14 +892,66 @@ class IntelligentImageProcessor:
                 logger.warning(f"✗ Failed to download image for {sku}")
                 return {'success': False, 'error': 'Download failed'}
         
-        logger.info(f"Cache efficiency: {self.cache_hits}/{self.total_searches} = {self.cache_hits/max(1,self.total_searches)*100:.1f}%")
+        logger.info(f"Cache efficiency: {self.cache_hits}/{self.total_searches} = {self.cache_hits/max(1,self.total_searches)*100:.1f}% "
+                    f"(DB cache memo hits: {self.db_cache_hits})")
         return {'success': False, 'error': 'No suitable image found'}
     
-    async def search_online_improved_async(self, product: dict) -> Optional[dict]:
-        """IMPROVED: Search online with retailer prioritization and variant awareness"""
+    async def _limited_serp_search(self, query: str, num_results: int) -> List[dict]:
+        if self._serp_limiter is None:
+            # Outside a batch (see __aenter__): the searcher's own async client, no shared rate limit
+            results = await self.searcher.search_google_images_async(None, query, num_results)
+        else:
+            async with self._serp_slots, self._serp_limiter:
+                results = await self.searcher.search_google_images_async(self._serp, query, num_results)
+        if results is None:
+            return []
+        # Answered queries (even empty ones) are kept so later runs don't pay for them again
+        if self.config.get('search', {}).get('use_serp_cache', True):
+            if self._pending_serp_cache is not None:
+                self._pending_serp_cache[(query, num_results)] = results
+            else:
+                await self._db_write(self.db.save_serp_cache, query, num_results, results)
+        return results
+    
+    async def _search_images_coalesced(self, query: str, num_results: int, fresh: bool = False) -> List[dict]:
+        """SERP image search where concurrent identical queries share one in-flight request.
+        Answers from the last SERP_CACHE_TTL_MS are reused unless fresh is set.
+        """
+        key = (query, num_results)
+        if not fresh and self.config.get('search', {}).get('use_serp_cache', True):
+            cached = (self._pending_serp_cache or {}).get(key)
+            if cached is None:
+                cached = self.db.get_serp_cache(query, num_results)
+            if cached is not None:
+                logger.debug(f"SERP cache hit: {query}")
+                return cached
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._limited_serp_search(query, num_results))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _f: self._inflight.pop(key, None))
+        else:
+            logger.debug(f"Joining in-flight search: {query}")
+        results = await asyncio.shield(future)
+        # Each caller gets its own dicts - ranking/evaluation annotate them in place
+        return [dict(r) for r in results]
+    
+    async def search_online_improved_async(self, product: dict, fresh: bool = False) -> Optional[dict]:
+        """IMPROVED: Search online with retailer prioritization and variant awareness.
+        
+        Every retailer x query variant within a tier is searched in parallel; the first result
+        reaching EARLY_ACCEPT_CONFIDENCE wins and cancels the rest, otherwise retailer priority
+        (enhanced query before barcode/brand) decides. fresh skips the SERP response cache.
+        """
+        candidates = await self._search_candidates(product, fresh)
+        return candidates[0] if candidates else None
+    
+    async def _search_candidates(self, product: dict, fresh: bool = False) -> List[dict]:
+        """search_online_improved_async's winning tier as a ranked list: the winner first, then the
+        tier's other retailer/query bests in priority order (distinct URLs)"""
         
         sku = product.get('Variant_SKU', 'Unknown')
-        strategies = self.learning.get_search_strategies()
+        variant_ctx = self._variant_context(product)
         
         # Search by retailer tiers for efficiency
         for tier_name, retailers in self.TRUSTED_RETAILERS.items():
@@ -349,43 +964,92 @@ class IntelligentImageProcessor:
             if not retailers:
                 continue
             
-            for site in retailers:
-                # Try enhanced query first (with variant details)
-                for use_enhanced in [True, False]:
-                    query = self.build_enhanced_search_query(product, site, use_enhanced)
-                    
-                    if not query:
-                        continue
-                    
-                    try:
-                        logger.debug(f"Searching {site} for {sku}: {query}")
-                        results = self.searcher.search_google_images(
-                            query, 
-                            num_results=self.config.get('search', {}).get('results_per_query', 3)
-                        )
-                        if results:
-                            # Re-rank with CLIP on thumbnails (GPU) to improve top-1
-                            results = await self._rank_results_with_clip(results, product)
-                            # Evaluate with variant awareness
-                            best = self.evaluate_results_with_variant_matching(results, product, site)
-                            if best:
-                                best['search_strategy'] = 'enhanced_variant' if use_enhanced else 'barcode_brand'
-                                best['search_query'] = query
-                                best['retailer_tier'] = tier_name
-                                logger.info(f"✓ Found on {site} ({tier_name}) for {sku}")
-                                logger.info(f"  URL: {best.get('url', 'NO URL')}")
-                                logger.info(f"  Confidence: {best.get('confidence', 0)}")
-                                return best
-                    
-                    except Exception as e:
-                        logger.error(f"Search error for {sku} on {site}: {str(e)}")
-                        continue
-                
+            tasks = [asyncio.ensure_future(self._search_site(product, (index, variant), site, tier_name, use_enhanced,
+                                                             fresh, variant_ctx))
+                     for index, site in enumerate(retailers)
+                     for variant, use_enhanced in enumerate((True, False))]
+            found: Dict[Tuple[int, int], Tuple[str, dict]] = {}
+            had_results = False
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    priority, site, best, query_had_results = await next_done
+                    had_results = had_results or query_had_results
+                    if best:
+                        found[priority] = (site, best)
+                        if best.get('confidence', 0) >= EARLY_ACCEPT_CONFIDENCE:
+                            break
+            finally:
+                for task in tasks:
+                    task.cancel()
+            
+            if found:
+                # Early accept if one crossed the threshold, otherwise keep retailer priority order
+                site, best = next((f for f in found.values() if f[1].get('confidence', 0) >= EARLY_ACCEPT_CONFIDENCE),
+                                  found[min(found)])
+                logger.info(f"✓ Found on {site} ({tier_name}) for {sku}")
+                logger.info(f"  URL: {best.get('url', 'NO URL')}")
+                logger.info(f"  Confidence: {best.get('confidence', 0)}")
+                candidates = [best]
+                seen = {best.get('url')}
+                for priority in sorted(found):
+                    other = found[priority][1]
+                    if other.get('url') not in seen:
+                        seen.add(other.get('url'))
+                        candidates.append(other)
+                return candidates
+            
             # If found something in tier1, don't search tier2/3
-            if tier_name == 'tier1' and results:
+            if tier_name == 'tier1' and had_results:
                 break
         
-        return None
+        return []
+    
+    async def _search_site(self, product: dict, priority: Tuple[int, int], site: str, tier_name: str,
+                           use_enhanced: bool, fresh: bool = False,
+                           ctx: Optional[VariantContext] = None) -> Tuple[Tuple[int, int], str, Optional[dict], bool]:
+        """Search one retailer with one query variant; returns (priority, site, best, got any results)"""
+        sku = product.get('Variant_SKU', 'Unknown')
+        query = self.build_enhanced_search_query(product, site, use_enhanced)
+        
+        if not query:
+            return priority, site, None, False
+        
+        try:
+            logger.debug(f"Searching {site} for {sku}: {query}")
+            results = await self._search_images_coalesced(
+                query, 
+                self.config.get('search', {}).get('results_per_query', 3),
+                fresh
+            )
+            if not results:
+                return priority, site, None, False
+            # Re-rank with CLIP on thumbnails (GPU) to improve top-1
+            results = await self._rank_results_with_clip(results, product)
+            # Evaluate with variant awareness
+            best = self.evaluate_results_with_variant_matching(results, product, site, ctx)
+            if best:
+                best['search_strategy'] = 'enhanced_variant' if use_enhanced else 'barcode_brand'
+                best['search_query'] = query
+                best['retailer_tier'] = tier_name
+            return priority, site, best, True
+        
+        except Exception as e:
+            logger.error(f"Search error for {sku} on {site}: {str(e)}")
+            return priority, site, None, False
+    
+    def _search_images_cached(self, query: str, num_results: int) -> List[dict]:
+        """Blocking SERP image search through the same persistent response cache as the async path"""
+        use_cache = self.config.get('search', {}).get('use_serp_cache', True)
+        if use_cache:
+            cached = self.db.get_serp_cache(query, num_results)
+            if cached is not None:
+                logger.debug(f"SERP cache hit: {query}")
+                return cached
+        results = self.searcher.search_google_images(query, num_results)
+        # An empty list can also mean a failed request - only non-empty answers are kept here
+        if use_cache and results:
+            self.db.save_serp_cache(query, num_results, results)
+        return results
     
     def search_online(self, product: dict) -> Optional[dict]:
         """Fallback to original search if improved search fails"""
@@ -404,7 +1068,7 @@ class IntelligentImageProcessor:
                     continue
                 
                 try:
-                    results = self.searcher.search_google_images(
+                    results = self._search_images_cached(
                         query, 
                         num_results=self.config.get('search', {}).get('results_per_query', 3)
                     )
@@ -461,107 +1125,108 @@ class IntelligentImageProcessor:
         
         return query
     
-    def evaluate_results_with_variant_matching(self, results: List[dict], product: dict, retailer: str) -> Optional[dict]:
-        """IMPROVED: Evaluate search results with variant awareness"""
+    @staticmethod
+    def _variant_context(product: dict) -> VariantContext:
+        """Lowercase and parse the product fields used by evaluate_results_with_variant_matching, once per product"""
+        title = (product.get('Title', '') or '').lower()
+        variant = (product.get('Variant_Title', '') or '').lower()
+        variant_option = (product.get('Variant_option', '') or '').lower()
+        return VariantContext(
+            title=title,
+            brand=(product.get('Brand', '') or '').lower(),
+            sku=product.get('Variant_SKU', ''),
+            variant=variant,
+            variant_option=variant_option,
+            barcode=normalize_barcode(product.get('Variant_Barcode')) or '',
+            # Critical variants the product names (any other one in a result title contradicts it)
+            wanted_variants=frozenset(_CRITICAL_VARIANTS_RE.findall(f"{variant} {variant_option}")),
+            product_size=_extract_size(title)
+        )
+    
+    def evaluate_results_with_variant_matching(self, results: List[dict], product: dict, retailer: str,
+                                               ctx: Optional[VariantContext] = None) -> Optional[dict]:
+        """IMPROVED: Evaluate search results with variant awareness (ctx: the product's _variant_context, if already built)"""
         
         if not results:
             return None
         
-        title = product.get('Title', '').lower()
-        brand = (product.get('Brand', '') or '').lower()
-        sku = product.get('Variant_SKU', '')
-        variant = (product.get('Variant_Title', '') or '').lower()
-        variant_option = (product.get('Variant_option', '') or '').lower()
-        barcode = str(product.get('Variant_Barcode', ''))
+        ctx = ctx or self._variant_context(product)
+        brand, sku, variant, variant_option, barcode = ctx.brand, ctx.sku, ctx.variant, ctx.variant_option, ctx.barcode
+        wanted_variants, product_size = ctx.wanted_variants, ctx.product_size
         size_tolerance_pct = self.config.get('validation', {}).get('size_tolerance_percent', 5)
         
-        best_result = None
-        best_score = 0
+        tier_bonus = TIER_BONUSES.get(self._retailer_tier.get(retailer), 0)
+        match_barcode = len(barcode) > 6
         
-        for result in results:
-            score = 0
-            result_title = result.get('title', '').lower()
-            result_snippet = result.get('snippet', '').lower()
-            source = result.get('source', '').lower()
-            
-            # Exact barcode match is gold standard
-            if len(barcode) > 6 and barcode in result_title + result_snippet:
-                score += 40
-            
-            # Brand matching (30% weight)
-            if brand:
-                if brand in result_title:
-                    score += 25
-                elif brand in source:
-                    score += 15
-            
-            # CRITICAL: Variant matching (40% weight)
-            variant_score = 0
-            if variant or variant_option:
-                # Check for variant mismatch (penalty)
-                critical_variants = ['vetkoek', 'flapjack', 'pancake', 'waffle', 'scone', 'muffin']
-                for cv in critical_variants:
-                    if cv in variant.lower() or cv in variant_option.lower():
-                        if cv in result_title:
-                            variant_score += 30  # Correct variant
-                        else:
-                            # Check if wrong variant present
-                            for other_cv in critical_variants:
-                                if other_cv != cv and other_cv in result_title:
-                                    variant_score -= 40  # Wrong variant - heavy penalty
-                                    logger.warning(f"Variant mismatch for {sku}: wanted '{cv}', got '{other_cv}'")
-                                    break
-                
-                # General variant matching
-                if variant and variant in result_title:
-                    variant_score += 20
-                if variant_option and variant_option != variant and variant_option in result_title:
-                    variant_score += 10
-            
-            score += variant_score
-            
-            # Size matching with tolerance (15% weight)
-            product_size = self._extract_size_value(title)
-            result_size = self._extract_size_value(result_title)
-            if product_size and result_size:
-                # Percent difference
-                diff_pct = abs(product_size - result_size) / product_size * 100
-                if diff_pct <= size_tolerance_pct:
-                    score += 15
-                else:
-                    score -= 10  # Size mismatch penalty
-            
-            # Retailer trust bonus (15% weight)
-            tier_bonuses = {'tier1': 15, 'tier2': 10, 'tier3': 5}
-            for tier, retailers in self.TRUSTED_RETAILERS.items():
-                if retailer in retailers:
-                    score += tier_bonuses.get(tier, 0)
-                    break
+        # One column per candidate field; every signal below scores all candidates at once
+        raw_titles = np.array([r.get('title', '') for r in results], dtype=str)
+        snippets = np.array([r.get('snippet', '') for r in results], dtype=str)
+        titles = np.char.lower(raw_titles)
+        sources = [r.get('source', '').lower() for r in results]
+        score = np.full(len(results), float(tier_bonus))  # Retailer trust bonus (15% weight)
+        
+        # Exact barcode match is gold standard (digits - no need to lowercase or join title and snippet)
+        if match_barcode:
+            score += ((np.char.find(raw_titles, barcode) >= 0) | (np.char.find(snippets, barcode) >= 0)) * 40
+        
+        # Brand matching (30% weight)
+        if brand:
+            score += np.where(np.char.find(titles, brand) >= 0, 25,
+                              np.where(np.char.find(np.array(sources, dtype=str), brand) >= 0, 15, 0))
+        
+        # CRITICAL: Variant matching (40% weight)
+        variant_score = np.zeros(len(results))
+        if variant or variant_option:
+            # Check for variant mismatch (penalty)
+            if wanted_variants:
+                present = {cv: np.char.find(titles, cv) >= 0 for cv in CRITICAL_VARIANTS}
+                for cv in wanted_variants:
+                    others = [o for o in CRITICAL_VARIANTS if o != cv]
+                    mismatch = ~present[cv] & np.logical_or.reduce([present[o] for o in others])
+                    variant_score += np.where(present[cv], 30, np.where(mismatch, -40, 0))  # Wrong variant - heavy penalty
+                    for i in np.flatnonzero(mismatch):
+                        other_cv = next(o for o in others if present[o][i])
+                        logger.warning(f"Variant mismatch for {sku}: wanted '{cv}', got '{other_cv}'")
             
-            # Apply learning adjustments
-            adjustments = self.confidence_adjustments.get(source, {})
-            if 'confidence_modifier' in adjustments:
-                score += adjustments['confidence_modifier']
+            # General variant matching
+            if variant:
+                variant_score += (np.char.find(titles, variant) >= 0) * 20
+            if variant_option and variant_option != variant:
+                variant_score += (np.char.find(titles, variant_option) >= 0) * 10
+        
+        score += variant_score
+        
+        # Size matching with tolerance (15% weight); NaN where a title carries no size
+        if product_size:
+            result_sizes = np.array([_extract_size(t) or np.nan for t in titles.tolist()])
+            diff_pct = np.abs(product_size - result_sizes) / product_size * 100
+            score += np.where(np.isnan(diff_pct), 0, np.where(diff_pct <= size_tolerance_pct, 15, -10))
+        
+        # Apply learning adjustments
+        score += [self.confidence_adjustments.get(source, {}).get('confidence_modifier', 0) for source in sources]
+        
+        # Best = first highest-scoring candidate, if any scored above zero
+        best_index = int(np.argmax(score))
+        best_score = float(score[best_index])
+        best_result = None
+        if best_score > 0:
+            result = results[best_index]
+            raw_title = result.get('title', '')
+            snippet = result.get('snippet', '')
+            # Enhanced description from search result
+            search_description = f"{raw_title} | {snippet}" if snippet else raw_title
             
-            # Track best result
-            if score > best_score:
-                best_score = score
-                # Enhanced description from search result
-                search_description = result.get('title', '')
-                if result.get('snippet'):
-                    search_description += f" | {result.get('snippet', '')}"
-                
-                best_result = {
-                    'url': result.get('original') or result.get('link') or result.get('thumbnail'),  # CRITICAL FIX: Include URL!
-                    'title': result.get('title', ''),
-                    'source': result.get('source', ''),
-                    'snippet': result.get('snippet', ''),
-                    'description': search_description,  # ENHANCED: Full product description from search
-                    'confidence': min(max(score, 0), 100),
-                    'sku': sku,
-                    'variant_match_score': variant_score,
-                    'image_source': result.get('source', '')
-                }
+            best_result = {
+                'url': result.get('original') or result.get('link') or result.get('thumbnail'),  # CRITICAL FIX: Include URL!
+                'title': raw_title,
+                'source': result.get('source', ''),
+                'snippet': snippet,
+                'description': search_description,  # ENHANCED: Full product description from search
+                'confidence': min(max(best_score, 0), 100),
+                'sku': sku,
+                'variant_match_score': float(variant_score[best_index]),
+                'image_source': result.get('source', '')
+            }
         
         # Reject if variant mismatch is too severe
         if best_result and best_result.get('variant_match_score', 0) < -20:
@@ -570,26 +1235,6 @@ class IntelligentImageProcessor:
         
         return best_result if best_score > 35 else None
 
-    def _extract_size_value(self, text: str) -> Optional[float]:
-        """Extract normalized size value in grams or milliliters from text.
-        g/kg -> grams, ml/l -> milliliters (treat ml and g similarly for scoring).
-        """
-        import re
-        match = re.search(r"(\d+(?:\.\d+)?)\s*(kg|g|l|ml|L)", text)
-        if not match:
-            return None
-        value = float(match.group(1))
-        unit = match.group(2).lower()
-        if unit == 'kg':
-            return value * 1000.0
-        if unit == 'l':
-            return value * 1000.0
-        if unit == 'ml':
-            return value
-        if unit == 'g':
-            return value
-        return None
-
     async def _rank_results_with_clip(self, results: List[dict], product: dict) -> List[dict]:
         """Download thumbnails and use CLIP to re-rank candidates (best first)."""
         try:
@@ -608,24 +1253,38 @@ class IntelligentImageProcessor:
             url_to_bytes = await downloader.download_batch(urls, {
                 'network': {
                     'concurrency': self.config.get('network', {}).get('concurrency', 10),
-                    'timeout': self.config.get('network', {}).get('timeout', 15)
+                    'timeout': self.config.get('network', {}).get('timeout', 15),
+                    'max_download_bytes': self.downloader.max_bytes
                 }
-            })
-            thumbs: List[bytes] = [url_to_bytes.get(u) for u in urls if url_to_bytes.get(u)]
+            }, session=self._session, client=self._http2_client())
+            # Keep each thumbnail's result index - failed downloads must not shift the mapping
+            thumbs: List[bytes] = []
+            thumb_results: List[int] = []
+            for u, result_idx in zip(urls, idx_map):
+                body = url_to_bytes.get(u)
+                if body:
+                    thumbs.append(body)
+                    thumb_results.append(result_idx)
             if not thumbs:
                 return results
 
-            # Rank indices by CLIP
-            order = self.clip.rank_thumbnails(product, thumbs)
+            # Decode in parallel, then rank indices by CLIP - all off the event loop
+            if self._decode_pool is None:
+                self._decode_pool = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.config.get('clip', {}).get('decode_workers', min(8, os.cpu_count() or 1))
+                )
+            loop = asyncio.get_running_loop()
+            tensors = await asyncio.gather(*[
+                loop.run_in_executor(self._decode_pool, self.clip.preprocess_bytes, b) for b in thumbs
+            ])
+            order = await loop.run_in_executor(self._decode_pool, self.clip.rank_preprocessed, product, tensors,
+                                               self.config.get('clip', {}).get('rank_top_k'))
             logger.info(f"CLIP thumbnail re-ranking: ranked {len(order)} candidates on {getattr(self.clip, 'device', 'gpu')} device")
             if not order:
                 return results
 
             # Map back to original results in new order
-            ordered_results: List[dict] = []
-            for ord_idx in order:
-                if 0 <= ord_idx < len(idx_map):
-                    ordered_results.append(results[idx_map[ord_idx]])
+            ordered_results: List[dict] = [results[thumb_results[ord_idx]] for ord_idx in order]
             # Append any missing (failed downloads)
             if len(ordered_results) < len(results):
                 used = set(id(x) for x in ordered_results)
@@ -646,6 +1305,8 @@ class IntelligentImageProcessor:
         title = product.get('Title', '').lower()
         brand = (product.get('Brand', '') or '').lower()
         sku = product.get('Variant_SKU', '')
+        # Product tokens are the same for every candidate
+        title_words = frozenset(title.split())
         
         best_result = None
         best_score = 0
@@ -662,18 +1323,12 @@ class IntelligentImageProcessor:
                 score += 10
             
             # Title similarity
-            title_words = set(title.split())
-            result_words = set(result_title.split())
-            common_words = title_words.intersection(result_words)
-            if len(title_words) > 0:
-                score += (len(common_words) / len(title_words)) * 30
+            if title_words:
+                score += (len(title_words.intersection(result_title.split())) / len(title_words)) * 30
             
             # Source reliability
-            trusted_sources = ['shoprite', 'checkers', 'pnp', 'makro', 'takealot', 'game']
-            for trusted in trusted_sources:
-                if trusted in source:
-                    score += 20
-                    break
+            if _FALLBACK_TRUSTED_RE.search(source):
+                score += 20
             
             # Apply learning adjustments
             adjustments = self.confidence_adjustments.get(source, {})
@@ -689,7 +1344,7 @@ class IntelligentImageProcessor:
         
         return best_result if best_score > 30 else None
     
-    async def _search_broad(self, session: aiohttp.ClientSession, product: Dict) -> Optional[Dict]:
+    async def _search_broad(self, product: Dict) -> Optional[Dict]:
         """Broader search as fallback"""
         
         brand = product.get('Brand', '')
@@ -698,104 +1353,145 @@ class IntelligentImageProcessor:
         # USE EXACT PRODUCT TITLE ONLY - NO BARCODE
         query = title  # Use the exact product name as-is
         
-        params = {
-            'engine': 'google_images',
-            'q': query,
-            'api_key': self.api_key,
-            'num': 15,
-            'gl': 'za',
-            'hl': 'en'
-        }
-        
         try:
-            url = f"https://serpapi.com/search?{urlencode(params)}"
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    best_match = None
-                    best_confidence = 0
-                    
-                    for result in data.get('images_results', []):
-                        confidence = self._calculate_confidence(result, product, 'general')
-                        
-                        if confidence > best_confidence:
-                            best_confidence = confidence
-                            best_match = {
-                                'url': result.get('original') or result.get('link'),
-                                'confidence': confidence,
-                                'source': result.get('source', 'unknown'),
-                                'description': '',  # Description scraping removed to save API credits  
-                                'search_query': query,
-                                'image_source': result.get('source', 'unknown')
-                            }
-                    
-                    if best_match and best_confidence >= 30:
-                        return best_match
-                        
+            # Same cached, coalesced and rate-limited path as the retailer searches
+            results = await self._search_images_coalesced(query, 15)
+            if results:
+                # All results scored in one vectorized pass; the best one wins if it clears the bar
+                confidences = self._calculate_confidences(results, self._scoring_context(product), 'general')
+                best = int(np.argmax(confidences))
+                if confidences[best] >= 30:
+                    result = results[best]
+                    return {
+                        'url': result.get('original') or result.get('link'),
+                        'confidence': float(confidences[best]),
+                        'source': result.get('source', 'unknown'),
+                        'description': '',  # Description scraping removed to save API credits  
+                        'search_query': query,
+                        'image_source': result.get('source', 'unknown')
+                    }
+                
         except Exception as e:
             logger.error(f"Broad search error: {str(e)}")
         
         return None
     
-    def _calculate_confidence(self, result: dict, product: Dict, retailer: str) -> float:
-        """Calculate confidence with learning adjustments"""
-        
-        confidence = 0.0
-        
-        # Get product details
-        barcode = str(product.get('Variant_Barcode', '')).lower()
+    @staticmethod
+    def _scoring_context(product: Dict) -> ScoringContext:
+        """Lowercase and tokenize the product fields used by _calculate_confidences, once per product"""
         brand = str(product.get('Brand', '')).lower()
         title = str(product.get('Title', '')).lower()
+        brand_variants = _brand_variants(brand)
+        title_tokens = frozenset(w for w in title.split() if len(w) > 2)
+        barcode = (normalize_barcode(product.get('Variant_Barcode')) or '').lower()
+        return ScoringContext(
+            brand=brand,
+            brand_variants=brand_variants,
+            title_tokens=title_tokens,
+            barcode=barcode,
+            patterns=tuple(brand_variants | title_tokens | ({barcode} if barcode else set()))
+        )
+    
+    def _calculate_confidence(self, result: dict, product: Dict, retailer: str) -> float:
+        """Confidence for a single result (prefer _calculate_confidences with a shared _scoring_context)"""
+        return float(self._calculate_confidences([result], self._scoring_context(product), retailer)[0])
+    
+    def _calculate_confidences(self, results: List[dict], ctx: ScoringContext, retailer: str) -> np.ndarray:
+        """Calculate confidence with learning adjustments for every result at once"""
         
-        # Get result details
-        img_title = result.get('title', '').lower()
-        img_snippet = result.get('snippet', '').lower()
-        img_url = result.get('link', '').lower()
-        
-        combined_text = f"{img_title} {img_snippet} {img_url}"
+        # One pass over each result text collects every product pattern it contains; the signals
+        # below are then set lookups (per-pattern np.char.find calls cost more at SERP result counts)
+        texts = (f"{r.get('title', '')} {r.get('snippet', '')} {r.get('link', '')}".lower() for r in results)
+        hits = [{p for p in ctx.patterns if p in text} for text in texts]
+        confidence = np.zeros(len(hits))
         
-        # CRITICAL: Brand match (most important for differentiation)
-        if brand:
-            # Handle special brand formats
-            brand_variants = [
-                brand,
-                brand.replace(' ', ''),
-                brand.replace(' ', '-'),
-                brand.replace("'", ""),  # Handle Good 'n Gold
-                brand.replace("'n", "n")
-            ]
-            
-            if any(variant in combined_text for variant in brand_variants):
-                confidence += 35
-                logger.debug(f"    + Brand match: {brand}")
-            else:
-                # No brand match is a strong negative
-                confidence -= 40
-                logger.debug(f"    - No brand match")
+        # CRITICAL: Brand match (most important for differentiation) - no brand match is a strong negative
+        if ctx.brand:
+            confidence += np.where([not ctx.brand_variants.isdisjoint(h) for h in hits], 35, -40)
         
         # Barcode match (very strong signal)
-        if barcode and barcode != 'nan' and barcode in combined_text:
-            confidence += 40
-            logger.debug(f"    + Barcode match: {barcode}")
+        if ctx.barcode:
+            confidence += np.array([ctx.barcode in h for h in hits]) * 40
         
         # Retailer trust
-        trusted_retailers = ['checkers', 'shoprite', 'pnp', 'makro', 'woolworths']
-        if any(r in retailer for r in trusted_retailers):
+        if any(r in retailer for r in TRUSTED_RETAILERS):
             confidence += 15
         
         # Title word matching
-        title_words = [w for w in title.split() if len(w) > 2]
-        matches = sum(1 for w in title_words if w in combined_text)
-        if title_words:
-            match_ratio = matches / len(title_words)
-            confidence += match_ratio * 20
+        if ctx.title_tokens:
+            matches = np.array([len(ctx.title_tokens & h) for h in hits])
+            confidence += matches / len(ctx.title_tokens) * 20
         
         # Apply learning adjustments
-        if retailer in self.confidence_adjustments['source_multipliers']:
-            confidence *= self.confidence_adjustments['source_multipliers'][retailer]
+        multiplier = self.confidence_adjustments['source_multipliers'].get(retailer.lower())
+        if multiplier is not None:
+            confidence *= multiplier
         
-        return min(100, max(0, confidence))
+        return np.clip(confidence, 0, 100)
+    
+    def _ensure_dir(self, path: Path) -> None:
+        """mkdir -p once per directory for the lifetime of the processor"""
+        if path not in self._ensured_dirs:
+            path.mkdir(parents=True, exist_ok=True)
+            self._ensured_dirs.add(path)
+    
+    def _blob_path(self, sha256: str, suffix: str = '') -> Path:
+        return self.blobs_dir / sha256[:2] / f"{sha256}{suffix}"
+    
+    async def _download_with_cache(self, url: str) -> Optional[bytes]:
+        """Download an image, revalidating a previously fetched copy with If-None-Match/If-Modified-Since"""
+        entry = (self._pending_image_cache or {}).get(url) or self.db.get_image_cache(url)
+        blob = self._blob_path(entry['sha256']) if entry else None
+        if blob is not None and not blob.is_file():
+            entry = blob = None
+        
+        status, body, etag, last_modified = await self.downloader.download_image_conditional(
+            url, session=self._session,
+            etag=entry['etag'] if entry else None,
+            last_modified=entry['last_modified'] if entry else None
+        )
+        if status == 304 and blob is not None:
+            logger.info(f"Image not modified, using cached copy: {url}")
+            return await asyncio.get_running_loop().run_in_executor(None, _read_blob, blob)
+        
+        # Keep the bytes only when the server gave us something to revalidate against
+        if body and (etag or last_modified):
+            sha256 = hashlib.sha256(body).hexdigest()
+            await asyncio.get_running_loop().run_in_executor(None, _write_blob, self._blob_path(sha256), body)
+            if self._pending_image_cache is not None:
+                self._pending_image_cache[url] = {'sha256': sha256, 'etag': etag, 'last_modified': last_modified}
+            else:
+                await self._db_write(self.db.save_image_cache, url, sha256, etag, last_modified)
+        return body
+    
+    async def _validate_and_optimise(self, image_bytes: bytes) -> Tuple[bool, Optional[bytes], Path]:
+        """Validate + optimise in the process pool, memoized on disk by source sha256 and output settings.
+        Also returns the content-addressed blob path, which holds the optimized bytes once they exist.
+        JPEGs that already meet the output size and budget skip the pool and are kept verbatim.
+        """
+        size = self.config['image']['size']
+        max_kb = self.config['image']['max_kb']
+        sha256 = hashlib.sha256(image_bytes).hexdigest()
+        if size >= 150 and not img_utils.needs_reencode(image_bytes, size, max_kb):
+            # Already a finished output: keep it verbatim (linked from the raw blob when one was stored)
+            return True, image_bytes, self._blob_path(sha256)
+        cached = self._blob_path(sha256, f".{size}-{max_kb}kb")
+        loop = asyncio.get_running_loop()
+        try:
+            # Only valid images are ever cached
+            return True, await loop.run_in_executor(None, _read_blob, cached), cached
+        except OSError:
+            pass
+        
+        if self._img_pool is None:
+            self._img_pool = concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                                                    initializer=img_utils.warm_up)
+        valid, optimized = await loop.run_in_executor(
+            self._img_pool, _validate_and_optimise, image_bytes, size, max_kb
+        )
+        if optimized:
+            await loop.run_in_executor(None, _write_blob, cached, optimized)
+        return valid, optimized, cached
     
     async def _download_and_save_image(self, url: str, product: Dict, 
                                       confidence: float, source: str, description: str = '', 
@@ -805,71 +1501,32 @@ class IntelligentImageProcessor:
         try:
             logger.info(f"Starting download from URL: {url}")
             
-            # Download image using the downloader; try async first
-            image_bytes = await self.downloader.download_image(url)
-            # Fallback: try batch downloader (same headers/session path)
-            if not image_bytes:
-                try:
-                    url_to_bytes = await downloader.download_batch([url], {
-                        'network': {
-                            'concurrency': self.config.get('network', {}).get('concurrency', 10),
-                            'timeout': self.config.get('network', {}).get('timeout', 15)
-                        }
-                    })
-                    image_bytes = url_to_bytes.get(url)
-                except Exception as e:
-                    logger.warning(f"Batch download fallback failed: {e}")
-            # Final fallback: sync request in a thread to avoid loop issues
+            # Download image using the downloader; try async first (conditional GET against the cached copy)
+            image_bytes = await self._download_with_cache(url)
+            # One retry on the shared connection pool (the HTTP/2 client when network.http2_downloads is set)
             if not image_bytes:
-                import requests
-                from concurrent.futures import ThreadPoolExecutor
-                def _sync_fetch(u: str) -> bytes:
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0 Safari/537.36',
-                        'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8'
-                    }
-                    try:
-                        from urllib.parse import urlparse as _p
-                        netloc = _p(u).netloc
-                        if netloc:
-                            headers['Referer'] = f"https://{netloc}"
-                    except Exception:
-                        pass
-                    r = requests.get(u, headers=headers, timeout=15)
-                    if r.status_code == 200:
-                        return r.content
-                    return b''
-                with ThreadPoolExecutor(max_workers=1) as ex:
-                    fut = ex.submit(_sync_fetch, url)
-                    try:
-                        image_bytes = fut.result(timeout=20)
-                    except Exception:
-                        image_bytes = None
-                
+                client = self._http2_client()
+                if client is not None:
+                    image_bytes = await downloader.fetch_image_http2(
+                        client, url, max_retries=0, max_bytes=self.downloader.max_bytes
+                    )
+                else:
+                    image_bytes = await downloader.fetch_image(
+                        self._session or await self.downloader._get_session(), url,
+                        max_retries=0, max_bytes=self.downloader.max_bytes
+                    )
             if not image_bytes:
                 logger.error(f"No image bytes returned from download")
                 return {'success': False, 'path': None}
             
             logger.info(f"Downloaded {len(image_bytes)} bytes")
                 
-            # Validate image using src module
-            try:
-                from src import img_utils
-                if not img_utils.is_valid_image(image_bytes, min_size=150):
-                    logger.error(f"Image validation failed")
-                    return {'success': False, 'path': None}
-                logger.info(f"Image validation passed")
-            except ImportError:
-                logger.warning("img_utils not available, skipping validation")
-                # Continue without validation
-                
-            # Optimize image
-            optimized = img_utils.optimise(
-                image_bytes,
-                size=self.config['image']['size'],
-                fmt='JPEG',
-                max_kb=self.config['image']['max_kb']
-            )
+            # Validate and optimize image off the event loop (reusing an earlier result for identical source bytes)
+            valid, optimized, blob = await self._validate_and_optimise(image_bytes)
+            if not valid:
+                logger.error(f"Image validation failed")
+                return {'success': False, 'path': None}
+            logger.info(f"Image validation passed")
             
             if not optimized:
                 return {'success': False, 'path': None}
@@ -894,20 +1551,19 @@ class IntelligentImageProcessor:
             sku = product.get('Variant_SKU', 'Unknown')
             
             brand_folder = destination_dir
-            brand_folder.mkdir(parents=True, exist_ok=True)
+            self._ensure_dir(brand_folder)
             
             # CRITICAL FIX: Always include SKU in filename to guarantee uniqueness
-            safe_title = self.sanitize_filename(title)[:100]  # Limit title length
+            safe_title = self.sanitize_filename(title)
             safe_sku = self.sanitize_filename(sku)
             # Format: Title_SKU.jpg - SKU guarantees uniqueness even for variants
             filename = f"{safe_title}_{safe_sku}.jpg"
             output_path = brand_folder / filename
             
-            with open(output_path, 'wb') as f:
-                f.write(optimized)
-            
-            # Save metadata 
-            metadata = {
+            # Save metadata - only when it adds something the DB row doesn't already hold
+            metadata = None
+            if description or (image_source and image_source != url):
+                metadata = {
                     'sku': sku,
                     'title': title,
                     'brand': brand,
@@ -920,9 +1576,10 @@ class IntelligentImageProcessor:
                     'image_url': url  # Original image URL
                 }
             
-            meta_path = output_path.with_suffix('.json')
-            with open(meta_path, 'w') as f:
-                json.dump(metadata, f, indent=2)
+            # Blocking file writes go to a worker thread so the event loop keeps serving other products;
+            # identical source images across SKUs share one inode via the blob store
+            await asyncio.get_running_loop().run_in_executor(None, _write_pair, output_path, optimized, metadata, blob)
+            self._index_file_moved(None, output_path)
             
             # Update database with enhanced metadata
             logger.info(f"Updating database for SKU: {product['Variant_SKU']}")
@@ -930,7 +1587,7 @@ class IntelligentImageProcessor:
             logger.info(f"  Status: {status}")
             
             try:
-                self.db.update_product_image(
+                update = (
                     product['Variant_SKU'],
                     str(output_path),
                     confidence,
@@ -940,7 +1597,12 @@ class IntelligentImageProcessor:
                     search_query,
                     image_source if image_source else url
                 )
-                logger.info(f"Database updated successfully for {product['Variant_SKU']}")
+                if self._pending_updates is not None:
+                    # Inside process_batch: written with the rest of the batch
+                    self._pending_updates.append(self.db.product_image_row(*update))
+                else:
+                    await self._db_write(self.db.update_product_image, *update)
+                    logger.info(f"Database updated successfully for {product['Variant_SKU']}")
             except Exception as db_err:
                 logger.error(f"Database update failed for {product['Variant_SKU']}: {str(db_err)}")
                 raise
@@ -964,96 +1626,212 @@ class IntelligentImageProcessor:
             'validated': 0
         }
         
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        self._refresh_confidence_adjustments()
+        self.learning.reload_if_changed()
         
-        try:
-            loop.run_until_complete(
-                self._process_batch_async(products, results, progress_callback)
-            )
-            
-            # After processing, run CLIP validation on successful images
-            if results['success'] > 0:
-                self._run_clip_validation(products, results)
-                
-        finally:
-            loop.close()
+        # CLIP validation runs inside the batch, alongside the downloads
+        self.run(self._process_batch_async(products, results, progress_callback))
         
         return results
     
     async def _process_batch_async(self, products: List[dict], results: dict, progress_callback=None):
-        """Async processing of product batch"""
+        """Async processing of product batch - products run concurrently, bounded by a semaphore"""
         
         total_products = len(products)
+        sem = asyncio.Semaphore(max(1, self.config.get('network', {}).get('product_concurrency', 8)))
+        completed = 0
         
-        for i, product in enumerate(products):
-            try:
-                if progress_callback:
-                    progress_callback(i + 1, total_products, f"Processing {product.get('Variant_SKU', 'Unknown')}")
-                
-                # Search for image
-                image_result = await self.search_product_image(product)
+        # The callback (UI state, DB lookups) runs on its own thread so it never stalls the event loop
+        progress_q: Optional[queue.Queue] = None
+        if progress_callback:
+            progress_q = queue.Queue()
+            
+            def _notify():
+                while True:
+                    item = progress_q.get()
+                    if item is None:
+                        return
+                    try:
+                        progress_callback(*item)
+                    except Exception as e:
+                        logger.warning(f"Progress callback failed: {e}")
+            
+            notifier = threading.Thread(target=_notify, name='batch-progress', daemon=True)
+            notifier.start()
+        
+        # Saved images are CLIP-validated on a worker thread while the rest of the batch downloads
+        clip_q: queue.Queue = queue.Queue()
+        clip_worker = threading.Thread(target=self._clip_worker, args=(clip_q, results),
+                                       name='clip-validation', daemon=True)
+        clip_worker.start()
+        unqueued: List[dict] = []
+        
+        async def _one(product: dict):
+            nonlocal completed
+            async with sem:
+                try:
+                    # Search for image
+                    image_result = await self.search_product_image(product)
+                    
+                    if image_result and image_result.get('success'):
+                        results['success'] += 1
+                        if image_result.get('path'):
+                            product['downloaded_image_path'] = image_result['path']
+                            clip_q.put_nowait(product)
+                        else:
+                            unqueued.append(product)
+                    else:
+                        unqueued.append(product)
+                        results['failed'] += 1
+                        if image_result and image_result.get('error'):
+                            results['errors'].append(f"SKU {product.get('Variant_SKU')}: {image_result['error']}")
+                        # Avoid burning API repeatedly: mark as not_found for now (written with the batch)
+                        self._pending_not_found.append(product.get('Variant_SKU'))
                 
-                if image_result and image_result.get('success'):
-                    results['success'] += 1
-                else:
+                except Exception as e:
                     results['failed'] += 1
-                    if image_result and image_result.get('error'):
-                        results['errors'].append(f"SKU {product.get('Variant_SKU')}: {image_result['error']}")
-                    # Avoid burning API repeatedly: mark as not_found for now
-                    try:
-                        self.db.mark_not_found(product.get('Variant_SKU'))
-                    except Exception:
-                        pass
+                    results['errors'].append(f"SKU {product.get('Variant_SKU')}: {str(e)}")
+                    logger.error(f"Error processing product {product.get('Variant_SKU')}: {str(e)}")
+                    self._pending_not_found.append(product.get('Variant_SKU'))
+                    unqueued.append(product)
                 
-            except Exception as e:
-                results['failed'] += 1
-                results['errors'].append(f"SKU {product.get('Variant_SKU')}: {str(e)}")
-                logger.error(f"Error processing product {product.get('Variant_SKU')}: {str(e)}")
-                try:
-                    self.db.mark_not_found(product.get('Variant_SKU'))
-                except Exception:
-                    pass
+                completed += 1
+                if progress_q is not None:
+                    progress_q.put_nowait((completed, total_products, f"Processing {product.get('Variant_SKU', 'Unknown')}"))
+        
+        # Existence checks for the whole batch are answered from one listing per folder
+        self._stat_cache = self._prefetch_local_files(products)
+        self._pending_updates, self._pending_search_cache, self._pending_not_found = [], [], []
+        self._pending_serp_cache, self._pending_image_cache = {}, {}
+        try:
+            # One keep-alive HTTP session shared by every product in the batch
+            async with self:
+                await asyncio.gather(*(_one(product) for product in products))
+        finally:
+            self._stat_cache = None
+            # The batched writes (on the DB writer thread, after any writes still queued there) and the
+            # wait for CLIP validation run off the event loop
+            await self._db_write(self._flush_pending_writes)
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._run_clip_validation, unqueued if results['success'] > 0 else [], clip_q, clip_worker
+            )
+            if progress_q is not None:
+                # Deliver the remaining notifications before the batch returns
+                progress_q.put(None)
+                await asyncio.to_thread(notifier.join)
+            await asyncio.to_thread(self._prune_blob_cache)
     
-    def _run_clip_validation(self, products: List[dict], results: dict):
-        """Run CLIP validation on processed images"""
+    def _prune_blob_cache(self) -> None:
+        """Keep the blob store under cache.blob_max_mb (checked at most every BLOB_PRUNE_SECONDS)"""
+        now = time.monotonic()
+        if self._blobs_pruned_at is not None and now - self._blobs_pruned_at < BLOB_PRUNE_SECONDS:
+            return
+        self._blobs_pruned_at = now
         try:
-            # Import CLIP validator (lazy load)
-            from clip_validator import CLIPValidator
-            
-            # Get products that were successfully processed
-            products_to_validate = []
-            for product in products:
-                sku = product.get('Variant_SKU')
-                # Check if image was downloaded
-                cursor = self.db.conn.cursor()
+            removed = _prune_blobs(self.blobs_dir, self._blob_max_bytes)
+        except OSError as e:
+            logger.warning(f"Image cache pruning failed: {e}")
+            return
+        if removed:
+            logger.info(f"Pruned {removed} least recently used blobs from {self.blobs_dir}")
+    
+    def _flush_pending_writes(self):
+        """Write the batch's buffered not-found marks, product updates and cache entries, one commit each"""
+        not_found, self._pending_not_found = self._pending_not_found or [], None
+        updates, self._pending_updates = self._pending_updates or [], None
+        entries, self._pending_search_cache = self._pending_search_cache or [], None
+        serp, self._pending_serp_cache = self._pending_serp_cache or {}, None
+        images, self._pending_image_cache = self._pending_image_cache or {}, None
+        # Not-found marks first, so a product that was also saved ends with its saved status
+        self.db.mark_not_found_many(not_found)
+        try:
+            self.db.update_product_images(updates)
+        except Exception as e:
+            logger.error(f"Batched product update failed: {e}")
+        try:
+            self.db.save_search_caches(entries)
+            self.db.save_serp_caches(serp)
+            self.db.save_image_caches([(url, v['sha256'], v['etag'], v['last_modified']) for url, v in images.items()])
+        except Exception as e:
+            logger.warning(f"Failed to save search cache: {e}")
+    
+    def _run_clip_validation(self, products: List[dict], clip_q: queue.Queue, worker: threading.Thread):
+        """Queue products whose image was saved earlier (path from the DB), then wait for the
+        validation worker to drain the queue"""
+        skus = [p.get('Variant_SKU') for p in products if p.get('Variant_SKU')]
+        path_by_sku: Dict[str, str] = {}
+        cursor = self.db.conn.cursor()
+        try:
+            for i in range(0, len(skus), 500):
+                chunk = skus[i:i + 500]
                 cursor.execute(
-                    "SELECT downloaded_image_path FROM products WHERE Variant_SKU = ? AND downloaded_image_path IS NOT NULL",
-                    (sku,)
+                    "SELECT Variant_SKU, downloaded_image_path FROM products "
+                    f"WHERE downloaded_image_path IS NOT NULL AND Variant_SKU IN ({','.join('?' * len(chunk))})",
+                    chunk
                 )
-                row = cursor.fetchone()
-                cursor.close()
+                path_by_sku.update(cursor.fetchall())
+        finally:
+            cursor.close()
+        
+        for product in products:
+            path = path_by_sku.get(product.get('Variant_SKU'))
+            if path:
+                product['downloaded_image_path'] = path
+                clip_q.put(product)
+        clip_q.put(None)
+        worker.join()
+    
+    def _clip_worker(self, clip_q: queue.Queue, results: dict):
+        """Validate queued products in groups of up to clip.batch_size until the None sentinel"""
+        batch_size = max(1, self.config.get('clip', {}).get('batch_size', 16))
+        finished = False
+        while not finished:
+            group = []
+            item = clip_q.get()
+            while item is not None:
+                group.append(item)
+                if len(group) >= batch_size:
+                    break
+                try:
+                    item = clip_q.get_nowait()
+                except queue.Empty:
+                    break
+            finished = item is None
+            if group:
+                self._validate_group(group, results)
+    
+    def _validate_group(self, products: List[dict], results: dict):
+        """Run CLIP validation on processed images"""
+        validator = self._get_clip_validator()
+        if not validator:
+            return
+        try:
+            logger.info(f"Running CLIP validation on {len(products)} images")
+            validation_results = validator.validate_batch(products)
+            results['validated'] += validation_results['validated']
+            logger.info(f"CLIP validation complete: {validation_results['auto_approved']} approved, {validation_results['needs_review']} need review")
+        except Exception as e:
+            logger.error(f"CLIP validation error: {str(e)}")
+    
+    def _get_clip_validator(self):
+        if self._clip_validator is None:
+            try:
+                # Import CLIP validator (lazy load)
+                from clip_validator import CLIPValidator
                 
-                if row and row[0]:
-                    product['downloaded_image_path'] = row[0]
-                    products_to_validate.append(product)
-            
-            if products_to_validate:
-                logger.info(f"Running CLIP validation on {len(products_to_validate)} images")
                 clip_cfg = self.config.get('clip', {}).copy()
                 clip_cfg.update({'update_database': True})
                 # Provide device preference as flat keys for validator
                 if 'device_preference' in self.config.get('clip', {}):
                     clip_cfg['device_preference'] = self.config['clip']['device_preference']
-                validator = CLIPValidator(config=clip_cfg)
-                validation_results = validator.validate_batch(products_to_validate)
-                results['validated'] = validation_results['validated']
-                logger.info(f"CLIP validation complete: {validation_results['auto_approved']} approved, {validation_results['needs_review']} need review")
-                
-        except ImportError:
-            logger.warning("CLIP validator not available - skipping validation")
-        except Exception as e:
-            logger.error(f"CLIP validation error: {str(e)}")
+                self._clip_validator = CLIPValidator(config=clip_cfg)
+            except ImportError:
+                logger.warning("CLIP validator not available - skipping validation")
+                self._clip_validator = False
+            except Exception as e:
+                logger.error(f"CLIP validation error: {str(e)}")
+                self._clip_validator = False
+        return self._clip_validator
     
     def move_to_approved(self, sku: str) -> bool:
         """Move INDIVIDUAL image from pending to approved - FIXED to prevent corruption"""
@@ -1073,60 +1851,32 @@ class IntelligentImageProcessor:
         
         current_path = Path(product['downloaded_image_path'])
         
-        # CRITICAL: Ensure we're dealing with a FILE, not a directory
-        if not current_path.exists():
+        # CRITICAL: Ensure we're dealing with a FILE, not a directory (one stat covers both checks)
+        st = self._stat(current_path)
+        if st is None:
             logger.warning(f"Image file does not exist: {current_path} - attempting path repair")
             # Attempt repair again in case DB had stale path
             if not self._repair_missing_path(sku, product):
                 return False
             product = self.db.get_product_by_sku(sku)
             current_path = Path(product['downloaded_image_path'])
-            if not current_path.exists():
+            st = self._stat(current_path)
+            if st is None:
                 return False
         
-        if current_path.is_dir():
+        if stat.S_ISDIR(st.st_mode):
             logger.error(f"CRITICAL ERROR: Path is a directory, not a file: {current_path}")
             return False
         
         try:
             # Move to approved folder
-            brand = product.get('Brand', 'Unknown')
-            brand_folder = self.approved_dir / self.sanitize_filename(brand)
-            brand_folder.mkdir(exist_ok=True)
-            
-            # Ensure filename includes SKU for new location
-            safe_sku = self.sanitize_filename(sku)
-            if safe_sku in current_path.name:
-                # Already has SKU, keep the name
-                new_filename = current_path.name
-            else:
-                # Add SKU to filename for safety
-                title = product.get('Title', 'Unknown')
-                safe_title = self.sanitize_filename(title)[:100]
-                new_filename = f"{safe_title}_{safe_sku}.jpg"
+            new_path = self._status_path(self.approved_dir, current_path, product, sku)
             
-            new_path = brand_folder / new_filename
-            
-            # Handle existing file
-            if new_path.exists() and new_path != current_path:
-                new_path.unlink()  # Remove existing approved file
-            
-            # Move file only if destination differs
-            if new_path != current_path:
-                current_path.rename(new_path)
+            if self._move_pair(current_path, new_path):
                 logger.info(f"✓ Moved to approved: {current_path} → {new_path}")
             else:
                 logger.info(f"✓ Already in approved: {new_path}")
             
-            # Move metadata if exists
-            current_meta = current_path.with_suffix('.json')
-            if current_meta.exists() and current_meta.is_file():
-                new_meta = new_path.with_suffix('.json')
-                if new_meta != current_meta:
-                    if new_meta.exists():
-                        new_meta.unlink()
-                    current_meta.rename(new_meta)
-            
             # Update database for ONLY this SKU
             cursor = self.db.conn.cursor()
             try:
@@ -1173,56 +1923,30 @@ class IntelligentImageProcessor:
         current_path = Path(product['downloaded_image_path'])
         
         # Verify it's a file
-        if not current_path.exists():
+        st = self._stat(current_path)
+        if st is None:
             logger.warning(f"Image file does not exist: {current_path} - attempting path repair")
             if not self._repair_missing_path(sku, product):
                 return False
             product = self.db.get_product_by_sku(sku)
             current_path = Path(product['downloaded_image_path'])
-            if not current_path.exists():
+            st = self._stat(current_path)
+            if st is None:
                 return False
         
-        if current_path.is_dir():
+        if stat.S_ISDIR(st.st_mode):
             logger.error(f"Path is directory: {current_path}")
             return False
         
         try:
             # Move to pending folder
-            brand = product.get('Brand', 'Unknown')
-            brand_folder = self.pending_dir / self.sanitize_filename(brand)
-            brand_folder.mkdir(exist_ok=True)
-            
-            # Ensure filename has SKU
-            safe_sku = self.sanitize_filename(sku)
-            if safe_sku in current_path.name:
-                new_filename = current_path.name
-            else:
-                title = product.get('Title', 'Unknown')
-                safe_title = self.sanitize_filename(title)[:100]
-                new_filename = f"{safe_title}_{safe_sku}.jpg"
-            
-            new_path = brand_folder / new_filename
+            new_path = self._status_path(self.pending_dir, current_path, product, sku)
             
-            # Handle existing file
-            if new_path.exists() and new_path != current_path:
-                new_path.unlink()
-            
-            # Move file only if destination differs
-            if new_path != current_path:
-                current_path.rename(new_path)
+            if self._move_pair(current_path, new_path):
                 logger.info(f"✓ Moved to pending: {current_path} → {new_path}")
             else:
                 logger.info(f"✓ Already in pending: {new_path}")
             
-            # Move metadata if exists
-            current_meta = current_path.with_suffix('.json')
-            if current_meta.exists() and current_meta.is_file():
-                new_meta = new_path.with_suffix('.json')
-                if new_meta != current_meta:
-                    if new_meta.exists():
-                        new_meta.unlink()
-                    current_meta.rename(new_meta)
-            
             # Update database
             cursor = self.db.conn.cursor()
             try:
@@ -1261,7 +1985,8 @@ class IntelligentImageProcessor:
         current_path = Path(product['downloaded_image_path'])
         
         # Verify it's a file
-        if not current_path.exists():
+        st = self._stat(current_path)
+        if st is None:
             logger.warning(f"Image file does not exist: {current_path} - attempting path repair")
             if not self._repair_missing_path(sku, product):
                 # Still update database to declined status
@@ -1269,48 +1994,21 @@ class IntelligentImageProcessor:
                 return True
             product = self.db.get_product_by_sku(sku)
             current_path = Path(product['downloaded_image_path'])
+            st = self._stat(current_path)
         
-        if current_path.is_dir():
+        if st is not None and stat.S_ISDIR(st.st_mode):
             logger.error(f"CRITICAL ERROR: Path is directory: {current_path}")
             return False
         
         try:
             # Move to declined folder
-            brand = product.get('Brand', 'Unknown')
-            brand_folder = self.declined_dir / self.sanitize_filename(brand)
-            brand_folder.mkdir(exist_ok=True)
-            
-            # Ensure filename has SKU
-            safe_sku = self.sanitize_filename(sku)
-            if safe_sku in current_path.name:
-                new_filename = current_path.name
-            else:
-                title = product.get('Title', 'Unknown')
-                safe_title = self.sanitize_filename(title)[:100]
-                new_filename = f"{safe_title}_{safe_sku}.jpg"
-            
-            new_path = brand_folder / new_filename
-            
-            # Handle existing file
-            if new_path.exists() and new_path != current_path:
-                new_path.unlink()  # Remove old declined file
+            new_path = self._status_path(self.declined_dir, current_path, product, sku)
             
-            # Move file only if destination differs
-            if new_path != current_path:
-                current_path.rename(new_path)
+            if self._move_pair(current_path, new_path):
                 logger.info(f"✓ Moved to declined: {current_path} → {new_path}")
             else:
                 logger.info(f"✓ Already in declined: {new_path}")
             
-            # Move metadata if exists
-            current_meta = current_path.with_suffix('.json')
-            if current_meta.exists() and current_meta.is_file():
-                new_meta = new_path.with_suffix('.json')
-                if new_meta != current_meta:
-                    if new_meta.exists():
-                        new_meta.unlink()
-                    current_meta.rename(new_meta)
-            
             # Update database for ONLY this SKU
             cursor = self.db.conn.cursor()
             try:
@@ -1335,29 +2033,158 @@ class IntelligentImageProcessor:
             self.db.conn.rollback()
             return False
 
+    def _move_pair(self, current_path: Path, new_path: Path) -> bool:
+        """Move an image and its JSON sidecar (if any) with one os.replace each, overwriting the
+        destination; False when the image is already there"""
+        if new_path == current_path:
+            return False
+        os.replace(current_path, new_path)
+        self._index_file_moved(current_path, new_path)
+        try:
+            os.replace(current_path.with_suffix('.json'), new_path.with_suffix('.json'))
+        except FileNotFoundError:
+            pass
+        return True
+    
+    def _status_path(self, status_dir: Path, current_path: Path, product: dict, sku: str) -> Path:
+        """Destination of an image moved into status_dir (brand folder created if needed).
+        
+        Images saved by _download_and_save_image already sit at <status>/<brand>/<title>_<sku>.jpg,
+        so only the status folder changes; any other layout is rebuilt from the product row.
+        """
+        brand_folder = current_path.parent
+        if brand_folder.parent in (self.approved_dir, self.pending_dir, self.declined_dir):
+            new_path = status_dir / brand_folder.name / current_path.name
+        else:
+            brand = product.get('Brand', 'Unknown')
+            # Ensure filename includes SKU for new location
+            safe_sku = self.sanitize_filename(sku)
+            if safe_sku in current_path.name:
+                # Already has SKU, keep the name
+                new_filename = current_path.name
+            else:
+                # Add SKU to filename for safety
+                title = product.get('Title', 'Unknown')
+                safe_title = self.sanitize_filename(title)
+                new_filename = f"{safe_title}_{safe_sku}.jpg"
+            new_path = status_dir / self.sanitize_filename(brand) / new_filename
+        self._ensure_dir(new_path.parent)
+        return new_path
+    
+    @staticmethod
+    def _stat(path: Path) -> Optional[os.stat_result]:
+        """Single stat call replacing separate exists()/is_dir() probes"""
+        try:
+            return os.stat(path)
+        except OSError:
+            return None
+    
+    def _index_brand(self, folder: Path) -> Dict[str, Dict[str, str]]:
+        """Index the .jpg files of a brand folder once (single scandir pass, no per-file stat).
+        
+        A missing folder is cached as an empty index, so brands with no images cost nothing on later lookups.
+        """
+        key = str(folder)
+        index = self._brand_index.get(key)
+        if index is None:
+            index = {'stems': {}, 'skus': {}}
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if entry.name.endswith('.jpg') and entry.is_file():
+                            self._index_add(index, os.path.join(key, entry.name))
+            except OSError:
+                pass
+            self._brand_index[key] = index
+        return index
+    
+    @staticmethod
+    def _index_add(index: Dict[str, Dict[str, str]], path: str) -> None:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        index['stems'][stem] = path
+        # Filenames are <title>_<sku>.jpg
+        index['skus'][stem.rsplit('_', 1)[-1]] = path
+    
+    def _index_file_moved(self, old_path: Optional[Path], new_path: Optional[Path]) -> None:
+        """Keep already-built brand folder indexes in step with a file move/write"""
+        if old_path is not None:
+            index = self._brand_index.get(str(old_path.parent))
+            if index:
+                stem = old_path.stem
+                if index['stems'].pop(stem, None) is not None:
+                    sku_key = stem.rsplit('_', 1)[-1]
+                    if index['skus'].get(sku_key) == str(old_path):
+                        del index['skus'][sku_key]
+        if new_path is not None:
+            index = self._brand_index.get(str(new_path.parent))
+            if index is not None:
+                self._index_add(index, str(new_path))
+        if self._sku_index is not None:
+            if old_path is not None:
+                stem = old_path.stem
+                if self._sku_index['stems'].get(stem) == str(old_path):
+                    del self._sku_index['stems'][stem]
+                sku_key = stem.rsplit('_', 1)[-1]
+                if self._sku_index['skus'].get(sku_key) == str(old_path):
+                    del self._sku_index['skus'][sku_key]
+            if new_path is not None:
+                self._index_add(self._sku_index, str(new_path))
+    
+    def _build_sku_index(self) -> Dict[str, Dict[str, str]]:
+        """Index every image under approved/pending/declined with a single walk"""
+        index = {'stems': {}, 'skus': {}}
+        # Approved last, so it wins when a SKU has files under several statuses
+        for base in (self.declined_dir, self.pending_dir, self.approved_dir):
+            for folder, _, files in os.walk(base):
+                for name in files:
+                    if name.endswith('.jpg'):
+                        self._index_add(index, os.path.join(folder, name))
+        self._sku_index = index
+        self._sku_index_built = time.monotonic()
+        return index
+    
+    def _find_in_brand_folder(self, folder: Path, safe_sku: str) -> Optional[Path]:
+        """Look up an image for a SKU in a brand folder via the in-memory index"""
+        index = self._index_brand(folder)
+        path = index['skus'].get(safe_sku)
+        if path is None:
+            # SKUs containing underscores don't split cleanly - fall back to substring match
+            path = next((p for stem, p in index['stems'].items() if safe_sku in stem), None)
+        if path is not None and os.path.isfile(path):
+            return Path(path)
+        return None
+    
+    def _locate_image(self, safe_brand: str, safe_sku: str) -> Optional[Path]:
+        """Find a SKU's image under approved/pending/declined using the brand folder indexes"""
+        statuses = (self.approved_dir, self.pending_dir, self.declined_dir)
+        # The product's own brand folder first
+        for base in statuses:
+            found_path = self._find_in_brand_folder(base / safe_brand, safe_sku)
+            if found_path:
+                return found_path
+        # Then anywhere in the tree, via the whole-tree index (one walk, then dict lookups)
+        index = self._sku_index if self._sku_index is not None else self._build_sku_index()
+        path = index['skus'].get(safe_sku)
+        if path is None:
+            # SKUs containing underscores don't split cleanly - fall back to substring match
+            path = next((p for stem, p in index['stems'].items() if safe_sku in stem), None)
+        if path is not None and os.path.isfile(path):
+            return Path(path)
+        return None
+    
     def _repair_missing_path(self, sku: str, product: Optional[dict]) -> bool:
         """Attempt to find an image file for SKU across approved/pending/declined and update DB."""
         try:
             brand = (product.get('Brand') if product else None) or 'Unknown'
             safe_brand = self.sanitize_filename(brand)
             safe_sku = self.sanitize_filename(sku)
-            candidates = [
-                self.approved_dir / safe_brand,
-                self.pending_dir / safe_brand,
-                self.declined_dir / safe_brand,
-                self.approved_dir,
-                self.pending_dir,
-                self.declined_dir,
-            ]
-            found_path: Optional[Path] = None
-            for base in candidates:
-                if base.exists():
-                    for file in base.glob(f"**/*{safe_sku}*.jpg"):
-                        if file.is_file():
-                            found_path = file
-                            break
-                    if found_path:
-                        break
+            found_path = self._locate_image(safe_brand, safe_sku)
+            if not found_path and time.monotonic() - self._sku_index_built > SKU_INDEX_RESCAN_SECONDS:
+                # Files may have been added outside the processor since indexing - rescan, but not
+                # once per SKU when many missing ones are repaired together
+                self._brand_index.clear()
+                self._sku_index = None
+                found_path = self._locate_image(safe_brand, safe_sku)
             if found_path:
                 cursor = self.db.conn.cursor()
                 try:
@@ -1374,4 +2201,4 @@ class IntelligentImageProcessor:
             return False
         except Exception as e:
             logger.error(f"Path repair error for {sku}: {e}")
-            return False
\ No newline at end of file
+            return False
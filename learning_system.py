@@ -4,15 +4,40 @@ Continuous Learning System for NWK Image Management
 This module tracks user feedback and improves search accuracy over time.
 """
 
-import json
+import atexit
+import re
 import sqlite3
+import threading
+import weakref
 from pathlib import Path
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, List, Tuple, Optional
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
+# Changed pattern sections are written back after this many feedback events (and on close/exit)
+LEARNING_FLUSH_EVENTS = 50
+
+# Retailers whose approvals are counted; the first one named in an approved image's source wins
+LEARNED_RETAILERS = ('checkers', 'shoprite', 'pnp', 'makro', 'woolworths', 'dischem')
+_LEARNED_RETAILER_RE = re.compile('|'.join(LEARNED_RETAILERS))
+
+
+@lru_cache(maxsize=4096)
+def _words(text: str) -> frozenset:
+    """Lowercased word set of a title (titles repeat across a product's candidates)"""
+    return frozenset(text.lower().split())
+
+
+def _close_at_exit(ref: weakref.ref) -> None:
+    """atexit hook closing the object if it is still alive (the weak reference lets it be collected earlier)"""
+    obj = ref()
+    if obj is not None:
+        obj.close()
+
 
 class LearningSystem:
     """Continuous learning system that improves based on user feedback"""
@@ -20,13 +45,36 @@ class LearningSystem:
     def __init__(self, db_path: str = "nwk_products.db"):
         self.db_path = db_path
         self.patterns_file = Path("learning_patterns.json")
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._dirty = set()  # pattern sections changed since the last flush
+        self._pending_events = 0
+        self._best_retailers: Dict[int, List[str]] = {}  # limit -> get_best_retailers, until the next event
+        self._best_retailer_re = None
+        self._strategy_stats: Optional[Tuple[int, int, str, float]] = None  # until search_strategies changes
+        self._ensure_schema()
         self.load_patterns()
+        atexit.register(_close_at_exit, weakref.ref(self))
+    
+    def _ensure_schema(self):
+        """One row per pattern section; the old JSON file is imported the first time"""
+        self.conn.execute('CREATE TABLE IF NOT EXISTS learning_kv (key TEXT PRIMARY KEY, val TEXT NOT NULL)')
+        empty = self.conn.execute('SELECT 1 FROM learning_kv LIMIT 1').fetchone() is None
+        if empty and self.patterns_file.exists():
+            with open(self.patterns_file, 'rb') as f:
+                patterns = orjson.loads(f.read())
+            self.conn.executemany('INSERT INTO learning_kv (key, val) VALUES (?, ?)',
+                                  [(k, orjson.dumps(v).decode()) for k, v in patterns.items()])
+            logger.info(f"Migrated learning patterns from {self.patterns_file}")
+        self.conn.commit()
         
     def load_patterns(self):
-        """Load learned patterns from file"""
-        if self.patterns_file.exists():
-            with open(self.patterns_file, 'r') as f:
-                self.patterns = json.load(f)
+        """Load learned patterns from the database"""
+        self._forget_rankings()
+        self._data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        rows = self.conn.execute('SELECT key, val FROM learning_kv').fetchall()
+        if rows:
+            self.patterns = {key: orjson.loads(val) for key, val in rows}
         else:
             self.patterns = {
                 'successful_retailers': {},  # Retailer -> success count
@@ -43,22 +91,107 @@ class LearningSystem:
                 }
             }
     
+    def reload_if_changed(self) -> bool:
+        """Reload patterns if another connection (e.g. the web app's LearningSystem) has committed
+        since the last load - one PRAGMA when nothing changed, so cheap to call before each batch.
+        Pending local changes are flushed first so the reload includes them.
+        """
+        with self._lock:
+            self._flush_locked()
+            if self.conn.execute('PRAGMA data_version').fetchone()[0] == self._data_version:
+                return False
+            self.load_patterns()
+            return True
+    
     def save_patterns(self):
-        """Save learned patterns to file"""
-        with open(self.patterns_file, 'w') as f:
-            json.dump(self.patterns, f, indent=2)
+        """Write every pattern section to the database now"""
+        with self._lock:
+            self._dirty.update(self.patterns)
+            self._flush_locked()
+    
+    def flush(self):
+        """Write the pattern sections changed since the last flush"""
+        with self._lock:
+            self._flush_locked()
+    
+    def _flush_locked(self):
+        if not self._dirty:
+            return
+        self.conn.executemany('INSERT OR REPLACE INTO learning_kv (key, val) VALUES (?, ?)',
+                              [(k, orjson.dumps(self.patterns[k]).decode()) for k in self._dirty])
+        self.conn.commit()
+        self._dirty.clear()
+        self._pending_events = 0
+    
+    def _record_event(self, *sections: str):
+        """Mark sections changed; flush once LEARNING_FLUSH_EVENTS events have accumulated"""
+        self._dirty.update(sections)
+        self._pending_events += 1
+        if 'successful_retailers' in sections:
+            self._forget_rankings()
+        if 'search_strategies' in sections:
+            self._strategy_stats = None
+        if self._pending_events >= LEARNING_FLUSH_EVENTS:
+            self._flush_locked()
+    
+    def _forget_rankings(self):
+        self._best_retailers.clear()
+        self._best_retailer_re = None
+        self._strategy_stats = None
+    
+    def _get_strategy_stats(self) -> Tuple[int, int, str, float]:
+        """(total successes, total attempts, best strategy, its success rate) over search_strategies"""
+        stats = self._strategy_stats
+        if stats is None:
+            strategies = self.patterns['search_strategies']
+            best_strategy = 'barcode_first'  # Default
+            best_rate = 0
+            for strategy, counts in strategies.items():
+                if counts['total'] > 0:
+                    success_rate = counts['success'] / counts['total']
+                    if success_rate > best_rate:
+                        best_rate = success_rate
+                        best_strategy = strategy
+            stats = self._strategy_stats = (
+                sum(s['success'] for s in strategies.values()),
+                sum(s['total'] for s in strategies.values()),
+                best_strategy, best_rate
+            )
+        return stats
+    
+    def close(self):
+        """Flush pending pattern changes and close the connection"""
+        if self.conn is None:
+            return
+        self.flush()
+        self.conn.close()
+        self.conn = None
+    
+    def __del__(self):
+        # Collected before exit (the atexit hook holds only a weak reference): keep pending changes
+        try:
+            if getattr(self, 'conn', None) is not None:
+                self.close()
+        except Exception:
+            pass
     
     def record_approval(self, product: dict):
         """Record when a product image is approved"""
+        with self._lock:
+            self._record_approval(product)
+        logger.info(f"Recorded approval for {product.get('Variant_SKU')}")
+    
+    def _record_approval(self, product: dict):
+        sections = []
         
         # Track successful retailer
         source = product.get('image_source', '').lower()
-        if source:
-            for retailer in ['checkers', 'shoprite', 'pnp', 'makro', 'woolworths', 'dischem']:
-                if retailer in source:
-                    self.patterns['successful_retailers'][retailer] = \
-                        self.patterns['successful_retailers'].get(retailer, 0) + 1
-                    break
+        match = _LEARNED_RETAILER_RE.search(source) if source else None
+        if match:
+            retailer = match.group(0)
+            self.patterns['successful_retailers'][retailer] = \
+                self.patterns['successful_retailers'].get(retailer, 0) + 1
+            sections.append('successful_retailers')
         
         # Track successful search strategy
         query = product.get('search_query', '')
@@ -72,6 +205,7 @@ class LearningSystem:
             
             self.patterns['search_strategies'][strategy]['success'] += 1
             self.patterns['search_strategies'][strategy]['total'] += 1
+            sections.append('search_strategies')
         
         # Track effective brand keywords
         brand = product.get('Brand', '').strip()
@@ -85,18 +219,25 @@ class LearningSystem:
                 if keyword not in ['site:', 'or', 'and', '"'] and \
                    keyword not in self.patterns['brand_keywords'][brand]:
                     self.patterns['brand_keywords'][brand].append(keyword)
+            sections.append('brand_keywords')
         
-        self.save_patterns()
-        logger.info(f"Recorded approval for {product.get('Variant_SKU')}")
+        self._record_event(*sections)
     
     def record_rejection(self, product: dict):
         """Record when a product image is rejected"""
+        with self._lock:
+            self._record_rejection(product)
+        logger.info(f"Recorded rejection for {product.get('Variant_SKU')}")
+    
+    def _record_rejection(self, product: dict):
+        sections = []
         
         # Track problematic sources
         source = product.get('image_source', '').lower()
         if source:
             self.patterns['rejected_sources'][source] = \
                 self.patterns['rejected_sources'].get(source, 0) + 1
+            sections.append('rejected_sources')
         
         # Update strategy metrics
         query = product.get('search_query', '')
@@ -109,13 +250,24 @@ class LearningSystem:
                 strategy = 'brand_title'
             
             self.patterns['search_strategies'][strategy]['total'] += 1
+            sections.append('search_strategies')
         
-        self.save_patterns()
-        logger.info(f"Recorded rejection for {product.get('Variant_SKU')}")
+        self._record_event(*sections)
     
     def get_best_retailers(self, limit: int = 5) -> List[str]:
         """Get the most successful retailers for searches"""
-        
+        cached = self._best_retailers.get(limit)
+        if cached is None:
+            cached = self._best_retailers[limit] = self._rank_retailers(limit)
+        return list(cached)
+    
+    def best_retailer_pattern(self) -> 're.Pattern':
+        """Compiled alternation of get_best_retailers(), for one-pass source matching"""
+        if self._best_retailer_re is None:
+            self._best_retailer_re = re.compile('|'.join(map(re.escape, self.get_best_retailers())))
+        return self._best_retailer_re
+    
+    def _rank_retailers(self, limit: int) -> List[str]:
         retailers = self.patterns['successful_retailers']
         sorted_retailers = sorted(retailers.items(), key=lambda x: x[1], reverse=True)
         
@@ -164,16 +316,7 @@ class LearningSystem:
     def get_best_search_strategy(self) -> str:
         """Get the most successful search strategy"""
         
-        strategies = self.patterns['search_strategies']
-        best_strategy = 'barcode_first'  # Default
-        best_rate = 0
-        
-        for strategy, stats in strategies.items():
-            if stats['total'] > 0:
-                success_rate = stats['success'] / stats['total']
-                if success_rate > best_rate:
-                    best_rate = success_rate
-                    best_strategy = strategy
+        _, _, best_strategy, best_rate = self._get_strategy_stats()
         
         logger.info(f"Best strategy: {best_strategy} (success rate: {best_rate:.2%})")
         return best_strategy
@@ -193,8 +336,7 @@ class LearningSystem:
     def get_overall_success_rate(self) -> float:
         """Calculate overall success rate from patterns"""
         
-        total_success = sum(s['success'] for s in self.patterns['search_strategies'].values())
-        total_attempts = sum(s['total'] for s in self.patterns['search_strategies'].values())
+        total_success, total_attempts, _, _ = self._get_strategy_stats()
         
         if total_attempts == 0:
             return 0.5  # Default to 50% if no data
@@ -286,7 +428,7 @@ class LearningSystem:
             'top_retailers': self.get_best_retailers(3),
             'overall_success_rate': f"{self.get_overall_success_rate():.1%}",
             'best_strategy': self.get_best_search_strategy(),
-            'total_approvals': sum(s['success'] for s in self.patterns['search_strategies'].values()),
+            'total_approvals': self._get_strategy_stats()[0],
             'total_rejections': sum(self.patterns['rejected_sources'].values()),
             'brand_keywords_learned': len(self.patterns['brand_keywords']),
             'suggestions': self.suggest_improvements()
@@ -311,6 +453,7 @@ class LearningSystem:
                 'retailer_specific': {'success': 0, 'total': 0}
             }
         }
+        self._forget_rankings()
         self.save_patterns()
         logger.warning("Learning system has been reset")
 
@@ -347,36 +490,44 @@ class AdaptiveSearchOptimizer:
         
         return optimized
     
-    def score_result(self, result: dict, product: dict) -> float:
+    @staticmethod
+    def product_context(product: dict) -> dict:
+        """Product-side inputs of score_result, built once when scoring many results for a product"""
+        return {
+            'brand': product.get('Brand', '').lower(),
+            'title_words': _words(product.get('Title', ''))
+        }
+    
+    def score_results(self, results: List[dict], product: dict) -> List[float]:
+        """score_result for every candidate of one product"""
+        context = self.product_context(product)
+        return [self.score_result(result, product, context) for result in results]
+    
+    def score_result(self, result: dict, product: dict, context: Optional[dict] = None) -> float:
         """Score a search result based on learned patterns"""
+        if context is None:
+            context = self.product_context(product)
         
         score = 50  # Base score
         
         # Check retailer
         source = result.get('source', '').lower()
-        for retailer in self.learning.get_best_retailers():
-            if retailer in source:
-                score += 20
-                break
+        if self.learning.best_retailer_pattern().search(source):
+            score += 20
         
         # Check for rejected sources
-        if source in self.learning.patterns['rejected_sources']:
-            rejection_count = self.learning.patterns['rejected_sources'][source]
+        rejection_count = self.learning.patterns['rejected_sources'].get(source)
+        if rejection_count is not None:
             score -= min(30, rejection_count * 3)
         
         # Brand match
-        brand = product.get('Brand', '').lower()
-        if brand and brand in result.get('title', '').lower():
+        result_title = result.get('title', '')
+        brand = context['brand']
+        if brand and brand in result_title.lower():
             score += 15
         
-        # Title similarity
-        product_title = product.get('Title', '').lower()
-        result_title = result.get('title', '').lower()
-        
-        # Simple word overlap
-        product_words = set(product_title.split())
-        result_words = set(result_title.split())
-        overlap = len(product_words & result_words)
+        # Title similarity: simple word overlap against the product's prebuilt word set
+        overlap = len(context['title_words'] & _words(result_title))
         score += min(20, overlap * 5)
         
         return max(0, min(100, score))
\ No newline at end of file
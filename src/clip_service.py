@@ -9,14 +9,37 @@ Lightweight reusable CLIP service for GPU ranking and embedding.
 from __future__ import annotations
 
 import io
+import re
 import threading
 import logging
+import warnings
+from collections import OrderedDict
 from typing import Dict, List, Optional, Tuple
 
 import torch
+import torch.nn.functional as F
 from PIL import Image
 import clip
 
+try:  # nvJPEG decode on CUDA (optional)
+    import torchvision.transforms.functional as TF
+    from torchvision.io import ImageReadMode, decode_jpeg
+    from torchvision.transforms import InterpolationMode
+except ImportError:
+    decode_jpeg = None
+
+
+_SIZE_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(g|kg|ml|l|L)")
+
+# Text embeddings kept per prompt; brand/variant prompts repeat across many SKUs
+TEXT_CACHE_SIZE = 8192
+
+# CLIP's preprocessing normalisation, for the on-GPU path
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+
+# Batch sizes the compiled encoders are captured for (clip.compile); batches are zero-padded up to one
+COMPILE_BUCKETS = (1, 4, 16, 64)
 
 _singleton_lock = threading.Lock()
 _singleton_instance: Optional["CLIPService"] = None
@@ -28,6 +51,7 @@ class CLIPService:
         self.device = self._select_device()
         self.model_name = (self.config.get('clip', {}) or {}).get('model', 'ViT-B/32')
         self.model, self.preprocess = clip.load(self.model_name, device=self.device)
+        self.input_resolution = getattr(self.model.visual, 'input_resolution', 224)
 
         # Use fast dtypes where safe
         self.use_fp16 = self.device.type == 'cuda'
@@ -38,11 +62,72 @@ class CLIPService:
             except Exception:
                 self.use_fp16 = False
 
+        # Optional torch.compile + CUDA graphs for the fixed-shape encoders
+        self._encode_image = self._embed_images
+        self._encode_text = self._embed_texts
+        self._compiled_lock = threading.Lock()
+        self.compiled = self.device.type == 'cuda' and bool((self.config.get('clip', {}) or {}).get('compile', False))
+        if self.compiled:
+            self._compile_encoders()
+
         logging.getLogger(__name__).info(
-            f"CLIPService initialized: model={self.model_name}, device={self.device.type}, fp16={self.use_fp16}"
+            f"CLIPService initialized: model={self.model_name}, device={self.device.type}, fp16={self.use_fp16}, "
+            f"compiled={self.compiled}"
         )
 
-        self._text_cache: Dict[str, torch.Tensor] = {}
+        # prompt -> normalized embedding row (LRU, shared by the ranking threads)
+        self._text_cache: "OrderedDict[str, torch.Tensor]" = OrderedDict()
+        self._text_cache_size = (self.config.get('clip', {}) or {}).get('text_cache_size', TEXT_CACHE_SIZE)
+        self._text_cache_lock = threading.Lock()
+
+        # JPEG thumbnails are decoded and preprocessed on the GPU (nvJPEG) when available
+        self.gpu_decode = (self.device.type == 'cuda' and decode_jpeg is not None
+                           and (self.config.get('clip', {}) or {}).get('gpu_decode', True))
+        self._gpu_decode_lock = threading.Lock()
+
+    def _compile_encoders(self) -> None:
+        """Compile both encoders (reduce-overhead: CUDA graphs) and capture every bucket size up front,
+        so no request pays for compilation or graph recording. Falls back to eager on any failure.
+        """
+        try:
+            self._encode_image = torch.compile(self._embed_images, mode="reduce-overhead", fullgraph=True)
+            self._encode_text = torch.compile(self._embed_texts, mode="reduce-overhead", fullgraph=True)
+            dtype = torch.float16 if self.use_fp16 else torch.float32
+            res = self.input_resolution
+            with torch.inference_mode():
+                for size in COMPILE_BUCKETS:
+                    # A few calls each: the first compiles, later ones record and replay the graph
+                    for _ in range(3):
+                        self._run_encoder(self._encode_image,
+                                          torch.zeros((size, 3, res, res), dtype=dtype, device=self.device))
+                        self._run_encoder(self._encode_text,
+                                          torch.zeros((size, self.model.context_length), dtype=torch.long,
+                                                      device=self.device))
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"torch.compile of CLIP encoders failed, using eager mode: {e}")
+            self._encode_image = self._embed_images
+            self._encode_text = self._embed_texts
+            self.compiled = False
+
+    def _embed_images(self, image_input: torch.Tensor) -> torch.Tensor:
+        # Normalising inside the (optionally compiled) encoder lets it fuse into the projection
+        return F.normalize(self.model.encode_image(image_input), dim=-1)
+
+    def _embed_texts(self, tokens: torch.Tensor) -> torch.Tensor:
+        return F.normalize(self.model.encode_text(tokens), dim=-1)
+
+    def _run_encoder(self, encoder, batch: torch.Tensor) -> torch.Tensor:
+        """Call an encoder; compiled encoders get batches padded to a captured bucket size"""
+        if not self.compiled:
+            return encoder(batch)
+        n = batch.shape[0]
+        size = next((b for b in COMPILE_BUCKETS if b >= n), n)
+        if size > n:
+            batch = torch.cat([batch, batch.new_zeros((size - n,) + tuple(batch.shape[1:]))])
+        # Graph replays share static buffers: one caller at a time, and the rows are copied out
+        # before the next replay overwrites them (padded rows are dropped here)
+        with self._compiled_lock:
+            return encoder(batch)[:n].clone()
 
     def _select_device(self) -> torch.device:
         prefer = (self.config.get('clip', {}) or {}).get('device_preference', ["cuda", "mps"])  # type: ignore[assignment]
@@ -64,8 +149,7 @@ class CLIPService:
             descriptions.append(f"A package of {brand} {variant}")
 
         # Extract size (simple heuristic)
-        import re
-        size_match = re.search(r"(\d+(?:\.\d+)?)\s*(g|kg|ml|l|L)", f"{title} {variant}")
+        size_match = _SIZE_RE.search(f"{title} {variant}")
         if size_match:
             size = size_match.group(0)
             descriptions.append(f"A {size} pack of {brand} {title or variant}")
@@ -75,59 +159,103 @@ class CLIPService:
         return descriptions
 
     def _encode_texts(self, descriptions: List[str]) -> torch.Tensor:
-        cache_key = " || ".join(descriptions)
-        if cache_key in self._text_cache:
-            return self._text_cache[cache_key]
-
-        with torch.no_grad():
-            tokens = clip.tokenize(descriptions, truncate=True).to(self.device)
-            text_features = self.model.encode_text(tokens)
-            text_features = text_features / text_features.norm(dim=-1, keepdim=True)
-        self._text_cache[cache_key] = text_features
-        return text_features
-
-    def _encode_images_from_bytes(self, images: List[bytes]) -> torch.Tensor:
-        tensors = []
-        for b in images:
-            try:
-                img = Image.open(io.BytesIO(b)).convert('RGB')
-                tensor = self.preprocess(img).unsqueeze(0)
-                tensors.append(tensor)
-            except Exception:
-                # Skip invalid image
-                continue
+        """Normalized text embeddings as a contiguous [D, N_texts] matrix (the right-hand side of the
+        similarity GEMM, no transpose needed); the text tower only sees prompts not cached yet"""
+        with self._text_cache_lock:
+            cached = {d: self._text_cache[d] for d in descriptions if d in self._text_cache}
+            for d in cached:
+                self._text_cache.move_to_end(d)
+        missing = [d for d in dict.fromkeys(descriptions) if d not in cached]
+
+        if missing:
+            with torch.inference_mode():
+                tokens = clip.tokenize(missing, truncate=True).to(self.device)
+                features = self._run_encoder(self._encode_text, tokens)
+            with self._text_cache_lock:
+                for d, row in zip(missing, features):
+                    cached[d] = self._text_cache[d] = row
+                while len(self._text_cache) > self._text_cache_size:
+                    self._text_cache.popitem(last=False)
+        return torch.stack([cached[d] for d in descriptions], dim=1)
 
-        if not tensors:
-            return torch.empty(0, 512, device=self.device)
+    def preprocess_bytes(self, image_bytes: bytes) -> Optional[torch.Tensor]:
+        """Decode and preprocess one image into a (3, H, W) tensor; None if it cannot be decoded.
+        JPEGs land on the GPU when gpu_decode is on, everything else is a CPU tensor.
+        Thread-safe - called from a decode pool.
+        """
+        if self.gpu_decode and image_bytes[:2] == b'\xff\xd8':
+            tensor = self._preprocess_jpeg_on_device(image_bytes)
+            if tensor is not None:
+                return tensor
+        try:
+            img = Image.open(io.BytesIO(image_bytes))
+            # JPEGs decode directly at >= model resolution (DCT scaling) instead of full size
+            img.draft('RGB', (self.input_resolution, self.input_resolution))
+            return self.preprocess(img.convert('RGB'))
+        except Exception:
+            return None
+
+    def _preprocess_jpeg_on_device(self, image_bytes: bytes) -> Optional[torch.Tensor]:
+        """nvJPEG decode + resize/crop/normalize on the GPU; only the compressed bytes cross the bus"""
+        try:
+            # Zero-copy view over the response bytes; frombuffer warns that they are immutable,
+            # but decode only reads the view
+            with warnings.catch_warnings():
+                warnings.filterwarnings('ignore', message='The given buffer is not writable', category=UserWarning)
+                raw = torch.frombuffer(image_bytes, dtype=torch.uint8)
+            # One decode at a time - the CUDA decoder handle is shared
+            with self._gpu_decode_lock:
+                img = decode_jpeg(raw, mode=ImageReadMode.RGB, device=self.device)
+            img = TF.resize(img, [self.input_resolution], interpolation=InterpolationMode.BICUBIC, antialias=True)
+            img = TF.center_crop(img, [self.input_resolution, self.input_resolution])
+            return TF.normalize(img.float().div_(255), CLIP_MEAN, CLIP_STD)
+        except Exception:
+            # Streams nvJPEG rejects (e.g. CMYK) go through PIL instead
+            return None
 
-        image_input = torch.cat(tensors, dim=0).to(self.device)
+    def _encode_images(self, tensors: List[torch.Tensor]) -> torch.Tensor:
+        """Encode preprocessed images as one batch: a single host->device copy and forward pass"""
+        if any(t.device.type != 'cpu' for t in tensors):
+            # Some were preprocessed on the GPU already; only the PIL-decoded ones need copying
+            image_input = torch.stack([t.to(self.device) for t in tensors])
+        elif self.device.type == 'cuda':
+            image_input = torch.stack(tensors).pin_memory().to(self.device, non_blocking=True)
+        else:
+            image_input = torch.stack(tensors).to(self.device)
         if self.use_fp16:
             image_input = image_input.half()
 
-        with torch.no_grad():
-            image_features = self.model.encode_image(image_input)
-            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-        return image_features
+        with torch.inference_mode():
+            return self._run_encoder(self._encode_image, image_input)
 
-    def rank_thumbnails(self, product: Dict, thumbnails: List[bytes]) -> List[int]:
+    def rank_preprocessed(self, product: Dict, tensors: List[Optional[torch.Tensor]],
+                          top_k: Optional[int] = None) -> List[int]:
         """
-        Rank candidate thumbnails for a product. Returns indices (best first).
+        Rank preprocessed candidate images for a product. Returns indices into tensors (best first),
+        at most top_k of them; entries that failed to decode (None) are left out.
         """
-        if not thumbnails:
-            return []
-        texts = self._build_descriptions(product)
-        text_features = self._encode_texts(texts)
-        image_features = self._encode_images_from_bytes(thumbnails)
-        if image_features.numel() == 0:
+        valid = [i for i, t in enumerate(tensors) if t is not None]
+        if not valid:
             return []
+        text_features_t = self._encode_texts(self._build_descriptions(product))
+        image_features = self._encode_images([tensors[i] for i in valid])
 
-        # cosine similarity in [-1,1]; convert to [0,1] then take max over texts
-        sims = image_features @ text_features.T  # [N_images, N_texts]
-        sims = (sims + 1.0) / 2.0
+        # cosine similarity in [-1,1] (monotonic in the [0,1] score); take max over texts
+        sims = torch.mm(image_features, text_features_t)  # [N_images, N_texts]
         max_per_image = sims.max(dim=1).values  # [N_images]
 
-        sorted_indices = torch.argsort(max_per_image, descending=True).tolist()
-        return sorted_indices
+        # topk on the device; only the k winning indices come back to the host
+        k = min(top_k or len(valid), len(valid))
+        best = torch.topk(max_per_image, k).indices.cpu().tolist()
+        return [valid[i] for i in best]
+
+    def rank_thumbnails(self, product: Dict, thumbnails: List[bytes], top_k: Optional[int] = None) -> List[int]:
+        """
+        Rank candidate thumbnails for a product. Returns indices into thumbnails (best first).
+        """
+        if not thumbnails:
+            return []
+        return self.rank_preprocessed(product, [self.preprocess_bytes(b) for b in thumbnails], top_k)
 
 
 def get_clip_service(config: Optional[dict] = None) -> CLIPService:
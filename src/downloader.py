@@ -3,14 +3,140 @@ Async image downloading with retry logic
 """
 import asyncio
 import logging
-from typing import Optional
+import re
+from functools import lru_cache
+from typing import AsyncIterator, Optional
 import aiohttp
+from aiohttp.abc import AbstractResolver
+from aiohttp.resolver import AsyncResolver
+import httpx
 from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
 
-async def fetch_image(session: aiohttp.ClientSession, url: str, max_retries: int = 3) -> Optional[bytes]:
+MAX_IMAGE_BYTES = 10 * 1024 * 1024  # 10MB limit
+MIN_IMAGE_BYTES = 1024  # Minimum 1KB
+READ_CHUNK_BYTES = 64 * 1024
+PER_HOST_LIMIT = 16  # Concurrent requests to one origin (network.per_host_limit)
+
+# Leading bytes of the formats the image pipeline can decode (WebP is RIFF....WEBP, checked separately)
+_IMAGE_MAGICS = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a', b'BM', b'II*\x00', b'MM\x00*')
+MAGIC_BYTES = 12
+
+# Image file extensions accepted by is_valid_image_url
+_IMG_EXT_RE = re.compile(r'\.(jpe?g|png|gif|bmp|webp)$')
+
+# URL -> download in flight, shared by concurrent batches asking for the same image
+_inflight: dict[str, asyncio.Future] = {}
+
+
+def is_image_magic(head: bytes) -> bool:
+    """True if head (the first MAGIC_BYTES of a body) starts like a JPEG/PNG/GIF/WebP/BMP/TIFF file"""
+    return head.startswith(_IMAGE_MAGICS) or (head[:4] == b'RIFF' and head[8:12] == b'WEBP')
+
+
+def _request_headers(url: str) -> dict:
+    """Browser-like request headers, with a Referer from the URL to improve CDN acceptance"""
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0 Safari/537.36',
+        'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Connection': 'keep-alive'
+    }
+    try:
+        parsed = urlparse(url)
+        if parsed.netloc:
+            headers['Referer'] = f"https://{parsed.netloc}"
+    except Exception:
+        pass
+    return headers
+
+
+def dns_resolver(config: dict) -> Optional[AbstractResolver]:
+    """
+    Non-blocking c-ares resolver for aiohttp connectors.
+    
+    Must be called from a running event loop. Falls back to aiohttp's threaded
+    getaddrinfo resolver (returns None) when aiodns is unavailable.
+    
+    Args:
+        config: Configuration dictionary (network.nameservers overrides the system resolvers)
+        
+    Returns:
+        Resolver to pass as TCPConnector(resolver=...), or None for the default
+    """
+    nameservers = config.get('network', {}).get('nameservers') or None
+    try:
+        return AsyncResolver(nameservers=nameservers)
+    except RuntimeError as e:
+        logger.debug(f"Async DNS unavailable, using threaded resolver: {e}")
+        return None
+
+
+def _acceptable_headers(url: str, content_type: str, content_length: Optional[str],
+                        max_bytes: int = MAX_IMAGE_BYTES) -> bool:
+    """Reject non-image or oversized responses before reading the body"""
+    if not content_type.startswith('image/'):
+        logger.warning(f"URL does not return an image: {url} (content-type: {content_type})")
+        return False
+    if content_length and int(content_length) > max_bytes:
+        logger.warning(f"Image too large: {url} ({content_length} bytes)")
+        return False
+    return True
+
+
+async def read_capped(chunks: AsyncIterator[bytes], url: str, max_bytes: int = MAX_IMAGE_BYTES,
+                      content_length: Optional[int] = None) -> Optional[bytes]:
+    """
+    Stream a response body, giving up as soon as it is known to exceed max_bytes or its first
+    bytes show it is not an image (HTML error pages served as 200, etc.).
+    
+    Args:
+        chunks: Body chunks (aiohttp content.iter_chunked / httpx aiter_bytes)
+        url: URL being read (for logging)
+        max_bytes: Largest body accepted
+        content_length: Declared body size, if any, checked before reading
+        
+    Returns:
+        Body bytes, or None if the body is larger than max_bytes or not an image
+    """
+    if content_length is not None and content_length > max_bytes:
+        logger.warning(f"Image too large: {url} ({content_length} bytes)")
+        return None
+    
+    buf = bytearray()
+    checked = False
+    async for chunk in chunks:
+        buf += chunk
+        if len(buf) > max_bytes:
+            logger.warning(f"Image too large: {url} (over {max_bytes} bytes)")
+            return None
+        if not checked and len(buf) >= MAGIC_BYTES:
+            if not is_image_magic(bytes(buf[:MAGIC_BYTES])):
+                logger.warning(f"Response is not an image: {url}")
+                return None
+            checked = True
+    if not checked and not is_image_magic(bytes(buf)):
+        logger.warning(f"Response is not an image: {url}")
+        return None
+    return bytes(buf)
+
+
+def _acceptable_body(url: str, image_bytes: bytes, max_bytes: int = MAX_IMAGE_BYTES) -> Optional[bytes]:
+    """Size checks after download"""
+    if len(image_bytes) > max_bytes:
+        logger.warning(f"Downloaded image too large: {url} ({len(image_bytes)} bytes)")
+        return None
+    if len(image_bytes) < MIN_IMAGE_BYTES:
+        logger.warning(f"Downloaded image too small: {url} ({len(image_bytes)} bytes)")
+        return None
+    logger.info(f"Successfully downloaded image: {url} ({len(image_bytes)} bytes)")
+    return image_bytes
+
+
+async def fetch_image(session: aiohttp.ClientSession, url: str, max_retries: int = 3,
+                      max_bytes: int = MAX_IMAGE_BYTES) -> Optional[bytes]:
     """
     Download image from URL and return bytes or None if failed.
     
@@ -18,6 +144,7 @@ async def fetch_image(session: aiohttp.ClientSession, url: str, max_retries: int
         session: aiohttp session for making requests
         url: Image URL to download
         max_retries: Maximum number of retry attempts
+        max_bytes: Largest image accepted; bigger bodies are abandoned mid-stream
         
     Returns:
         Image bytes if successful, None if failed
@@ -28,45 +155,14 @@ async def fetch_image(session: aiohttp.ClientSession, url: str, max_retries: int
     
     for attempt in range(max_retries + 1):
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0 Safari/537.36',
-                'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Connection': 'keep-alive'
-            }
-            # Add Referer from URL to improve CDN acceptance
-            try:
-                parsed = urlparse(url)
-                if parsed.netloc:
-                    headers['Referer'] = f"https://{parsed.netloc}"
-            except Exception:
-                pass
-            
-            async with session.get(url, headers=headers) as response:
+            async with session.get(url, headers=_request_headers(url)) as response:
                 if response.status == 200:
                     content_type = response.headers.get('content-type', '').lower()
-                    if not content_type.startswith('image/'):
-                        logger.warning(f"URL does not return an image: {url} (content-type: {content_type})")
+                    if not _acceptable_headers(url, content_type, response.headers.get('content-length'), max_bytes):
                         return None
                     
-                    content_length = response.headers.get('content-length')
-                    if content_length and int(content_length) > 10 * 1024 * 1024:  # 10MB limit
-                        logger.warning(f"Image too large: {url} ({content_length} bytes)")
-                        return None
-                    
-                    image_bytes = await response.read()
-                    
-                    # Additional size check after download
-                    if len(image_bytes) > 10 * 1024 * 1024:  # 10MB limit
-                        logger.warning(f"Downloaded image too large: {url} ({len(image_bytes)} bytes)")
-                        return None
-                    
-                    if len(image_bytes) < 1024:  # Minimum 1KB
-                        logger.warning(f"Downloaded image too small: {url} ({len(image_bytes)} bytes)")
-                        return None
-                    
-                    logger.info(f"Successfully downloaded image: {url} ({len(image_bytes)} bytes)")
-                    return image_bytes
+                    image_bytes = await read_capped(response.content.iter_chunked(READ_CHUNK_BYTES), url, max_bytes)
+                    return _acceptable_body(url, image_bytes, max_bytes) if image_bytes is not None else None
                     
                 elif response.status == 404:
                     logger.warning(f"Image not found (404): {url}")
@@ -97,40 +193,170 @@ async def fetch_image(session: aiohttp.ClientSession, url: str, max_retries: int
     return None
 
 
-async def download_batch(urls: list[str], config: dict) -> dict[str, Optional[bytes]]:
+async def fetch_image_http2(client: httpx.AsyncClient, url: str, max_retries: int = 3,
+                            max_bytes: int = MAX_IMAGE_BYTES) -> Optional[bytes]:
+    """
+    fetch_image over an httpx client, so concurrent requests to one CDN multiplex on an HTTP/2 connection.
+    
+    Args:
+        client: httpx client (created with http2=True)
+        url: Image URL to download
+        max_retries: Maximum number of retry attempts
+        max_bytes: Largest image accepted; bigger bodies are abandoned mid-stream
+        
+    Returns:
+        Image bytes if successful, None if failed
+    """
+    if not url or not url.startswith(('http://', 'https://')):
+        logger.warning(f"Invalid URL: {url}")
+        return None
+    
+    for attempt in range(max_retries + 1):
+        try:
+            async with client.stream('GET', url, headers=_request_headers(url)) as response:
+                if response.status_code == 200:
+                    content_type = response.headers.get('content-type', '').lower()
+                    if not _acceptable_headers(url, content_type, response.headers.get('content-length'), max_bytes):
+                        return None
+                    
+                    image_bytes = await read_capped(response.aiter_bytes(READ_CHUNK_BYTES), url, max_bytes)
+                    return _acceptable_body(url, image_bytes, max_bytes) if image_bytes is not None else None
+                    
+                elif response.status_code in (403, 404):
+                    logger.warning(f"HTTP {response.status_code} for URL: {url}")
+                    return None
+                else:
+                    logger.warning(f"HTTP {response.status_code} for URL: {url}")
+                    
+        except httpx.TimeoutException:
+            logger.warning(f"Timeout downloading image (attempt {attempt + 1}): {url}")
+        except Exception as e:
+            logger.error(f"Error downloading image (attempt {attempt + 1}): {url} - {str(e)}")
+        
+        if attempt < max_retries:
+            await asyncio.sleep(2 ** attempt)  # Exponential backoff
+    
+    return None
+
+
+async def download_batch(urls: list[str], config: dict,
+                         session: Optional[aiohttp.ClientSession] = None,
+                         client: Optional[httpx.AsyncClient] = None) -> dict[str, Optional[bytes]]:
     """
     Download multiple images concurrently.
     
     Args:
         urls: List of image URLs to download
         config: Configuration dictionary
+        session: Optional open session to reuse (keeps connections alive across calls)
+        client: Optional open HTTP/2 httpx client; takes precedence over session
         
     Returns:
         Dictionary mapping URL to image bytes (or None if failed)
     """
-    connector = aiohttp.TCPConnector(limit=config['network']['concurrency'])
-    timeout = aiohttp.ClientTimeout(total=config['network']['timeout'])
+    max_bytes = config['network'].get('max_download_bytes', MAX_IMAGE_BYTES)
+    per_host = config['network'].get('per_host_limit', PER_HOST_LIMIT)
+    if client is not None and not client.is_closed:
+        return await _download_all_by_host(
+            urls, lambda url: fetch_image_http2(client, url, max_bytes=max_bytes), per_host
+        )
+    if session is not None and not session.closed:
+        return await _download_all(urls, lambda url: fetch_image(session, url, max_bytes=max_bytes))
+    
+    if config['network'].get('http2_downloads', False):
+        limits = httpx.Limits(max_connections=config['network']['concurrency'], max_keepalive_connections=64)
+        async with httpx.AsyncClient(http2=True, limits=limits, timeout=config['network']['timeout']) as client:
+            return await _download_all_by_host(
+                urls, lambda url: fetch_image_http2(client, url, max_bytes=max_bytes), per_host
+            )
     
-    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-        tasks = []
-        for url in urls:
-            task = fetch_image(session, url)
-            tasks.append(task)
+    async with open_session(config, limit=config['network']['concurrency']) as session:
+        return await _download_all(urls, lambda url: fetch_image(session, url, max_bytes=max_bytes))
+
+
+def open_session(config: dict, limit: int = 0) -> aiohttp.ClientSession:
+    """
+    Keep-alive session for image downloads. Open it once and pass it to every download_batch
+    call, so DNS answers, TLS sessions and idle connections carry over between batches.
+    
+    Args:
+        config: Configuration dictionary
+        limit: Total connection cap; 0 leaves concurrency to the caller (network.per_host_limit
+            still caps requests to any one host)
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit, limit_per_host=config['network'].get('per_host_limit', PER_HOST_LIMIT),
+        resolver=dns_resolver(config), ttl_dns_cache=600, enable_cleanup_closed=True, keepalive_timeout=60
+    )
+    timeout = aiohttp.ClientTimeout(total=config['network']['timeout'])
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def _coalesced(url: str, fetch) -> asyncio.Future:
+    """The in-flight download of url on this loop, starting fetch(url) if there is none"""
+    future = _inflight.get(url)
+    if future is None or future.get_loop() is not asyncio.get_running_loop():
+        future = asyncio.ensure_future(fetch(url))
+        _inflight[url] = future
         
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        def _done(f: asyncio.Future, url: str = url) -> None:
+            if _inflight.get(url) is f:
+                del _inflight[url]
+        future.add_done_callback(_done)
+    return future
+
+
+async def _download_all(urls: list[str], fetch) -> dict[str, Optional[bytes]]:
+    """Fetch every distinct URL concurrently with fetch(url) and map each URL to its bytes (or None).
+    A URL another batch is already downloading is awaited rather than fetched again.
+    """
+    unique = list(dict.fromkeys(urls))
+    # Shielded: one caller being cancelled must not cancel a download others are waiting on
+    results = await asyncio.gather(*[asyncio.shield(_coalesced(url, fetch)) for url in unique],
+                                   return_exceptions=True)
+    
+    # Build result dictionary
+    url_to_bytes = {}
+    for url, result in zip(unique, results):
+        if isinstance(result, Exception):
+            logger.error(f"Exception downloading {url}: {result}")
+            url_to_bytes[url] = None
+        else:
+            url_to_bytes[url] = result
+    
+    return url_to_bytes
+
+
+async def _download_all_by_host(urls: list[str], fetch,
+                                per_host: int = PER_HOST_LIMIT) -> dict[str, Optional[bytes]]:
+    """
+    _download_all for HTTP/2: per host, the first request opens the connection and the host's
+    remaining URLs then go out together as streams on it, instead of racing to open one each.
+    Hosts are fetched concurrently, at most per_host requests at a time to each (HTTP/2 has no
+    connector-level per-host limit, and a burst of streams to one CDN draws 429s).
+    """
+    by_host: dict[str, list[str]] = {}
+    for url in dict.fromkeys(urls):
+        by_host.setdefault(urlparse(url).netloc, []).append(url)
+    
+    async def _host(host_urls: list[str]) -> dict[str, Optional[bytes]]:
+        slots = asyncio.Semaphore(per_host)
         
-        # Build result dictionary
-        url_to_bytes = {}
-        for url, result in zip(urls, results):
-            if isinstance(result, Exception):
-                logger.error(f"Exception downloading {url}: {result}")
-                url_to_bytes[url] = None
-            else:
-                url_to_bytes[url] = result
+        async def _limited(url: str) -> Optional[bytes]:
+            async with slots:
+                return await fetch(url)
         
-        return url_to_bytes
+        fetched = await _download_all(host_urls[:1], _limited)
+        fetched.update(await _download_all(host_urls[1:], _limited))
+        return fetched
+    
+    url_to_bytes = {}
+    for fetched in await asyncio.gather(*[_host(host_urls) for host_urls in by_host.values()]):
+        url_to_bytes.update(fetched)
+    return url_to_bytes
 
 
+@lru_cache(maxsize=8192)
 def is_valid_image_url(url: str) -> bool:
     """
     Basic validation of image URL.
@@ -149,12 +375,9 @@ def is_valid_image_url(url: str) -> bool:
         if not parsed.netloc:
             return False
         
-        # Check for common image extensions
+        # Either has a common image extension or no extension (could be dynamic URL)
         path = parsed.path.lower()
-        image_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
-        
-        # Either has image extension or no extension (could be dynamic URL)
-        return path.endswith(image_extensions) or '.' not in path.split('/')[-1]
+        return _IMG_EXT_RE.search(path) is not None or '.' not in path.rpartition('/')[2]
         
     except Exception:
         return False
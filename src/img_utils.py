@@ -4,11 +4,53 @@ Image processing utilities for optimization and quality control
 import io
 import logging
 import hashlib
+import struct
 from typing import Optional, Tuple
-from PIL import Image, ImageOps
+import PIL
+from PIL import Image, ImageOps, features
 
 logger = logging.getLogger(__name__)
 
+# JPEG start-of-frame markers (baseline, progressive, lossless, arithmetic); DHT/JPG/DAC share the range
+_SOF_MARKERS = frozenset({0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF})
+
+# JPEG quality bounds searched by optimise_image; the bisection stops once the bracket is narrower than the step
+JPEG_QUALITY_RANGE = (45, 95)
+JPEG_QUALITY_STEP = 5
+
+# Pillow's integer box pre-reduction kicks in when the source is at least this many times the target
+RESIZE_REDUCING_GAP = 2.0
+
+
+def describe_backend() -> str:
+    """
+    Describe the Pillow build doing the resize/encode work, for the startup log.
+    
+    Pillow-SIMD versions carry a ".postN" suffix; a plain Pillow means scalar resize kernels.
+    
+    Returns:
+        Human-readable backend description
+    """
+    simd = 'post' in PIL.__version__
+    turbo = bool(features.check_feature('libjpeg_turbo'))
+    return (f"Pillow{'-SIMD' if simd else ''} {PIL.__version__}, "
+            f"libjpeg-turbo {'yes' if turbo else 'no'}")
+
+
+def warm_up() -> None:
+    """
+    Load Pillow's JPEG codec and resampling code ahead of the first real image.
+    
+    Used as the initializer of process pools, so each worker pays its plugin import and
+    codec setup at spawn instead of on its first SKU.
+    """
+    output = io.BytesIO()
+    Image.new('RGB', (16, 16), (255, 255, 255)).save(output, format='JPEG', quality=90, optimize=True)
+    output.seek(0)
+    with Image.open(output) as img:
+        img.draft('RGB', (8, 8))
+        img.convert('RGB').resize((8, 8), Image.Resampling.LANCZOS)
+
 
 def optimise(img_bytes: bytes, size: int, fmt: str = "JPEG", max_kb: int = 200) -> Optional[bytes]:
     """
@@ -26,65 +68,212 @@ def optimise(img_bytes: bytes, size: int, fmt: str = "JPEG", max_kb: int = 200)
     try:
         # Open image from bytes
         with Image.open(io.BytesIO(img_bytes)) as img:
-            # Convert to RGB if necessary (for JPEG compatibility)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                # Create white background for transparent images
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Square crop (center crop to smallest dimension)
-            width, height = img.size
-            min_dimension = min(width, height)
-            
-            left = (width - min_dimension) // 2
-            top = (height - min_dimension) // 2
-            right = left + min_dimension
-            bottom = top + min_dimension
-            
-            img_cropped = img.crop((left, top, right, bottom))
-            
-            # Resize to target size
-            img_resized = img_cropped.resize((size, size), Image.Resampling.LANCZOS)
-            
-            # Save with compression, trying different quality levels
-            for quality in [95, 85, 75, 65, 55, 45]:
-                output = io.BytesIO()
-                save_kwargs = {'format': fmt}
-                
-                if fmt.upper() == 'JPEG':
-                    save_kwargs.update({
-                        'quality': quality,
-                        'optimize': True,
-                        'progressive': True
-                    })
-                elif fmt.upper() == 'PNG':
-                    save_kwargs.update({
-                        'optimize': True,
-                        'compress_level': 9
-                    })
-                
-                img_resized.save(output, **save_kwargs)
-                output_bytes = output.getvalue()
-                
-                # Check if file size is within limit
-                if len(output_bytes) <= max_kb * 1024:
-                    logger.info(f"Optimized image: {len(img_bytes)} -> {len(output_bytes)} bytes (quality: {quality})")
-                    return output_bytes
+            # Decode at the smallest DCT scale still covering the square crop
+            if img.format == 'JPEG':
+                img.draft('RGB', (size, size))
+            return optimise_image(img, size, fmt, max_kb, source_bytes=len(img_bytes))
             
-            # If we couldn't get under the size limit, return the smallest version
-            logger.warning(f"Could not optimize image under {max_kb}KB, returning best effort")
+    except Exception as e:
+        logger.error(f"Error optimizing image: {str(e)}")
+        return None
+
+
+def optimise_image(img: Image.Image, size: int, fmt: str = "JPEG", max_kb: int = 200,
+                   source_bytes: Optional[int] = None) -> Optional[bytes]:
+    """
+    Square-crop, resize & compress an already opened image; return optimized bytes.
+    
+    Args:
+        img: Opened PIL image
+        size: Target size (width and height in pixels)
+        fmt: Output format (JPEG, PNG, etc.)
+        max_kb: Maximum file size in KB
+        source_bytes: Encoded size of the source, for logging only
+        
+    Returns:
+        Optimized image bytes or None if processing failed
+    """
+    try:
+        # Convert to RGB if necessary (for JPEG compatibility)
+        if img.mode == 'P' and 'transparency' not in img.info:
+            # Opaque palette image - nothing to flatten
+            img = img.convert('RGB')
+        elif img.mode in ('RGBA', 'LA', 'P'):
+            # Create white background for transparent images
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            # Only the alpha band is extracted as the mask (split() would copy every band)
+            background.paste(img, mask=img.getchannel('A'))
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        # Square crop (center crop to smallest dimension)
+        width, height = img.size
+        min_dimension = min(width, height)
+        
+        left = (width - min_dimension) // 2
+        top = (height - min_dimension) // 2
+        right = left + min_dimension
+        bottom = top + min_dimension
+        
+        # Crop and resize in one pass (box= reads the square straight from the source); sources
+        # more than 2x the target are box-reduced by an integer factor before the LANCZOS pass
+        img_resized = img.resize((size, size), Image.Resampling.LANCZOS,
+                                 box=(left, top, right, bottom), reducing_gap=RESIZE_REDUCING_GAP)
+        
+        limit = max_kb * 1024
+        
+        # Encoder options are fixed per call; only quality varies between attempts
+        save_kwargs = {'format': fmt}
+        if fmt.upper() == 'JPEG':
+            save_kwargs.update({
+                'optimize': True,
+                'progressive': True
+            })
+        elif fmt.upper() == 'PNG':
+            save_kwargs.update({
+                'optimize': True,
+                'compress_level': 9
+            })
+        
+        # One buffer for every attempt; bytes are copied out only for the result
+        output = io.BytesIO()
+        
+        def encode(quality: int, probe: bool = False) -> int:
+            output.seek(0)
+            output.truncate()
+            if probe:
+                # Baseline, unoptimised JPEG: ~3x faster and slightly larger than the final encode
+                img_resized.save(output, format=fmt, quality=quality)
+            else:
+                img_resized.save(output, quality=quality, **save_kwargs)
+            return output.tell()
+        
+        # Highest quality first - most sources already fit; quality only affects JPEG size
+        lo, hi = JPEG_QUALITY_RANGE
+        quality = hi
+        encode(quality)
+        output_bytes = output.getvalue()
+        
+        if fmt.upper() == 'JPEG' and len(output_bytes) > limit:
+            # Bisect for the highest quality that fits, stopping once within 5% of the budget.
+            # Probes are baseline encodes; only the chosen quality is encoded progressive
+            chosen = None
+            hi -= 1
+            while hi - lo >= JPEG_QUALITY_STEP:
+                q = (lo + hi) // 2
+                probed = encode(q, probe=True)
+                if probed <= limit:
+                    chosen = q
+                    if limit - probed < limit // 20:
+                        break
+                    lo = q + 1
+                else:
+                    hi = q - 1
+            # Nothing probed fits - fall back to the lowest quality
+            quality = chosen if chosen is not None else lo
+            encode(quality)
+            output_bytes = output.getvalue()
+        
+        # Check if file size is within limit
+        if len(output_bytes) <= limit:
+            logger.info(f"Optimized image: {source_bytes} -> {len(output_bytes)} bytes (quality: {quality})")
             return output_bytes
-            
+        
+        # If we couldn't get under the size limit, return the smallest version
+        logger.warning(f"Could not optimize image under {max_kb}KB, returning best effort")
+        return output_bytes
+        
     except Exception as e:
         logger.error(f"Error optimizing image: {str(e)}")
         return None
 
 
+def needs_reencode(img_bytes: bytes, size: int, max_kb: int = 200) -> bool:
+    """
+    Whether optimise would have to re-encode a JPEG, judged from its headers without decoding.
+    
+    A complete 3-component JPEG that is already size x size and within max_kb can be kept
+    verbatim. EXIF-bearing files are re-encoded, since they may carry an orientation.
+    
+    Args:
+        img_bytes: Original image bytes
+        size: Target size (width and height in pixels)
+        max_kb: Maximum file size in KB
+        
+    Returns:
+        False only when the bytes already meet the output constraints
+    """
+    if len(img_bytes) > max_kb * 1024 or img_bytes[:2] != b'\xff\xd8':
+        return True
+    # A truncated download would decode with a grey tail - require the end-of-image marker
+    if not img_bytes.rstrip(b'\x00\r\n ').endswith(b'\xff\xd9'):
+        return True
+    
+    offset = 2
+    while offset + 4 <= len(img_bytes):
+        if img_bytes[offset] != 0xFF:
+            return True
+        marker = img_bytes[offset + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            offset += 1
+            continue
+        if marker == 0xE1 and img_bytes[offset + 4:offset + 10] == b'Exif\x00\x00':
+            return True
+        if marker in _SOF_MARKERS:
+            if offset + 10 > len(img_bytes):
+                return True
+            height, width = struct.unpack('>HH', img_bytes[offset + 5:offset + 9])
+            components = img_bytes[offset + 9]
+            return (width, height) != (size, size) or components != 3
+        if marker == 0xDA:
+            # Scan data before any frame header
+            return True
+        offset += 2 + struct.unpack('>H', img_bytes[offset + 2:offset + 4])[0]
+    return True
+
+
+def validate_and_optimise(img_bytes: bytes, size: int, fmt: str = "JPEG", max_kb: int = 200,
+                          min_size: int = 100) -> Tuple[bool, Optional[bytes]]:
+    """
+    is_valid_image followed by optimise, decoding the source only once.
+    
+    Args:
+        img_bytes: Original image bytes
+        size: Target size (width and height in pixels)
+        fmt: Output format (JPEG, PNG, etc.)
+        max_kb: Maximum file size in KB
+        min_size: Minimum width/height in pixels
+        
+    Returns:
+        (is_valid, optimized bytes or None)
+    """
+    if fmt.upper() == 'JPEG' and size >= min_size and not needs_reencode(img_bytes, size, max_kb):
+        # Already a finished output - nothing to decode or re-encode
+        return True, img_bytes
+    
+    try:
+        img = Image.open(io.BytesIO(img_bytes))
+        # Dimensions come from the header - reject small images before decoding any pixels
+        width, height = img.size
+        if width < min_size or height < min_size:
+            logger.warning(f"Image too small: {width}x{height} (minimum: {min_size})")
+            return False, None
+        # JPEGs decode straight at the smallest DCT scale (1/2, 1/4, 1/8) still covering the
+        # square crop, so a large source never materialises at full resolution
+        if img.format == 'JPEG':
+            img.draft('RGB', (size, size))
+        img.load()
+    except Exception as e:
+        logger.error(f"Invalid image: {str(e)}")
+        return False, None
+    
+    return True, optimise_image(img, size, fmt, max_kb, source_bytes=len(img_bytes))
+
+
 def get_image_info(img_bytes: bytes) -> Optional[dict]:
     """
     Get basic information about an image.
@@ -126,6 +315,9 @@ def is_valid_image(img_bytes: bytes, min_size: int = 100) -> bool:
     """
     Check if image bytes represent a valid image meeting minimum requirements.
     
+    Header-only: dimensions come from the file header and nothing is decoded. Truncated pixel
+    data is caught where the image is actually decoded (validate_and_optimise / optimise).
+    
     Args:
         img_bytes: Image bytes to validate
         min_size: Minimum width/height in pixels
@@ -142,9 +334,6 @@ def is_valid_image(img_bytes: bytes, min_size: int = 100) -> bool:
                 logger.warning(f"Image too small: {width}x{height} (minimum: {min_size})")
                 return False
             
-            # Check if image is corrupted by trying to load it
-            img.load()
-            
             return True
             
     except Exception as e:
@@ -165,6 +354,8 @@ def resize_and_crop(img_bytes: bytes, target_size: Tuple[int, int]) -> Optional[
     """
     try:
         with Image.open(io.BytesIO(img_bytes)) as img:
+            if img.format == 'JPEG':
+                img.draft('RGB', target_size)
             # Convert to RGB if necessary
             if img.mode != 'RGB':
                 img = img.convert('RGB')
@@ -6,21 +6,48 @@ import argparse
 import logging
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Set
+from typing import List, Dict, Optional, Set
+import orjson
 import yaml
 import pandas as pd
 from dotenv import load_dotenv
 
+try:  # libuv event loop (optional, not on Windows)
+    import uvloop
+except ImportError:
+    uvloop = None
+
 from . import scrape, downloader, img_utils, storage, qa
+from .serp_cache import open_cache
 
 logger = logging.getLogger(__name__)
 
+try:  # Rust-backed Excel reader (pandas >= 2.2), optional
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = 'calamine' if tuple(int(v) for v in pd.__version__.split('.')[:2]) >= (2, 2) else None
+except ImportError:
+    EXCEL_ENGINE = None
+
+# Column names recognised as the barcode/SKU column, case-insensitive
+BARCODE_COLUMNS = ('barcode', 'sku', 'product_code', 'code', 'item_code')
+
+# Searched slices that may wait for the download stage before searching pauses
+PIPELINE_QUEUE_SLICES = 2
+
+# Validate/optimise/save runs in worker processes; created on first use and kept across batches
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+
 
 def load_config(config_path: str) -> dict:
     """
     Load configuration from YAML file with environment variable substitution.
     
+    The parsed YAML is cached next to the file as JSON, stamped with the file's mtime and size,
+    so repeat runs skip the YAML parse. Environment variables are substituted after loading, so
+    the cache never holds their values (e.g. the SerpAPI key).
+    
     Args:
         config_path: Path to configuration file
         
@@ -28,20 +55,58 @@ def load_config(config_path: str) -> dict:
         Configuration dictionary
     """
     try:
-        with open(config_path, 'r') as f:
-            config_content = f.read()
+        st = os.stat(config_path)
+        stamp = f"{st.st_mtime_ns}:{st.st_size}".encode()
+        cache_path = f"{config_path}.cache.json"
         
-        # Replace environment variables
-        config_content = os.path.expandvars(config_content)
+        config = _read_config_cache(cache_path, stamp)
+        if config is None:
+            with open(config_path, 'r') as f:
+                config = yaml.safe_load(f)
+            _write_config_cache(cache_path, stamp, config)
         
-        config = yaml.safe_load(config_content)
-        return config
+        # Replace environment variables
+        return _expand_env(config)
         
     except Exception as e:
         logger.error(f"Error loading config from {config_path}: {str(e)}")
         raise
 
 
+def _expand_env(value):
+    """Apply os.path.expandvars to every string in a parsed config"""
+    if isinstance(value, str):
+        return os.path.expandvars(value) if '$' in value else value
+    if isinstance(value, dict):
+        return {key: _expand_env(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_expand_env(item) for item in value]
+    return value
+
+
+def _read_config_cache(cache_path: str, stamp: bytes) -> Optional[dict]:
+    """The cached parse of the config if it was made from the current file, else None"""
+    try:
+        with open(cache_path, 'rb') as f:
+            if f.readline().rstrip(b'\n') != stamp:
+                return None
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+
+def _write_config_cache(cache_path: str, stamp: bytes, config) -> None:
+    """Store the parsed config for the next run; configs JSON cannot represent are not cached"""
+    try:
+        body = orjson.dumps(config)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(stamp + b'\n' + body)
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError) as e:
+        logger.debug(f"Config cache not written: {str(e)}")
+
+
 def load_skus_from_excel(excel_files: List[str]) -> Set[str]:
     """
     Load SKUs from Excel files.
@@ -58,20 +123,15 @@ def load_skus_from_excel(excel_files: List[str]) -> Set[str]:
         try:
             logger.info(f"Loading SKUs from: {excel_file}")
             
-            # Try to read Excel file
-            df = pd.read_excel(excel_file)
+            # Only parse barcode/SKU columns (common names); the rest of the sheet is never converted
+            df = pd.read_excel(excel_file, engine=EXCEL_ENGINE,
+                               usecols=lambda col: str(col).lower() in BARCODE_COLUMNS)
             
-            # Look for barcode/SKU columns (common names)
-            barcode_columns = ['barcode', 'sku', 'product_code', 'code', 'item_code']
-            barcode_col = None
-            
-            for col in df.columns:
-                if col.lower() in barcode_columns:
-                    barcode_col = col
-                    break
-            
-            if barcode_col is None:
+            if len(df.columns):
+                barcode_col = df.columns[0]
+            else:
                 # If no obvious column found, use first column
+                df = pd.read_excel(excel_file, engine=EXCEL_ENGINE, usecols=[0])
                 barcode_col = df.columns[0]
                 logger.warning(f"No barcode column found, using first column: {barcode_col}")
             
@@ -89,7 +149,55 @@ def load_skus_from_excel(excel_files: List[str]) -> Set[str]:
     return all_skus
 
 
-async def process_sku_batch(skus: List[str], config: dict, resume_skus: Set[str] = None) -> Dict[str, bool]:
+def _get_cpu_pool() -> ProcessPoolExecutor:
+    """Return the shared worker pool for the CPU-bound image stage"""
+    global _cpu_pool
+    if _cpu_pool is None:
+        _cpu_pool = ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=img_utils.warm_up)
+    return _cpu_pool
+
+
+def _process_one(sku: str, image_bytes: bytes, size: int, fmt: str, max_kb: int, output_path: Path) -> bool:
+    """
+    Validate, optimise and save one downloaded image. Runs in a worker process.
+    
+    Args:
+        sku: SKU the image belongs to
+        image_bytes: Downloaded image bytes
+        size: Target size (width and height in pixels)
+        fmt: Output format
+        max_kb: Maximum file size in KB
+        output_path: Where to save the optimized image
+        
+    Returns:
+        True if the image was saved
+    """
+    try:
+        # Validate and optimize image (decoded once)
+        valid, optimized_bytes = img_utils.validate_and_optimise(image_bytes, size=size, fmt=fmt, max_kb=max_kb)
+        
+        if not valid:
+            logger.warning(f"Invalid image for SKU {sku}")
+            return False
+        
+        if optimized_bytes is None:
+            logger.warning(f"Failed to optimize image for SKU {sku}")
+            return False
+        
+        if storage.save_image(optimized_bytes, output_path):
+            logger.info(f"Successfully processed SKU {sku}")
+            return True
+        
+        logger.error(f"Failed to save image for SKU {sku}")
+        return False
+        
+    except Exception as e:
+        logger.error(f"Error processing SKU {sku}: {str(e)}")
+        return False
+
+
+async def process_sku_batch(skus: List[str], config: dict, resume_skus: Set[str] = None,
+                            search_session=None, download_session=None, serp_cache=None) -> Dict[str, bool]:
     """
     Process a batch of SKUs: search -> download -> optimize -> save.
     
@@ -97,6 +205,9 @@ async def process_sku_batch(skus: List[str], config: dict, resume_skus: Set[str]
         skus: List of SKUs to process
         config: Configuration dictionary
         resume_skus: Set of SKUs to skip (already processed)
+        search_session: Optional open SerpAPI session (scrape.open_session) shared across batches
+        download_session: Optional open download session (downloader.open_session) shared across batches
+        serp_cache: Optional SerpAPI result cache (serp_cache.open_cache) shared across batches
         
     Returns:
         Dictionary mapping SKU to success status
@@ -113,72 +224,69 @@ async def process_sku_batch(skus: List[str], config: dict, resume_skus: Set[str]
     
     logger.info(f"Processing batch of {len(skus_to_process)} SKUs")
     
-    # Step 1: Search for images
-    logger.info("Step 1: Searching for images...")
-    sku_to_urls = await scrape.search_batch(skus_to_process, config)
-    
-    # Step 2: Download images
-    logger.info("Step 2: Downloading images...")
-    download_tasks = []
-    sku_url_pairs = []
-    
-    for sku, urls in sku_to_urls.items():
-        if urls:
-            # Take first URL for now (could be enhanced to try multiple)
-            url = urls[0]
-            sku_url_pairs.append((sku, url))
-    
-    if sku_url_pairs:
-        urls_to_download = [url for _, url in sku_url_pairs]
-        url_to_bytes = await downloader.download_batch(urls_to_download, config)
-    else:
-        url_to_bytes = {}
-    
-    # Step 3: Process and save images
-    logger.info("Step 3: Processing and saving images...")
+    # The batch flows through the stages in slices: while one slice downloads, the next is being
+    # searched and finished downloads are already optimising in the process pool
+    slice_size = config['network']['concurrency']
+    found: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SLICES)
     results = {}
-    
-    for sku, url in sku_url_pairs:
+    jobs = []
+    loop = asyncio.get_running_loop()
+    pool = _get_cpu_pool()
+    size = config['image']['size']
+    fmt = config['image']['format'].upper()
+    max_kb = config['image']['max_kb']
+    
+    async def search_stage() -> None:
         try:
-            image_bytes = url_to_bytes.get(url)
-            
-            if image_bytes is None:
-                logger.warning(f"No image downloaded for SKU {sku}")
-                results[sku] = False
-                continue
-            
-            # Validate image
-            if not img_utils.is_valid_image(image_bytes):
-                logger.warning(f"Invalid image for SKU {sku}")
-                results[sku] = False
-                continue
-            
-            # Optimize image
-            optimized_bytes = img_utils.optimise(
-                image_bytes,
-                size=config['image']['size'],
-                fmt=config['image']['format'].upper(),
-                max_kb=config['image']['max_kb']
-            )
-            
-            if optimized_bytes is None:
-                logger.warning(f"Failed to optimize image for SKU {sku}")
-                results[sku] = False
+            for i in range(0, len(skus_to_process), slice_size):
+                # Step 1: Search for images
+                logger.info(f"Step 1: Searching for images ({i + 1}-{min(i + slice_size, len(skus_to_process))})...")
+                try:
+                    sku_to_urls = await scrape.search_batch(skus_to_process[i:i + slice_size], config, search_session,
+                                                            serp_cache)
+                except Exception as e:
+                    logger.error(f"Error searching slice: {str(e)}")
+                    continue
+                # Take first URL for now (could be enhanced to try multiple)
+                await found.put([(sku, urls[0]) for sku, urls in sku_to_urls.items() if urls])
+        finally:
+            await found.put(None)
+    
+    async def download_stage() -> None:
+        while (sku_url_pairs := await found.get()) is not None:
+            if not sku_url_pairs:
                 continue
             
-            # Save image
-            output_path = storage.get_output_path(sku, config['output']['base_dir'])
+            # Step 2: Download images
+            logger.info(f"Step 2: Downloading images ({len(sku_url_pairs)} SKUs)...")
+            try:
+                url_to_bytes = await downloader.download_batch([url for _, url in sku_url_pairs], config,
+                                                                session=download_session)
+            except Exception as e:
+                logger.error(f"Error downloading slice: {str(e)}")
+                url_to_bytes = {}
             
-            if storage.save_image(optimized_bytes, output_path):
-                logger.info(f"Successfully processed SKU {sku}")
-                results[sku] = True
-            else:
-                logger.error(f"Failed to save image for SKU {sku}")
-                results[sku] = False
+            # Step 3: Process and save images (in the background while the next slice downloads)
+            output_paths = storage.paths_for_skus([sku for sku, _ in sku_url_pairs], config['output']['base_dir'])
+            for (sku, url), output_path in zip(sku_url_pairs, output_paths):
+                image_bytes = url_to_bytes.get(url)
                 
-        except Exception as e:
-            logger.error(f"Error processing SKU {sku}: {str(e)}")
-            results[sku] = False
+                if image_bytes is None:
+                    logger.warning(f"No image downloaded for SKU {sku}")
+                    results[sku] = False
+                    continue
+                
+                jobs.append((sku, loop.run_in_executor(pool, _process_one, sku, image_bytes, size, fmt, max_kb,
+                                                       output_path)))
+    
+    await asyncio.gather(search_stage(), download_stage())
+    
+    outcomes = await asyncio.gather(*(job for _, job in jobs), return_exceptions=True)
+    for (sku, _), outcome in zip(jobs, outcomes):
+        if isinstance(outcome, BaseException):
+            logger.error(f"Error processing SKU {sku}: {str(outcome)}")
+            outcome = False
+        results[sku] = outcome
     
     # Handle SKUs with no images found
     for sku in skus_to_process:
@@ -234,32 +342,46 @@ async def run_pipeline(excel_files: List[str], config: dict, limit: int = None,
     successful_count = 0
     failed_count = 0
     
-    for i in range(0, len(sku_list), batch_size):
-        batch_num = i // batch_size + 1
-        batch_skus = sku_list[i:i + batch_size]
-        
-        logger.info(f"Processing batch {batch_num}/{total_batches} ({len(batch_skus)} SKUs)")
-        
-        try:
-            batch_results = await process_sku_batch(batch_skus, config, processed_skus)
-            
-            # Update counters
-            for sku, success in batch_results.items():
-                if success:
-                    successful_count += 1
-                    processed_skus.add(sku)
-                else:
-                    failed_count += 1
-            
-            # Save progress
-            if resume:
-                storage.create_resume_file(processed_skus)
+    # One SerpAPI session and one download session for the whole run, so connections, DNS answers
+    # and TLS sessions carry over between batches (HTTP/2 downloads open their own client).
+    # Barcodes searched on an earlier run are answered from the SerpAPI cache instead
+    search_session = scrape.open_session(config)
+    serp_cache = open_cache(config)
+    download_session = None if config['network'].get('http2_downloads', False) else downloader.open_session(config)
+    try:
+        for i in range(0, len(sku_list), batch_size):
+            batch_num = i // batch_size + 1
+            batch_skus = sku_list[i:i + batch_size]
             
-            logger.info(f"Batch {batch_num} complete. Success: {successful_count}, Failed: {failed_count}")
+            logger.info(f"Processing batch {batch_num}/{total_batches} ({len(batch_skus)} SKUs)")
             
-        except Exception as e:
-            logger.error(f"Error processing batch {batch_num}: {str(e)}")
-            continue
+            try:
+                batch_results = await process_sku_batch(batch_skus, config, processed_skus,
+                                                        search_session, download_session, serp_cache)
+                
+                # Update counters
+                for sku, success in batch_results.items():
+                    if success:
+                        successful_count += 1
+                        processed_skus.add(sku)
+                    else:
+                        failed_count += 1
+                
+                # Save progress
+                if resume:
+                    storage.create_resume_file(processed_skus)
+                
+                logger.info(f"Batch {batch_num} complete. Success: {successful_count}, Failed: {failed_count}")
+                
+            except Exception as e:
+                logger.error(f"Error processing batch {batch_num}: {str(e)}")
+                continue
+    finally:
+        await search_session.close()
+        if serp_cache is not None:
+            serp_cache.close()
+        if download_session is not None:
+            await download_session.close()
     
     logger.info(f"Pipeline complete. Total processed: {successful_count}, Failed: {failed_count}")
 
@@ -286,6 +408,7 @@ def run(excel_files: List[str], cfg_path: str, limit: int = None, resume: bool =
         level=log_level,
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
+    logger.info(f"Image backend: {img_utils.describe_backend()}")
     
     # Validate configuration
     required_keys = ['search', 'network', 'output', 'image']
@@ -299,12 +422,15 @@ def run(excel_files: List[str], cfg_path: str, limit: int = None, resume: bool =
     
     # Run pipeline
     try:
-        asyncio.run(run_pipeline(excel_files, config, limit, resume))
+        (uvloop.run if uvloop is not None else asyncio.run)(run_pipeline(excel_files, config, limit, resume))
     except KeyboardInterrupt:
         logger.info("Pipeline interrupted by user")
     except Exception as e:
         logger.error(f"Pipeline failed: {str(e)}")
         raise
+    finally:
+        if _cpu_pool is not None:
+            _cpu_pool.shutdown()
 
 
 def main():
@@ -4,13 +4,44 @@ Quality assurance checks for processed images
 import os
 import logging
 from pathlib import Path
-from typing import Dict, List, Set
+from typing import Dict, Iterator, List, Optional, Set
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
+import numpy as np
+import orjson
 from PIL import Image
 
+try:  # SIMD non-cryptographic hash for duplicate detection (optional)
+    import xxhash
+except ImportError:
+    xxhash = None
+
 logger = logging.getLogger(__name__)
 
+# Exact-duplicate fingerprint; only content identity matters, so a non-cryptographic hash will do
+FILE_HASH_NAME = 'xxh3_64' if xxhash is not None else 'sha1'
+
+# Read size for streaming file hashes (xxhash, or SHA-1 on Pythons without hashlib.file_digest)
+HASH_CHUNK_SIZE = 64 * 1024
+
+# Threads for check_directory; the per-file work is file I/O, image decoding and hashing, all GIL-free
+QA_WORKERS = 32
+
+# Sidecar in the checked directory: relative path -> mtime/size/dimensions/hashes of files already checked
+QA_CACHE_FILE = ".qa_cache.json"
+
+IMAGE_EXTENSIONS = frozenset({'jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp'})
+
+# Perceptual hash: 8x8 lowest DCT frequencies of a 32x32 grayscale thumbnail (same layout as imagehash.phash)
+PHASH_SIZE = 8
+PHASH_SAMPLE = 32
+# Files whose 64-bit hashes differ in at most this many bits look the same; 4 x 16-bit bands find all
+# pairs within 3 bits (pigeonhole), so raising this needs more bands
+PHASH_MAX_DISTANCE = 3
+PHASH_BANDS = 4
+_DCT = np.cos(np.pi * np.outer(np.arange(PHASH_SIZE), 2 * np.arange(PHASH_SAMPLE) + 1) / (2 * PHASH_SAMPLE))
+
 
 class QAReport:
     """Container for QA check results"""
@@ -21,6 +52,8 @@ class QAReport:
         self.issues = defaultdict(list)
         self.file_hashes = {}
         self.duplicates = defaultdict(list)
+        self.perceptual_hashes = {}
+        self.near_duplicates = []
         
     def add_issue(self, category: str, message: str):
         """Add an issue to the report"""
@@ -32,7 +65,8 @@ class QAReport:
         
     def has_issues(self) -> bool:
         """Check if there are any issues"""
-        return len(self.issues) > 0 or len([d for d in self.duplicates.values() if len(d) > 1]) > 0
+        return (len(self.issues) > 0 or len([d for d in self.duplicates.values() if len(d) > 1]) > 0
+                or len(self.near_duplicates) > 0)
         
     def print_summary(self):
         """Print QA report summary"""
@@ -63,6 +97,15 @@ class QAReport:
             if len(duplicate_groups) > 5:
                 print(f"  ... and {len(duplicate_groups) - 5} more groups")
         
+        if self.near_duplicates:
+            print(f"\nNEAR-DUPLICATE IMAGES ({len(self.near_duplicates)} groups):")
+            for i, files in enumerate(self.near_duplicates[:5]):  # Show first 5 groups
+                print(f"  Group {i+1}:")
+                for file in files:
+                    print(f"    - {file}")
+            if len(self.near_duplicates) > 5:
+                print(f"  ... and {len(self.near_duplicates) - 5} more groups")
+        
         if not self.has_issues():
             print(f"\n✅ All files passed QA checks!")
         else:
@@ -82,18 +125,19 @@ def check_image_resolution(file_path: Path, min_resolution: int = 1000) -> tuple
     """
     try:
         with Image.open(file_path) as img:
-            width, height = img.size
-            min_dimension = min(width, height)
-            
-            if min_dimension < min_resolution:
-                return False, f"Resolution too low: {width}x{height} (min: {min_resolution}px)"
-            
-            return True, ""
+            return _check_dimensions(*img.size, min_resolution)
             
     except Exception as e:
         return False, f"Cannot read image: {str(e)}"
 
 
+def _check_dimensions(width: int, height: int, min_resolution: int) -> tuple[bool, str]:
+    """Resolution check on known dimensions"""
+    if min(width, height) < min_resolution:
+        return False, f"Resolution too low: {width}x{height} (min: {min_resolution}px)"
+    return True, ""
+
+
 def check_file_size(file_path: Path, max_kb: int = 200) -> tuple[bool, str]:
     """
     Check if file size is within limit.
@@ -106,39 +150,199 @@ def check_file_size(file_path: Path, max_kb: int = 200) -> tuple[bool, str]:
         Tuple of (is_valid, error_message)
     """
     try:
-        size_bytes = file_path.stat().st_size
-        size_kb = size_bytes / 1024
-        
-        if size_kb > max_kb:
-            return False, f"File too large: {size_kb:.1f}KB (max: {max_kb}KB)"
-        
-        if size_kb < 1:
-            return False, f"File too small: {size_kb:.1f}KB"
-        
-        return True, ""
+        return _check_size(file_path.stat().st_size, max_kb)
         
     except Exception as e:
         return False, f"Cannot check file size: {str(e)}"
 
 
+def _check_size(size_bytes: int, max_kb: int) -> tuple[bool, str]:
+    """File size check on a known byte count"""
+    size_kb = size_bytes / 1024
+    
+    if size_kb > max_kb:
+        return False, f"File too large: {size_kb:.1f}KB (max: {max_kb}KB)"
+    
+    if size_kb < 1:
+        return False, f"File too small: {size_kb:.1f}KB"
+    
+    return True, ""
+
+
 def calculate_file_hash(file_path: Path) -> str:
     """
-    Calculate SHA-1 hash of file.
+    Calculate the duplicate-detection hash of a file (FILE_HASH_NAME: xxh3_64, or SHA-1 without xxhash).
     
     Args:
         file_path: Path to file
         
     Returns:
-        SHA-1 hash as hexadecimal string
+        Hash as hexadecimal string
     """
     try:
         with open(file_path, 'rb') as f:
-            return hashlib.sha1(f.read()).hexdigest()
+            if xxhash is None and hasattr(hashlib, 'file_digest'):
+                return hashlib.file_digest(f, 'sha1').hexdigest()
+            # Stream through one reused buffer instead of reading the whole file
+            digest = xxhash.xxh3_64() if xxhash is not None else hashlib.sha1()
+            view = memoryview(bytearray(HASH_CHUNK_SIZE))
+            while n := f.readinto(view):
+                digest.update(view[:n])
+            return digest.hexdigest()
     except Exception as e:
         logger.error(f"Error calculating hash for {file_path}: {str(e)}")
         return ""
 
 
+def perceptual_hash(img: Image.Image) -> int:
+    """
+    64-bit DCT perceptual hash of an opened image; survives re-encoding at a different quality.
+    
+    Args:
+        img: Opened PIL image (not yet loaded, so JPEGs can be draft-decoded)
+        
+    Returns:
+        Hash as an unsigned 64-bit integer
+    """
+    if img.format == 'JPEG':
+        img.draft('L', (PHASH_SAMPLE * 2, PHASH_SAMPLE * 2))
+    pixels = np.asarray(img.convert('L').resize((PHASH_SAMPLE, PHASH_SAMPLE), Image.Resampling.BOX),
+                        dtype=np.float64)
+    low = _DCT @ pixels @ _DCT.T
+    return int.from_bytes(np.packbits(low > np.median(low)).tobytes(), 'big')
+
+
+def group_near_duplicates(hashes: Dict[str, int], max_distance: int = PHASH_MAX_DISTANCE) -> List[List[str]]:
+    """
+    Group files whose perceptual hashes are within max_distance bits of each other.
+    
+    Args:
+        hashes: File path -> perceptual hash
+        max_distance: Largest Hamming distance counted as the same image
+        
+    Returns:
+        Groups of two or more file paths
+    """
+    paths = list(hashes)
+    values = [hashes[path] for path in paths]
+    parent = list(range(len(paths)))
+    
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    # Only files sharing one 16-bit band exactly are compared
+    band_bits = 64 // PHASH_BANDS
+    mask = (1 << band_bits) - 1
+    for band in range(PHASH_BANDS):
+        buckets = defaultdict(list)
+        for i, value in enumerate(values):
+            buckets[(value >> (band * band_bits)) & mask].append(i)
+        for members in buckets.values():
+            for x, i in enumerate(members):
+                for j in members[x + 1:]:
+                    if find(i) != find(j) and bin(values[i] ^ values[j]).count('1') <= max_distance:
+                        parent[find(i)] = find(j)
+    
+    groups = defaultdict(list)
+    for i, path in enumerate(paths):
+        groups[find(i)].append(path)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def _check_file(file_path: Path, min_resolution: int, max_kb: int,
+                cached: Optional[dict] = None) -> tuple[list[tuple[str, str]], str, Optional[dict]]:
+    """
+    Run the per-file QA checks, reusing dimensions and hashes from the cache when the file is unchanged.
+    
+    Args:
+        file_path: Path to image file
+        min_resolution: Minimum width/height in pixels
+        max_kb: Maximum file size in KB
+        cached: This file's entry from the QA cache, if any
+        
+    Returns:
+        Tuple of ((category, message) issues, file hash or "", cache entry or None)
+    """
+    try:
+        st = os.stat(file_path)
+    except OSError as e:
+        return [("file_size", f"{file_path.name}: Cannot check file size: {str(e)}")], "", None
+    
+    issues = []
+    
+    if (cached and cached.get('mtime_ns') == st.st_mtime_ns and cached.get('size') == st.st_size
+            and cached.get('hash') == FILE_HASH_NAME and 'phash' in cached):
+        entry = cached
+    else:
+        entry = None
+        try:
+            with Image.open(file_path) as img:
+                width, height = img.size
+                phash = perceptual_hash(img)
+        except Exception as e:
+            issues.append(("resolution", f"{file_path.name}: Cannot read image: {str(e)}"))
+        else:
+            entry = {'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'width': width, 'height': height,
+                     'hash': FILE_HASH_NAME, 'digest': calculate_file_hash(file_path), 'phash': phash}
+    
+    # Check resolution
+    if entry is not None:
+        res_valid, res_error = _check_dimensions(entry['width'], entry['height'], min_resolution)
+        if not res_valid:
+            issues.append(("resolution", f"{file_path.name}: {res_error}"))
+    
+    # Check file size
+    size_valid, size_error = _check_size(st.st_size, max_kb)
+    if not size_valid:
+        issues.append(("file_size", f"{file_path.name}: {size_error}"))
+    
+    # Hash for duplicate detection
+    file_hash = entry['digest'] if entry is not None else calculate_file_hash(file_path)
+    return issues, file_hash, (entry if entry is not None and entry['digest'] else None)
+
+
+def _load_qa_cache(cache_path: Path) -> dict:
+    """Read the QA sidecar cache; a missing or unreadable cache is empty"""
+    try:
+        cache = orjson.loads(cache_path.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def _save_qa_cache(cache_path: Path, cache: dict) -> None:
+    """Write the QA sidecar cache atomically"""
+    try:
+        tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+        tmp_path.write_bytes(orjson.dumps(cache))
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Could not write QA cache {cache_path}: {str(e)}")
+
+
+def _iter_image_files(root: str) -> Iterator[str]:
+    """
+    Yield paths of image files under root.
+    
+    Walks with os.scandir, whose entry types come from readdir, so nothing is stat'ed and no
+    Path objects are built for non-images.
+    """
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.rpartition('.')[2].lower() in IMAGE_EXTENSIONS and entry.is_file():
+                        yield entry.path
+        except OSError as e:
+            logger.warning(f"Cannot scan directory: {str(e)}")
+
+
 def check_directory(output_dir: str, config: dict) -> QAReport:
     """
     Perform comprehensive QA checks on output directory.
@@ -162,40 +366,45 @@ def check_directory(output_dir: str, config: dict) -> QAReport:
     max_kb = config.get('image', {}).get('max_kb', 200)
     
     # Find all image files
-    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
-    image_files = []
-    
-    for file_path in output_path.rglob('*'):
-        if file_path.is_file() and file_path.suffix.lower() in image_extensions:
-            image_files.append(file_path)
+    image_files = [Path(path) for path in _iter_image_files(output_dir)]
     
     report.total_files = len(image_files)
     logger.info(f"Found {len(image_files)} image files to check")
     
-    # Check each file
-    for file_path in image_files:
-        file_valid = True
-        
-        # Check resolution
-        res_valid, res_error = check_image_resolution(file_path, min_resolution)
-        if not res_valid:
-            report.add_issue("resolution", f"{file_path.name}: {res_error}")
-            file_valid = False
-        
-        # Check file size
-        size_valid, size_error = check_file_size(file_path, max_kb)
-        if not size_valid:
-            report.add_issue("file_size", f"{file_path.name}: {size_error}")
-            file_valid = False
-        
-        # Calculate hash for duplicate detection
-        file_hash = calculate_file_hash(file_path)
-        if file_hash:
-            report.file_hashes[str(file_path)] = file_hash
-            report.add_duplicate(file_hash, str(file_path))
+    # Unchanged files (same mtime and size) skip the decode and re-hash
+    cache_path = output_path / QA_CACHE_FILE
+    cache = _load_qa_cache(cache_path)
+    keys = [file_path.relative_to(output_path).as_posix() for file_path in image_files]
+    new_cache = {}
+    
+    # Check files concurrently; results come back in order and are merged on this thread
+    with ThreadPoolExecutor(max_workers=QA_WORKERS) as executor:
+        results = executor.map(lambda path, key: _check_file(path, min_resolution, max_kb, cache.get(key)),
+                               image_files, keys)
         
-        if file_valid:
-            report.valid_files += 1
+        for file_path, key, (issues, file_hash, entry) in zip(image_files, keys, results):
+            if entry is not None:
+                new_cache[key] = entry
+                report.perceptual_hashes[str(file_path)] = entry['phash']
+            
+            for category, message in issues:
+                report.add_issue(category, message)
+            
+            if file_hash:
+                report.file_hashes[str(file_path)] = file_hash
+                report.add_duplicate(file_hash, str(file_path))
+            
+            if not issues:
+                report.valid_files += 1
+    
+    if new_cache != cache:
+        _save_qa_cache(cache_path, new_cache)
+    
+    # Re-encodes of the same picture; groups that are byte-identical are already listed as duplicates
+    report.near_duplicates = [
+        group for group in group_near_duplicates(report.perceptual_hashes)
+        if len({report.file_hashes.get(path) for path in group}) > 1
+    ]
     
     return report
 
@@ -3,13 +3,28 @@ Image search functionality using SerpAPI
 """
 import asyncio
 import logging
-from typing import List, Optional
+from typing import Dict, List, Optional
 import aiohttp
+import orjson
+from aiolimiter import AsyncLimiter
 import os
-from urllib.parse import urlencode
+from urllib.parse import quote_plus, urlencode
+
+from .downloader import dns_resolver
+from .serp_cache import SerpCache
 
 logger = logging.getLogger(__name__)
 
+# SerpAPI retry policy: throttling and gateway errors are retried with exponential backoff, or after
+# the server's Retry-After (capped) when it sends one
+SERP_RETRIES = 3
+SERP_BACKOFF = 1.0
+SERP_MAX_RETRY_AFTER = 60.0
+SERP_RETRY_STATUSES = (429, 502, 503, 504)
+
+# Token buckets for SerpAPI requests by search.serp_qps, shared by every batch in the process
+_serp_limiters: Dict[float, AsyncLimiter] = {}
+
 
 async def image_urls(session: aiohttp.ClientSession, barcode: str, config: dict) -> List[str]:
     """
@@ -23,85 +38,165 @@ async def image_urls(session: aiohttp.ClientSession, barcode: str, config: dict)
     Returns:
         List of image URLs found for the barcode
     """
+    return await _search(session, barcode, config) or []
+
+
+def _search_url_prefix(config: dict) -> str:
+    """The SerpAPI request URL up to the query, which is all that varies between barcodes"""
+    # SerpAPI parameters for Google Images search
+    params = {
+        'engine': 'google_images',
+        'api_key': config['search']['serp_api_key'],
+        'num': config['search']['max_results'],
+        'ijn': 0,  # Page number
+        'safe': 'active',
+        'tbm': 'isch'  # Image search
+    }
+    return f"https://serpapi.com/search?{urlencode(params)}&q="
+
+
+async def _search(session: aiohttp.ClientSession, barcode: str, config: dict,
+                  url_prefix: Optional[str] = None) -> Optional[List[str]]:
+    """image_urls, but None when the search failed (as opposed to finding nothing) - failures are not cached.
+    Batches pass url_prefix (_search_url_prefix) so the constant parameters are encoded once."""
     try:
-        api_key = config['search']['serp_api_key']
         max_results = config['search']['max_results']
         query_template = config['search']['query_template']
+        if url_prefix is None:
+            url_prefix = _search_url_prefix(config)
         
         # Format the search query
-        query = query_template.format(barcode=barcode)
-        
-        # SerpAPI parameters for Google Images search
-        params = {
-            'engine': 'google_images',
-            'q': query,
-            'api_key': api_key,
-            'num': max_results,
-            'ijn': 0,  # Page number
-            'safe': 'active',
-            'tbm': 'isch'  # Image search
-        }
-        
-        url = f"https://serpapi.com/search?{urlencode(params)}"
+        query = barcode if query_template == '{barcode}' else query_template.format(barcode=barcode)
+        url = url_prefix + quote_plus(query)
         
         logger.info(f"Searching for images: {query}")
         
-        async with session.get(url, timeout=config['network']['timeout']) as response:
-            if response.status == 200:
-                data = await response.json()
-                
-                # Extract image URLs from the response
-                image_urls = []
-                if 'images_results' in data:
-                    for result in data['images_results'][:max_results]:
-                        if 'original' in result:
-                            image_urls.append(result['original'])
-                        elif 'link' in result:
-                            image_urls.append(result['link'])
-                
-                logger.info(f"Found {len(image_urls)} images for barcode {barcode}")
-                return image_urls
-            else:
-                logger.error(f"SerpAPI request failed with status {response.status} for barcode {barcode}")
-                return []
-                
+        limiter = _serp_limiter(config)
+        for attempt in range(SERP_RETRIES + 1):
+            # The token bucket keeps the request rate under SerpAPI's limit; a 429 costs a round-trip
+            async with limiter:
+                async with session.get(url, timeout=config['network']['timeout']) as response:
+                    if response.status == 200:
+                        data = orjson.loads(await response.read())
+                        
+                        # Extract image URLs from the response (full-size original, else the page link)
+                        try:
+                            results = data['images_results'][:max_results]
+                        except KeyError:
+                            results = ()
+                        image_urls = [result['original'] if 'original' in result else result['link']
+                                      for result in results if 'original' in result or 'link' in result]
+                        
+                        logger.info(f"Found {len(image_urls)} images for barcode {barcode}")
+                        return image_urls
+                    
+                    status = response.status
+                    if status not in SERP_RETRY_STATUSES or attempt == SERP_RETRIES:
+                        logger.error(f"SerpAPI request failed with status {status} for barcode {barcode}")
+                        return None
+                    delay = _retry_delay(response.headers.get('Retry-After'), attempt)
+            
+            # Wait with the connection released
+            logger.warning(f"SerpAPI returned {status} for barcode {barcode}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        
     except asyncio.TimeoutError:
         logger.error(f"Timeout searching for images for barcode {barcode}")
-        return []
+        return None
     except Exception as e:
         logger.error(f"Error searching for images for barcode {barcode}: {str(e)}")
-        return []
+        return None
 
 
-async def search_batch(barcodes: List[str], config: dict) -> dict:
+def _serp_limiter(config: dict) -> AsyncLimiter:
+    """The process-wide token bucket for search.serp_qps requests per second"""
+    qps = config['search'].get('serp_qps', 5)
+    limiter = _serp_limiters.get(qps)
+    if limiter is None:
+        limiter = _serp_limiters[qps] = AsyncLimiter(qps, time_period=1)
+    return limiter
+
+
+def _retry_delay(retry_after: Optional[str], attempt: int) -> float:
+    """Seconds to wait before retry number attempt + 1: Retry-After when given in seconds, else backoff"""
+    try:
+        return min(max(float(retry_after), 0.0), SERP_MAX_RETRY_AFTER)
+    except (TypeError, ValueError):
+        return SERP_BACKOFF * (2 ** attempt)
+
+
+def open_session(config: dict) -> aiohttp.ClientSession:
+    """
+    Keep-alive session for SerpAPI. Open it once and pass it to every search_batch call, so the
+    TLS connection to serpapi.com is reused across batches instead of re-established per batch.
+    
+    Args:
+        config: Configuration dictionary
+    """
+    connector = aiohttp.TCPConnector(
+        limit=config['network']['concurrency'], resolver=dns_resolver(config), ttl_dns_cache=600,
+        keepalive_timeout=60
+    )
+    timeout = aiohttp.ClientTimeout(total=config['network']['timeout'])
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def search_batch(barcodes: List[str], config: dict, session: Optional[aiohttp.ClientSession] = None,
+                       cache: Optional[SerpCache] = None) -> dict:
     """
     Search for images for multiple barcodes concurrently.
     
     Args:
         barcodes: List of barcodes to search for
         config: Configuration dictionary
+        session: Optional open session to reuse (see open_session); a temporary one otherwise
+        cache: Optional SerpAPI result cache (serp_cache.open_cache); only its misses are searched
         
     Returns:
         Dictionary mapping barcode to list of image URLs
     """
-    connector = aiohttp.TCPConnector(limit=config['network']['concurrency'])
-    timeout = aiohttp.ClientTimeout(total=config['network']['timeout'])
-    
-    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-        tasks = []
-        for barcode in barcodes:
-            task = image_urls(session, barcode, config)
-            tasks.append(task)
-        
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Build result dictionary
-        barcode_to_urls = {}
-        for barcode, result in zip(barcodes, results):
-            if isinstance(result, Exception):
-                logger.error(f"Exception for barcode {barcode}: {result}")
-                barcode_to_urls[barcode] = []
-            else:
-                barcode_to_urls[barcode] = result
-        
+    # Result dictionary, in input order; each distinct barcode is searched once
+    barcode_to_urls = dict.fromkeys(barcodes)
+    if cache is not None:
+        barcode_to_urls.update(cache.get_many(barcode_to_urls))
+    pending = [barcode for barcode, urls in barcode_to_urls.items() if urls is None]
+    if not pending:
         return barcode_to_urls
+    
+    if session is None or session.closed:
+        async with open_session(config) as session:
+            fetched = await _search_all(session, pending, config)
+    else:
+        fetched = await _search_all(session, pending, config)
+    
+    if cache is not None:
+        cache.put_many({barcode: urls for barcode, urls in fetched.items() if urls is not None})
+    for barcode, urls in fetched.items():
+        barcode_to_urls[barcode] = urls if urls is not None else []
+    
+    return barcode_to_urls
+
+
+async def _search_all(session: aiohttp.ClientSession, barcodes: List[str], config: dict) -> dict:
+    """_search for each barcode, run by a fixed pool of network.concurrency workers so memory and
+    in-flight requests stay bounded however many barcodes are passed"""
+    fetched = {}
+    pending = iter(barcodes)
+    try:
+        url_prefix = _search_url_prefix(config)
+    except KeyError as e:
+        logger.error(f"Error searching for images: missing search setting {str(e)}")
+        return dict.fromkeys(barcodes)
+    
+    async def worker() -> None:
+        for barcode in pending:
+            try:
+                fetched[barcode] = await _search(session, barcode, config, url_prefix)
+            except Exception as e:
+                logger.error(f"Exception for barcode {barcode}: {e}")
+                fetched[barcode] = None
+    
+    workers = min(config['network']['concurrency'], len(barcodes))
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    
+    return fetched
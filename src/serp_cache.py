@@ -0,0 +1,137 @@
+"""
+Cache of SerpAPI image results per barcode, so re-runs don't pay for the same searches again.
+
+This is the src pipeline's own cache. The UI's ImageDatabase keeps a serp_cache table in products.db,
+keyed by free-text query and holding full result dicts. This pipeline never opens products.db, and it
+only keeps image URLs per barcode.
+"""
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Default location of the on-disk cache (next to the resume file)
+SERP_CACHE_FILE = "serp_cache.db"
+
+# Cached results are reused for this long (seconds) - a product's images rarely change within a week
+SERP_CACHE_TTL = 7 * 86400
+
+# Barcodes kept in memory for the current run (LRU)
+L1_MAXSIZE = 10000
+
+# Barcodes looked up per SELECT, well under SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+
+
+class SerpCache:
+    """
+    Two tiers in front of SerpAPI: an in-process LRU for the current run and a SQLite table that
+    outlives it. The table is in WAL mode, so several pipeline processes can share one file.
+    Cache failures are logged and treated as misses - they never stop a search.
+    """
+
+    def __init__(self, path: str = SERP_CACHE_FILE, ttl: float = SERP_CACHE_TTL,
+                 l1_maxsize: int = L1_MAXSIZE):
+        self.ttl = ttl
+        self._l1: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._l1_maxsize = l1_maxsize
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS serp (
+                barcode TEXT PRIMARY KEY,
+                urls TEXT NOT NULL, -- JSON list of image URLs
+                fetched_at INTEGER NOT NULL -- epoch seconds
+            )
+        ''')
+        self.conn.commit()
+
+    def _remember(self, barcode: str, urls: List[str]) -> None:
+        self._l1[barcode] = urls
+        self._l1.move_to_end(barcode)
+        while len(self._l1) > self._l1_maxsize:
+            self._l1.popitem(last=False)
+
+    def get_many(self, barcodes: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        Unexpired cached URLs for whichever of the barcodes have them.
+
+        Args:
+            barcodes: Barcodes to look up
+
+        Returns:
+            Dictionary mapping each cached barcode to its URLs (misses are left out)
+        """
+        found = {}
+        missing = []
+        for barcode in barcodes:
+            urls = self._l1.get(barcode)
+            if urls is None:
+                missing.append(barcode)
+            else:
+                self._l1.move_to_end(barcode)
+                found[barcode] = urls
+
+        cutoff = int(time.time() - self.ttl)
+        try:
+            for i in range(0, len(missing), LOOKUP_CHUNK):
+                chunk = missing[i:i + LOOKUP_CHUNK]
+                rows = self.conn.execute(
+                    f"SELECT barcode, urls FROM serp WHERE fetched_at > ? AND barcode IN ({','.join('?' * len(chunk))})",
+                    (cutoff, *chunk)
+                ).fetchall()
+                for barcode, urls in rows:
+                    found[barcode] = orjson.loads(urls)
+                    self._remember(barcode, found[barcode])
+        except (sqlite3.Error, orjson.JSONDecodeError) as e:
+            logger.warning(f"SerpAPI cache lookup failed: {str(e)}")
+
+        return found
+
+    def put_many(self, barcode_to_urls: Dict[str, List[str]]) -> None:
+        """
+        Remember fresh search results, in one commit.
+
+        Args:
+            barcode_to_urls: Dictionary mapping barcode to the URLs SerpAPI returned (empty lists included)
+        """
+        if not barcode_to_urls:
+            return
+        for barcode, urls in barcode_to_urls.items():
+            self._remember(barcode, urls)
+        now = int(time.time())
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO serp (barcode, urls, fetched_at) VALUES (?, ?, ?)',
+                    [(barcode, orjson.dumps(urls).decode(), now) for barcode, urls in barcode_to_urls.items()]
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"SerpAPI cache write failed: {str(e)}")
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def open_cache(config: dict) -> Optional[SerpCache]:
+    """
+    The SerpAPI cache configured under search (use_serp_cache, serp_cache_path, serp_cache_ttl),
+    or None when it is disabled or cannot be opened.
+
+    Args:
+        config: Configuration dictionary
+    """
+    search = config.get('search', {})
+    if not search.get('use_serp_cache', True):
+        return None
+    try:
+        return SerpCache(search.get('serp_cache_path', SERP_CACHE_FILE), search.get('serp_cache_ttl', SERP_CACHE_TTL))
+    except sqlite3.Error as e:
+        logger.warning(f"SerpAPI cache unavailable, searching without it: {str(e)}")
+        return None
@@ -3,11 +3,29 @@ Storage utilities for organizing output files in hierarchical structure
 """
 import os
 import logging
+import stat
+from collections import deque
+from itertools import islice
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Iterable, List, Optional, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
+# Characters not allowed in output filenames, mapped to '_'
+_INVALID_FILENAME_CHARS = str.maketrans({char: '_' for char in '<>:"/\\|?*'})
+
+# Flags save_image opens output files with (O_BINARY only exists, and matters, on Windows)
+_OUTPUT_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+
+# Buffers handed to one os.writev call (IOV_MAX on Linux and macOS)
+WRITEV_MAX_BUFFERS = 1024
+
+# Files list_output_files picks up
+OUTPUT_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Directories this process has created or found present (see ensure_directory)
+_ensured_dirs: set[str] = set()
+
 
 def get_output_path(sku: str, base_dir: str = "output") -> Path:
     """
@@ -21,28 +39,28 @@ def get_output_path(sku: str, base_dir: str = "output") -> Path:
     Returns:
         Path object for the output file
     """
-    # Clean SKU for filesystem compatibility
-    clean_sku = clean_filename(sku)
-    
-    # Create 3-tier hierarchy based on SKU characters
-    if len(clean_sku) >= 3:
-        tier1 = clean_sku[0]
-        tier2 = clean_sku[1]
-        tier3 = clean_sku[2]
-    elif len(clean_sku) == 2:
-        tier1 = clean_sku[0]
-        tier2 = clean_sku[1]
-        tier3 = "0"
-    elif len(clean_sku) == 1:
-        tier1 = clean_sku[0]
-        tier2 = "0"
-        tier3 = "0"
-    else:
-        tier1 = tier2 = tier3 = "0"
+    return Path(_output_path_str(clean_filename(sku), base_dir))
+
+
+def paths_for_skus(skus: Iterable[str], base_dir: str = "output") -> List[Path]:
+    """
+    get_output_path for many SKUs at once.
     
-    # Build path
-    output_path = Path(base_dir) / tier1 / tier2 / tier3 / f"{clean_sku}.jpg"
-    return output_path
+    Args:
+        skus: Product SKUs/barcodes
+        base_dir: Base output directory
+        
+    Returns:
+        Output paths, in the order of skus
+    """
+    return [Path(_output_path_str(clean_filename(sku), base_dir)) for sku in skus]
+
+
+def _output_path_str(clean_sku: str, base_dir: str) -> str:
+    """Output path of a cleaned SKU as one string; tiers are its first three characters, '0' when shorter"""
+    # 3-tier hierarchy based on SKU characters
+    tiers = (clean_sku[:3] + "00")[:3]
+    return f"{base_dir}/{tiers[0]}/{tiers[1]}/{tiers[2]}/{clean_sku}.jpg"
 
 
 def ensure_directory(path: Path) -> bool:
@@ -55,6 +73,11 @@ def ensure_directory(path: Path) -> bool:
     Returns:
         True if directory exists or was created successfully
     """
+    # Directories already ensured by this process need no stat/mkdir
+    key = str(path)
+    if key in _ensured_dirs:
+        return True
+    
     try:
         if path.is_file():
             directory = path.parent
@@ -62,6 +85,7 @@ def ensure_directory(path: Path) -> bool:
             directory = path
         
         directory.mkdir(parents=True, exist_ok=True)
+        _ensured_dirs.add(str(directory))
         return True
         
     except Exception as e:
@@ -79,30 +103,21 @@ def clean_filename(filename: str) -> str:
     Returns:
         Cleaned filename safe for filesystem use
     """
-    # Remove or replace problematic characters
-    invalid_chars = '<>:"/\\|?*'
-    cleaned = filename
-    
-    for char in invalid_chars:
-        cleaned = cleaned.replace(char, '_')
-    
-    # Remove leading/trailing whitespace and dots
-    cleaned = cleaned.strip(' .')
+    # Replace problematic characters (one pass), then strip leading/trailing whitespace and dots
+    cleaned = filename.translate(_INVALID_FILENAME_CHARS).strip(' .')
     
     # Ensure not empty
-    if not cleaned:
-        cleaned = "unknown"
-    
-    return cleaned
+    return cleaned or "unknown"
 
 
-def save_image(image_bytes: bytes, output_path: Path) -> bool:
+def save_image(image_bytes: Union[bytes, Iterable[bytes]], output_path: Path, durable: bool = False) -> bool:
     """
     Save image bytes to specified path.
     
     Args:
-        image_bytes: Image data to save
+        image_bytes: Image data to save, as one buffer or an iterable of chunks (e.g. a streamed body)
         output_path: Path where to save the image
+        durable: fsync the file before returning
         
     Returns:
         True if saved successfully
@@ -112,11 +127,19 @@ def save_image(image_bytes: bytes, output_path: Path) -> bool:
         if not ensure_directory(output_path.parent):
             return False
         
-        # Write image bytes
-        with open(output_path, 'wb') as f:
-            f.write(image_bytes)
+        # Raw descriptor writes: no file object or write buffer in between, and chunks are
+        # handed to the kernel together instead of being copied into one buffer first
+        if isinstance(image_bytes, (bytes, bytearray, memoryview)):
+            image_bytes = (image_bytes,)
+        fd = _open_output(output_path)
+        try:
+            size = _write_all(fd, image_bytes)
+            if durable:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
         
-        logger.info(f"Saved image: {output_path} ({len(image_bytes)} bytes)")
+        logger.info(f"Saved image: {output_path} ({size} bytes)")
         return True
         
     except Exception as e:
@@ -124,6 +147,41 @@ def save_image(image_bytes: bytes, output_path: Path) -> bool:
         return False
 
 
+def _open_output(output_path: Path) -> int:
+    """A descriptor for writing output_path from scratch, re-creating its directory if it was removed
+    after being ensured"""
+    try:
+        return os.open(output_path, _OUTPUT_FLAGS, 0o666)
+    except FileNotFoundError:
+        _ensured_dirs.discard(str(output_path.parent))
+        if not ensure_directory(output_path.parent):
+            raise
+        return os.open(output_path, _OUTPUT_FLAGS, 0o666)
+
+
+def _write_all(fd: int, chunks: Iterable[bytes]) -> int:
+    """Write the chunks to fd in order - one os.write for a single buffer, os.writev (one syscall per
+    WRITEV_MAX_BUFFERS chunks) for several - resuming after short writes. Returns the bytes written."""
+    pending = deque(view for view in (memoryview(chunk).cast('B') for chunk in chunks) if view.nbytes)
+    if len(pending) > 1 and not hasattr(os, 'writev'):
+        pending = deque([memoryview(b''.join(pending))])
+    
+    size = 0
+    while pending:
+        if len(pending) == 1:
+            written = os.write(fd, pending[0])
+        else:
+            written = os.writev(fd, list(islice(pending, WRITEV_MAX_BUFFERS)))
+        size += written
+        while written:
+            if written >= pending[0].nbytes:
+                written -= pending.popleft().nbytes
+            else:
+                pending[0] = pending[0][written:]
+                written = 0
+    return size
+
+
 def file_exists(path: Path) -> bool:
     """
     Check if file exists and is not empty.
@@ -134,10 +192,12 @@ def file_exists(path: Path) -> bool:
     Returns:
         True if file exists and has content
     """
+    # One stat instead of exists + is_file + stat
     try:
-        return path.exists() and path.is_file() and path.stat().st_size > 0
-    except Exception:
+        st = os.stat(path)
+    except (OSError, ValueError):
         return False
+    return stat.S_ISREG(st.st_mode) and st.st_size > 0
 
 
 def get_file_size(path: Path) -> Optional[int]:
@@ -151,11 +211,10 @@ def get_file_size(path: Path) -> Optional[int]:
         File size in bytes or None if error
     """
     try:
-        if path.exists() and path.is_file():
-            return path.stat().st_size
-        return None
-    except Exception:
+        st = os.stat(path)
+    except (OSError, ValueError):
         return None
+    return st.st_size if stat.S_ISREG(st.st_mode) else None
 
 
 def list_output_files(base_dir: str = "output") -> list[Path]:
@@ -169,14 +228,19 @@ def list_output_files(base_dir: str = "output") -> list[Path]:
         List of Path objects for all image files found
     """
     try:
-        base_path = Path(base_dir)
-        if not base_path.exists():
+        if not os.path.isdir(base_dir):
             return []
         
-        # Find all .jpg files recursively
-        image_files = list(base_path.rglob("*.jpg"))
-        image_files.extend(base_path.rglob("*.jpeg"))
-        image_files.extend(base_path.rglob("*.png"))
+        # One scandir walk for all extensions; entry types come from readdir, so nothing is stat'ed
+        image_files = []
+        stack = [base_dir]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith(OUTPUT_EXTENSIONS):
+                        image_files.append(Path(entry.path))
         
         return sorted(image_files)
         
@@ -197,9 +261,12 @@ def create_resume_file(processed_skus: set[str], resume_file: str = "processed_s
         True if resume file created successfully
     """
     try:
-        with open(resume_file, 'w') as f:
-            for sku in sorted(processed_skus):
-                f.write(f"{sku}\n")
+        # One write of the whole list to a temp file, swapped in atomically - an interrupted
+        # save leaves the previous resume file intact
+        tmp_file = f"{resume_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            f.write("".join(f"{sku}\n" for sku in sorted(processed_skus)))
+        os.replace(tmp_file, resume_file)
         
         logger.info(f"Created resume file: {resume_file} with {len(processed_skus)} SKUs")
         return True
@@ -223,12 +290,9 @@ def load_resume_file(resume_file: str = "processed_skus.txt") -> set[str]:
         if not os.path.exists(resume_file):
             return set()
         
-        processed_skus = set()
         with open(resume_file, 'r') as f:
-            for line in f:
-                sku = line.strip()
-                if sku:
-                    processed_skus.add(sku)
+            processed_skus = {line.strip() for line in f.read().splitlines()}
+        processed_skus.discard('')
         
         logger.info(f"Loaded {len(processed_skus)} processed SKUs from resume file")
         return processed_skus
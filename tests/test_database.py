@@ -0,0 +1,76 @@
+"""
+Tests for the product database
+"""
+import pytest
+import pandas as pd
+from database import ImageDatabase
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = ImageDatabase(str(tmp_path / "products.db"))
+    yield database
+    database.close()
+
+
+def import_skus(db, tmp_path, batch_id: str, skus: list) -> None:
+    """Import an Excel sheet holding the given SKUs as one batch"""
+    excel_path = tmp_path / f"{batch_id}.xlsx"
+    pd.DataFrame({
+        'Variant SKU / Article Code': skus,
+        'Title': [f"Product {sku}" for sku in skus],
+        'Brand': ['Brand'] * len(skus),
+    }).to_excel(excel_path, index=False)
+    ok, _, _ = db.import_excel(str(excel_path), batch_id)
+    assert ok
+
+
+def batch_counts(db, batch_id: str) -> tuple:
+    row = db.conn.execute(
+        'SELECT processed, approved, pending, declined FROM batches WHERE id = ?', (batch_id,)
+    ).fetchone()
+    return tuple(row)
+
+
+def test_batch_counters_follow_status_changes_and_moves(db, tmp_path):
+    """Counters kept by the triggers match a full recount after approvals, declines and re-imports"""
+    import_skus(db, tmp_path, 'b1', ['A1', 'A2', 'A3'])
+    assert batch_counts(db, 'b1') == (0, 0, 0, 0)
+
+    db.conn.execute("UPDATE products SET image_status = 'pending'")
+    db.conn.commit()
+    assert db.approve_image('A1')
+    assert db.decline_image('A2')
+    assert batch_counts(db, 'b1') == (3, 1, 1, 1)
+
+    # A1 (approved) moves to b2 along with a new product
+    import_skus(db, tmp_path, 'b2', ['A1', 'A4'])
+    assert batch_counts(db, 'b1') == (2, 0, 1, 1)
+    assert batch_counts(db, 'b2') == (1, 1, 0, 0)
+
+    # Status changes after the move count against the new batch
+    assert db.decline_image('A1')
+    assert batch_counts(db, 'b2') == (1, 0, 0, 1)
+
+    # The incremental counters agree with the full-scan repair path
+    for batch_id in ('b1', 'b2'):
+        counted = batch_counts(db, batch_id)
+        db.recompute_batch_stats(batch_id)
+        assert batch_counts(db, batch_id) == counted
+
+
+def test_local_approved_fuzzy_match_beyond_first_candidates(db, tmp_path):
+    """A similar title is found however many other approved images the brand has"""
+    image = tmp_path / "match.jpg"
+    image.write_bytes(b'jpg')
+    rows = [(f"S{i}", 'Brand', f"Unrelated item {i}", str(tmp_path / f"missing_{i}.jpg")) for i in range(300)]
+    rows.append(('MATCH', 'Brand', 'Apple Juice 1L Carton', str(image)))
+    db.conn.executemany('''
+        INSERT INTO products (Variant_SKU, Brand, Title, downloaded_image_path, image_status)
+        VALUES (?, ?, ?, ?, 'approved')
+    ''', rows)
+    db.conn.commit()
+
+    assert db.check_local_approved('Brand', 'Apple Juice Carton 2L', None) == str(image)
+    assert db.check_local_approved('Brand', 'apple juice 1l carton', None) == str(image)
+    assert db.check_local_approved('Brand', 'Tomato Sauce', None) is None
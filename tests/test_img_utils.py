@@ -4,7 +4,7 @@ Tests for image processing utilities
 import pytest
 import io
 from PIL import Image
-from src.img_utils import optimise, get_image_info, calculate_sha1, is_valid_image, resize_and_crop
+from src.img_utils import optimise, get_image_info, calculate_sha1, is_valid_image, resize_and_crop, validate_and_optimise, needs_reencode
 
 
 def create_test_image(width: int, height: int, color: str = 'red') -> bytes:
@@ -45,6 +45,24 @@ def test_optimise_square_crop():
         assert img.size == (500, 500)
 
 
+def test_optimise_size_budget():
+    """Test that JPEG quality is lowered until the output fits max_kb"""
+    noisy = Image.effect_noise((800, 800), 16).convert('RGB')
+    output = io.BytesIO()
+    noisy.save(output, format='JPEG', quality=95)
+    
+    result = optimise(output.getvalue(), size=600, max_kb=80)
+    
+    assert result is not None
+    assert len(result) <= 80 * 1024
+    
+    # Unreachable budget still returns a best-effort image
+    result = optimise(output.getvalue(), size=600, max_kb=1)
+    assert result is not None
+    with Image.open(io.BytesIO(result)) as img:
+        assert img.size == (600, 600)
+
+
 def test_get_image_info():
     """Test image info extraction"""
     test_image = create_test_image(800, 600)
@@ -86,6 +104,57 @@ def test_is_valid_image():
     assert not is_valid_image(b"not an image")
 
 
+def test_validate_and_optimise():
+    """Test single-decode validation + optimization"""
+    # Larger than one 64KB feed chunk
+    noisy = Image.effect_noise((1200, 900), 64).convert('RGB')
+    output = io.BytesIO()
+    noisy.save(output, format='JPEG', quality=95)
+    test_image = output.getvalue()
+    assert len(test_image) > 65536
+    
+    valid, result = validate_and_optimise(test_image, size=400, max_kb=200, min_size=150)
+    assert valid
+    with Image.open(io.BytesIO(result)) as img:
+        assert img.size == (400, 400)
+    
+    # Too small image
+    assert validate_and_optimise(create_test_image(50, 50), size=400, min_size=100) == (False, None)
+    
+    # Invalid data
+    assert validate_and_optimise(b"not an image", size=400) == (False, None)
+
+
+def test_needs_reencode():
+    """Test the header-only check for JPEGs that are already finished outputs"""
+    ready = create_test_image(400, 400)
+    assert not needs_reencode(ready, size=400, max_kb=200)
+    
+    # Kept verbatim by validate_and_optimise
+    assert validate_and_optimise(ready, size=400, max_kb=200, min_size=150) == (True, ready)
+    
+    # Wrong dimensions, over the size budget, truncated, or not a JPEG
+    assert needs_reencode(create_test_image(400, 300), size=400)
+    assert needs_reencode(ready, size=400, max_kb=len(ready) // 1024 - 1)
+    assert needs_reencode(ready[:-200], size=400)
+    
+    png = io.BytesIO()
+    Image.new('RGB', (400, 400), 'red').save(png, format='PNG')
+    assert needs_reencode(png.getvalue(), size=400)
+    
+    # Grayscale (single component) still goes through the RGB conversion
+    gray = io.BytesIO()
+    Image.new('L', (400, 400), 128).save(gray, format='JPEG')
+    assert needs_reencode(gray.getvalue(), size=400)
+    
+    # EXIF may carry an orientation
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    rotated = io.BytesIO()
+    Image.new('RGB', (400, 400), 'red').save(rotated, format='JPEG', exif=exif)
+    assert needs_reencode(rotated.getvalue(), size=400)
+
+
 def test_resize_and_crop():
     """Test resize and crop functionality"""
     test_image = create_test_image(1000, 800)
@@ -0,0 +1,60 @@
+"""
+Tests for the SerpAPI result cache
+"""
+import pytest
+from src.serp_cache import SerpCache
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "serp_cache.db")
+
+
+def test_put_many_then_get_many_returns_only_cached_barcodes(cache_path):
+    """Results, empty lists included, come back from a fresh instance; misses are left out"""
+    cache = SerpCache(cache_path)
+    cache.put_many({'111': ['http://a/1.jpg', 'http://a/2.jpg'], '222': []})
+    cache.close()
+
+    cache = SerpCache(cache_path)
+    assert cache.get_many(['111', '222', '333']) == {'111': ['http://a/1.jpg', 'http://a/2.jpg'], '222': []}
+    cache.close()
+
+
+def test_expired_entries_are_misses(cache_path):
+    """Rows older than the TTL are not returned from the table"""
+    cache = SerpCache(cache_path)
+    cache.put_many({'111': ['http://a/1.jpg']})
+    cache.close()
+
+    cache = SerpCache(cache_path, ttl=-1)
+    assert cache.get_many(['111']) == {}
+    cache.close()
+
+
+def test_l1_answers_without_the_table_and_evicts_least_recent(cache_path):
+    """The in-memory tier serves repeat lookups and keeps only the most recently used barcodes"""
+    cache = SerpCache(cache_path, l1_maxsize=2)
+    cache.put_many({'111': ['http://a/1.jpg'], '222': ['http://a/2.jpg']})
+    cache.get_many(['111'])  # 111 is now the most recent
+    cache.put_many({'333': ['http://a/3.jpg']})
+    assert list(cache._l1) == ['111', '333']
+
+    # With the table emptied, only L1 entries are still answered
+    cache.conn.execute('DELETE FROM serp')
+    cache.conn.commit()
+    assert cache.get_many(['111', '222', '333']) == {'111': ['http://a/1.jpg'], '333': ['http://a/3.jpg']}
+    cache.close()
+
+
+def test_lookups_span_several_chunks(cache_path, monkeypatch):
+    """Barcode lists longer than one SELECT's worth are looked up in full"""
+    monkeypatch.setattr('src.serp_cache.LOOKUP_CHUNK', 3)
+    cache = SerpCache(cache_path)
+    entries = {str(i): [f"http://a/{i}.jpg"] for i in range(10)}
+    cache.put_many(entries)
+    cache.close()
+
+    cache = SerpCache(cache_path)
+    assert cache.get_many(list(entries)) == entries
+    cache.close()
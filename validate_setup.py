@@ -7,11 +7,42 @@ Checks if the system is properly configured after GitHub clone
 import os
 import sys
 import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+# find_spec results by module name, so checking a module again is free
+_module_specs = {}
+
+@lru_cache(maxsize=None)
+def _list_directory(dirpath):
+    """{name: is_dir} for a directory's entries, read with one scandir (empty if it is missing)"""
+    try:
+        with os.scandir(dirpath) as entries:
+            return {entry.name: entry.is_dir() for entry in entries}
+    except OSError:
+        return {}
+
+def _lookup(path):
+    """None if path is missing, else whether it is a directory - from its parent's cached listing"""
+    parent, name = os.path.split(os.path.normpath(path))
+    return _list_directory(parent or ".").get(name)
+
+def _find_spec(module_name):
+    try:
+        return importlib.util.find_spec(module_name)
+    except ImportError as e:
+        return e
+
+def prefetch_module_specs(module_names):
+    """Look up the module specs in parallel - each find_spec walks sys.path"""
+    missing = [name for name in module_names if name not in _module_specs]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        _module_specs.update(zip(missing, executor.map(_find_spec, missing)))
+
 def check_file_exists(filepath, description):
     """Check if a file exists"""
-    if os.path.exists(filepath):
+    if _lookup(filepath) is not None:
         print(f"   ✅ {description}: {filepath}")
         return True
     else:
@@ -20,7 +51,7 @@ def check_file_exists(filepath, description):
 
 def check_directory_exists(dirpath, description):
     """Check if a directory exists"""
-    if os.path.exists(dirpath) and os.path.isdir(dirpath):
+    if _lookup(dirpath):
         print(f"   ✅ {description}: {dirpath}")
         return True
     else:
@@ -29,17 +60,18 @@ def check_directory_exists(dirpath, description):
 
 def check_python_module(module_name):
     """Check if a Python module can be imported"""
-    try:
-        spec = importlib.util.find_spec(module_name)
-        if spec is not None:
-            print(f"   ✅ Python module: {module_name}")
-            return True
-        else:
-            print(f"   ❌ Python module: {module_name} - NOT FOUND")
-            return False
-    except ImportError:
+    if module_name not in _module_specs:
+        _module_specs[module_name] = _find_spec(module_name)
+    spec = _module_specs[module_name]
+    if isinstance(spec, ImportError):
         print(f"   ❌ Python module: {module_name} - IMPORT ERROR")
         return False
+    elif spec is not None:
+        print(f"   ✅ Python module: {module_name}")
+        return True
+    else:
+        print(f"   ❌ Python module: {module_name} - NOT FOUND")
+        return False
 
 def check_env_variable(var_name):
     """Check if environment variable is set"""
@@ -127,8 +159,19 @@ def main():
         "yaml",
         "PIL",
         "aiohttp",
+        "aiodns",
+        "orjson",
+        "httpx",
+        "aiolimiter",
+        "cachetools",
         "sqlite3"
     ]
+    ai_modules = [
+        ("torch", "PyTorch for CLIP"),
+        ("clip", "OpenAI CLIP model"),
+        ("easyocr", "OCR text extraction")
+    ]
+    prefetch_module_specs(required_modules + [module for module, _ in ai_modules])
     
     for module in required_modules:
         if not check_python_module(module):
@@ -138,12 +181,6 @@ def main():
     
     # Check optional AI dependencies
     print("🤖 CHECKING AI DEPENDENCIES:")
-    ai_modules = [
-        ("torch", "PyTorch for CLIP"),
-        ("clip", "OpenAI CLIP model"),
-        ("easyocr", "OCR text extraction")
-    ]
-    
     ai_available = True
     for module, description in ai_modules:
         if not check_python_module(module):
@@ -157,7 +194,7 @@ def main():
     
     # Check database
     print("💾 CHECKING DATABASE:")
-    if os.path.exists("data/products.db"):
+    if _lookup("data/products.db") is not None:
         try:
             import sqlite3
             conn = sqlite3.connect("data/products.db")